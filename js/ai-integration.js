@@ -7,6 +7,10 @@ class OpenSourceAIIntegration {
         this.currentEngine = null;
         this.isLocalEngineAvailable = false;
         
+        // 增量请求的会话：服务器保存着法序列，之后只发送新增的着法
+        this.sessionId = null;
+        this.sessionMoves = [];
+        
         // 异步检查可用引擎
         this.checkAvailableEngines().catch(console.error);
     }
@@ -116,23 +120,15 @@ class OpenSourceAIIntegration {
             const difficulty = this.getDifficultySettings();
             console.log('请求KataGo分析，SGF数据:', sgfData, '难度设置:', difficulty);
             
-            const response = await fetch('/api/katago/analyze', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    sgf: sgfData,
-                    moves: this.getMoveSequence(gameState),
-                    komi: 6.5,
-                    rules: 'chinese',
-                    analyzeDepth: difficulty.analyzeDepth,
-                    maxVisits: difficulty.maxVisits,
-                    playoutDoublingAdvantage: difficulty.playoutDoublingAdvantage,
-                    boardSize: gameState.boardSize,
-                    includePolicy: difficulty.includePolicy,
-                    includeOwnership: difficulty.includeOwnership
-                })
+            const response = await this.postSessionRequest('/api/katago/analyze', gameState, {
+                komi: 6.5,
+                rules: 'chinese',
+                analyzeDepth: difficulty.analyzeDepth,
+                maxVisits: difficulty.maxVisits,
+                playoutDoublingAdvantage: difficulty.playoutDoublingAdvantage,
+                boardSize: gameState.boardSize,
+                includePolicy: difficulty.includePolicy,
+                includeOwnership: difficulty.includeOwnership
             });
 
             console.log('KataGo分析响应状态:', response.status);
@@ -202,6 +198,53 @@ class OpenSourceAIIntegration {
         return sgf;
     }
 
+    encodeMoves(moves, boardSize) {
+        // 紧凑编码：每手一个小端uint16点序号 y*size+x，整段base64
+        const bytes = new Uint8Array(moves.length * 2);
+        const view = new DataView(bytes.buffer);
+        moves.forEach((move, i) => view.setUint16(i * 2, move.y * boardSize + move.x, true));
+        let binary = '';
+        bytes.forEach(byte => { binary += String.fromCharCode(byte); });
+        return btoa(binary);
+    }
+
+    async postSessionRequest(url, gameState, params) {
+        // 增量请求：只发送与上次成功请求的公共前缀之后的着法（悔棋时前缀变短）
+        // 服务器会话已过期（409）时重新发送完整着法
+        if (!this.sessionId) {
+            this.sessionId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : Math.random().toString(36).slice(2);
+        }
+        const moves = this.getMoveSequence(gameState);
+        const send = async (sent) => {
+            let base = 0;
+            while (base < sent.length && base < moves.length &&
+                   sent[base].x === moves[base].x && sent[base].y === moves[base].y) {
+                base++;
+            }
+            return fetch(url, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    ...params,
+                    session: this.sessionId,
+                    baseMoves: base,
+                    movesPacked: this.encodeMoves(moves.slice(base), gameState.boardSize)
+                })
+            });
+        };
+
+        let response = await send(this.sessionMoves);
+        if (response.status === 409) {
+            console.log('增量请求会话已失效，重新发送完整着法');
+            response = await send([]);
+        }
+        // 失败时不确定服务器保存了什么，下次发送完整着法
+        this.sessionMoves = response.ok ? moves : [];
+        return response;
+    }
+
     getMoveSequence(gameState) {
         // 从游戏历史中提取着法序列
         return gameState.moveHistory
@@ -388,8 +431,9 @@ class OpenSourceAIIntegration {
         }
     }
 
-    async analyzePosition(gameState) {
+    async analyzePosition(gameState, onUpdate = null) {
         // 分析当前局面，返回胜率和目数评估
+        // 提供onUpdate时使用流式分析，搜索过程中不断回调中间结果
         console.log('开始局势分析...');
         console.log('游戏状态:', {
             currentAIEngine: gameState.currentAIEngine,
@@ -406,7 +450,9 @@ class OpenSourceAIIntegration {
         if (katagoAvailable) {
             console.log('KataGo可用，使用KataGo分析...');
             try {
-                const katagoResult = await this.getKataGoAnalysis(gameState);
+                const katagoResult = onUpdate ?
+                    await this.streamKataGoAnalysis(gameState, onUpdate) :
+                    await this.getKataGoAnalysis(gameState);
                 if (katagoResult) {
                     console.log('KataGo分析成功');
                     return katagoResult;
@@ -422,28 +468,103 @@ class OpenSourceAIIntegration {
         return this.getLocalAnalysis(gameState);
     }
 
+    getAnalysisRequestBody(gameState) {
+        // 局势分析请求体（普通分析和流式分析共用）
+        const difficulty = this.getDifficultySettings();
+        return JSON.stringify({
+            sgf: this.convertToSGF(gameState),
+            moves: this.getMoveSequence(gameState),
+            komi: 6.5,
+            rules: 'chinese',
+            analyzeDepth: difficulty.analyzeDepth,
+            maxVisits: difficulty.maxVisits,
+            boardSize: gameState.boardSize,
+            includeOwnership: true,
+            includePolicy: true
+        });
+    }
+
+    async streamKataGoAnalysis(gameState, onUpdate) {
+        // 流式局势分析：读取服务器推送的SSE事件，每个中间结果回调 onUpdate(analysis, isFinal)
+        // 流式接口不可用时回退到普通分析
+        console.log('请求KataGo流式局势分析...');
+        let response;
+        try {
+            response = await fetch('/api/katago/analyze-stream', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: this.getAnalysisRequestBody(gameState)
+            });
+        } catch (error) {
+            console.log('流式分析请求失败，改用普通分析:', error.message);
+            return this.getKataGoAnalysis(gameState);
+        }
+
+        if (!response.ok || !response.body) {
+            console.log(`流式分析不可用 (${response.status})，改用普通分析`);
+            return this.getKataGoAnalysis(gameState);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let latest = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // 每条SSE消息以空行结束
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                for (const line of message.split('\n')) {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                }
+                if (!data) continue;
+
+                const payload = JSON.parse(data);
+                if (event === 'error') {
+                    reader.cancel();
+                    throw new Error(payload.error || 'KataGo流式分析失败');
+                }
+
+                const analysis = this.parseKataGoAnalysis(payload);
+                if (analysis) {
+                    latest = analysis;
+                    onUpdate(analysis, event === 'done');
+                }
+                if (event === 'done') {
+                    reader.cancel();
+                    return latest;
+                }
+            }
+        }
+
+        return latest;
+    }
+
     async getKataGoAnalysis(gameState) {
         try {
-            const sgfData = this.convertToSGF(gameState);
-            const difficulty = this.getDifficultySettings();
             console.log('请求KataGo局势分析...');
-            
+
             const response = await fetch('/api/katago/analyze-position', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({
-                    sgf: sgfData,
-                    moves: this.getMoveSequence(gameState),
-                    komi: 6.5,
-                    rules: 'chinese',
-                    analyzeDepth: difficulty.analyzeDepth,
-                    maxVisits: difficulty.maxVisits,
-                    boardSize: gameState.boardSize,
-                    includeOwnership: true,
-                    includePolicy: true
-                })
+                body: this.getAnalysisRequestBody(gameState)
             });
 
             if (!response.ok) {
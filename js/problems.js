@@ -365,8 +365,14 @@ class KataGoTsumegoGenerator {
         this.isGenerating = true;
         
         try {
+            // 先从预生成的题库中取题，题库不存在或题目已做过时再现场生成
+            const libraryProblem = await this.fetchLibraryProblem(difficulty, boardSize);
+            if (libraryProblem) {
+                return libraryProblem;
+            }
+
             console.log(`开始生成 ${difficulty} 难度的死活题...`);
-            
+
             const response = await fetch('/api/katago/generate-tsumego', {
                 method: 'POST',
                 headers: {
@@ -395,6 +401,27 @@ class KataGoTsumegoGenerator {
         }
     }
     
+    async fetchLibraryProblem(difficulty, boardSize) {
+        try {
+            const params = new URLSearchParams({ difficulty: difficulty, boardSize: boardSize });
+            const response = await fetch(`/api/problems/random?${params}`);
+            if (!response.ok) {
+                return null;
+            }
+
+            const problem = await response.json();
+            const existing = window.TsumegoEngine ? window.TsumegoEngine.problems : [];
+            if (existing.some(p => p.id === problem.id)) {
+                return null;
+            }
+            console.log('从题库取得死活题:', problem);
+            return problem;
+        } catch (error) {
+            console.warn('读取死活题库失败:', error);
+            return null;
+        }
+    }
+
     async addGeneratedProblem(difficulty = 'easy', boardSize = 9) {
         try {
             const problem = await this.generateProblem(difficulty, boardSize);
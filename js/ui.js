@@ -715,7 +715,12 @@ class UIController {
                 this.showNotification('info', '分析引擎', 'KataGo不可用，使用本地分析', 1500);
             }
             
-            const analysis = await window.OpenSourceAI.analyzePosition(game);
+            // 流式分析：搜索过程中先显示中间结果，胜率条随访问数增加逐步更新
+            const analysis = await window.OpenSourceAI.analyzePosition(game, (partial, isFinal) => {
+                if (!isFinal) {
+                    this.displayAnalysisResult(partial, true);
+                }
+            });
             
             if (analysis) {
                 this.displayAnalysisResult(analysis);
@@ -736,8 +741,8 @@ class UIController {
         }
     }
 
-    displayAnalysisResult(analysis) {
-        // 显示分析结果
+    displayAnalysisResult(analysis, isPartial = false) {
+        // 显示分析结果（isPartial为流式分析的中间结果，只更新内容，不滚动也不通知）
         const analysisPanel = document.getElementById('position-analysis');
         const summaryEl = document.getElementById('analysis-summary');
         const detailsEl = document.getElementById('analysis-details');
@@ -770,6 +775,10 @@ class UIController {
         // 显示分析面板
         analysisPanel.style.display = 'block';
 
+        if (isPartial) {
+            return;
+        }
+
         // 滚动到分析结果
         analysisPanel.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
 
@@ -0,0 +1,4 @@
+"""
+统一服务器的后端组件
+unified-server.py 从这里导入引擎池等基础设施
+"""
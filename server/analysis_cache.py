@@ -0,0 +1,163 @@
+"""
+局面分析结果缓存
+
+按 棋盘大小 + 局面Zobrist哈希（及劫点） + 轮到谁下 + 贴目 + maxVisits 作为键，
+悔棋、两个分析接口之间、不同用户的相同开局都能直接命中，不需要再跑一次genmove。
+局面先按8种对称和黑白互换规范化（server.symmetry），旋转、翻转或颜色互换的局面
+共用一个条目：缓存中保存规范方向的结果，读取时用请求自己的 Symmetry 变换回来。
+容量和TTL双重限制的LRU淘汰，可选持久化到磁盘，重启后继续使用。
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from server.board import Board, IllegalMove
+from server.coords import request_moves
+from server.log import get_logger
+from server.symmetry import Symmetry, canonical_position
+
+log = get_logger('cache')
+
+
+def position_key(request_data):
+    """计算请求对应的规范缓存键和对称变换 (key, Symmetry)，着法非法时键为None（不缓存）"""
+    board_size = request_data.get('boardSize', 19)
+    try:
+        board = Board.from_moves(board_size, request_moves(request_data))
+    except IllegalMove:
+        return None, Symmetry(board_size)
+
+    value, to_move, komi, ko, symmetry = canonical_position(board, float(request_data.get('komi', 6.5)))
+    max_visits = request_data.get('maxVisits', 400)
+    # 's' 标记规范化的键，与旧版本持久化的（未规范化的）键区分；有劫时加上规范方向的劫点，
+    # 棋子相同但一方不能立即提劫的局面不共用结果
+    ko_part = '' if ko < 0 else f"k{ko}"
+    return f"{board_size}:s{value:016x}{ko_part}:{'B' if to_move == 1 else 'W'}:{komi + 0.0:g}:{max_visits}", symmetry
+
+
+class AnalysisCache:
+    def __init__(self, max_entries=10000, ttl=3600.0, persist_path=None, save_every=100):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.save_every = save_every
+
+        self._entries = OrderedDict()  # 键 -> (过期时间, 结果)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+        # 统计数据
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+
+        if persist_path:
+            self.load()
+
+    def get(self, key):
+        """查找缓存，命中时移到LRU队尾"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def peek(self, key):
+        """查找缓存但不计入命中统计、不调整LRU顺序（后台预读用）"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                return None
+            return entry[1]
+
+    def put(self, key, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if key is None or value is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+            self._unsaved += 1
+            should_save = self.persist_path and self._unsaved >= self.save_every
+
+        if should_save:
+            self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._unsaved += 1
+
+    def load(self):
+        """从磁盘加载未过期的条目"""
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning("加载分析缓存失败", path=self.persist_path, error=e)
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, expires_at, value in data.get('entries', []):
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        log.info("已加载分析缓存", entries=len(self._entries))
+
+    def save(self):
+        """原子地写入磁盘（先写临时文件再改名）"""
+        if not self.persist_path:
+            return
+        with self._lock:
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items()]
+            self._unsaved = 0
+
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'entries': entries}, f)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            log.warning("保存分析缓存失败", path=self.persist_path, error=e)
+
+    def metrics(self):
+        """返回缓存运行指标"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hitRate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expired': self._expired,
+                'persistent': bool(self.persist_path),
+            }
@@ -0,0 +1,349 @@
+"""
+KataGo JSON分析引擎后端（`katago analysis`）
+
+每个分析请求作为一条JSON查询发送，包含完整着法序列，不需要逐步play。
+响应按查询id匹配，因此同一个进程上可以同时有大量查询在计算，
+KataGo内部会把它们合并成神经网络批次。
+"""
+
+import itertools
+import json
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from server.coords import coord_to_gtp, gtp_to_coord, request_moves
+from server.engine_pool import EnginePoolExhausted
+from server.log import get_logger
+
+log = get_logger('analysis')
+
+
+class KataGoAnalysisEngine:
+    def __init__(self, cmd, max_inflight=64, timeout=60.0):
+        # 胜率统一按黑棋视角报告，与GTP后端的结果保持一致
+        self.cmd = list(cmd) + ["-override-config", "reportAnalysisWinratesAs=BLACK"]
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+
+        self.process = None
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = {}  # 查询id -> (Future, 期望的响应数, 已收到的响应)
+        self._partial_callbacks = {}  # 查询id -> 中间结果回调
+        self._ids = itertools.count(1)
+
+        # 统计数据
+        self._queries = 0
+        self._completed = 0
+        self._errors = 0
+        self._rejected = 0
+        self._timeouts = 0
+
+    def start(self):
+        """启动KataGo分析进程和读取线程"""
+        with self._start_lock:
+            if self.is_alive():
+                return True
+            try:
+                self.process = subprocess.Popen(
+                    self.cmd,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    bufsize=1
+                )
+            except Exception as e:
+                log.error("启动KataGo分析引擎失败", error=e)
+                self.process = None
+                return False
+
+            process = self.process
+            threading.Thread(target=self._read_stdout, args=(process,), daemon=True).start()
+            threading.Thread(target=self._drain_stderr, args=(process,), daemon=True).start()
+            log.info("KataGo分析引擎启动成功")
+            return True
+
+    def stop(self):
+        """停止分析进程，未完成的查询全部失败"""
+        with self._start_lock:
+            if self.process:
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                self.process = None
+        self._fail_pending(RuntimeError("KataGo分析引擎已停止"))
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _read_stdout(self, process):
+        """读取线程：按id把响应分发给等待的查询"""
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                response = json.loads(line)
+            except ValueError:
+                log.warning("无法解析KataGo分析引擎输出", line=line)
+                continue
+
+            query_id = response.get('id')
+            if 'action' in response:
+                continue  # terminate确认
+            if response.get('isDuringSearch'):
+                callback = self._partial_callbacks.get(query_id)
+                if callback is not None:
+                    callback(response)
+                continue
+
+            with self._pending_lock:
+                entry = self._pending.get(query_id)
+                if entry is None:
+                    continue
+                future, expected, responses = entry
+                if 'error' in response:
+                    del self._pending[query_id]
+                else:
+                    if 'warning' in response and 'moveInfos' not in response:
+                        log.warning("KataGo分析警告", warning=response['warning'])
+                        continue
+                    responses.append(response)
+                    if len(responses) < expected:
+                        continue
+                    del self._pending[query_id]
+
+            if 'error' in response:
+                self._errors += 1
+                future.set_exception(RuntimeError(f"KataGo分析错误: {response['error']}"))
+            else:
+                self._completed += 1
+                future.set_result(sorted(responses, key=lambda r: r.get('turnNumber', 0)))
+
+        self._fail_pending(RuntimeError("KataGo分析引擎进程已退出"))
+
+    def _drain_stderr(self, process):
+        """持续读取stderr，避免管道写满导致KataGo阻塞"""
+        for _ in process.stderr:
+            pass
+
+    def _fail_pending(self, error):
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future, _, _ in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def submit(self, query, expected_responses=1, on_partial=None):
+        """发送一条查询，返回在收齐全部响应后完成的Future
+
+        on_partial 用于接收搜索过程中的中间结果（需要查询带 reportDuringSearchEvery）
+        """
+        future = Future()
+        # 多手数查询已经收到的响应，超时后调用方仍可以取用
+        future.responses = []
+        with self._pending_lock:
+            if len(self._pending) >= self.max_inflight:
+                self._rejected += 1
+                raise EnginePoolExhausted(f"KataGo分析引擎已有{len(self._pending)}个查询在计算")
+            query_id = f"q{next(self._ids)}"
+            query = dict(query, id=query_id)
+            self._pending[query_id] = (future, expected_responses, future.responses)
+            if on_partial is not None:
+                self._partial_callbacks[query_id] = on_partial
+                future.add_done_callback(lambda _: self._partial_callbacks.pop(query_id, None))
+            self._queries += 1
+
+        try:
+            with self._write_lock:
+                self.process.stdin.write(json.dumps(query) + "\n")
+                self.process.stdin.flush()
+        except Exception as e:
+            with self._pending_lock:
+                self._pending.pop(query_id, None)
+            future.set_exception(e)
+
+        future.query_id = query_id
+        return future
+
+    def terminate(self, query_id):
+        """让KataGo放弃一个已不需要的查询"""
+        try:
+            with self._write_lock:
+                self.process.stdin.write(json.dumps({
+                    'id': f"terminate-{query_id}",
+                    'action': 'terminate',
+                    'terminateId': query_id
+                }) + "\n")
+                self.process.stdin.flush()
+        except Exception:
+            pass
+        with self._pending_lock:
+            self._pending.pop(query_id, None)
+            self._partial_callbacks.pop(query_id, None)
+
+    def wait(self, future):
+        """等待查询结果，超时后终止查询并返回None"""
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._timeouts += 1
+            log.warning("KataGo分析查询超时", query=future.query_id, timeout=self.timeout)
+            self.terminate(future.query_id)
+            return None
+        except Exception as e:
+            log.error("KataGo分析查询失败", error=e)
+            return None
+
+    def build_query(self, request_data, analyze_turns=None, priority=0):
+        """把API请求转换为KataGo分析查询（priority越大，KataGo越先计算）"""
+        board_size = request_data.get('boardSize', 19)
+        moves = request_moves(request_data)
+        query = {
+            'moves': [
+                ['B' if i % 2 == 0 else 'W', coord_to_gtp(x, y, board_size)]
+                for i, (x, y) in enumerate(moves)
+            ],
+            'rules': request_data.get('rules', 'chinese'),
+            'komi': request_data.get('komi', 6.5),
+            'boardXSize': board_size,
+            'boardYSize': board_size,
+            'maxVisits': request_data.get('maxVisits', 400),
+            'analyzeTurns': analyze_turns if analyze_turns is not None else [len(moves)],
+        }
+        if request_data.get('includeOwnership'):
+            query['includeOwnership'] = True
+        if request_data.get('maxTime') is not None:
+            # 限时分析：搜索到maxTime秒时停止，返回当时的结果
+            query['overrideSettings'] = {'maxTime': float(request_data['maxTime'])}
+        if priority:
+            query['priority'] = priority
+        return query
+
+    def convert_response(self, response, board_size, moves=10):
+        """把KataGo的分析响应转换为与GTP后端相同的结果格式"""
+        move_infos = []
+        for info in sorted(response.get('moveInfos', []), key=lambda m: m.get('order', 0)):
+            move_str = info.get('move', '')
+            if not move_str or move_str.upper() == "PASS":
+                continue
+            x, y = gtp_to_coord(move_str, board_size)
+            move_infos.append({
+                "move": move_str,
+                "x": x,
+                "y": y,
+                "visits": info.get('visits', 0),
+                "winrate": info.get('winrate', 0.5),
+                "scoreLead": info.get('scoreLead', 0.0),
+                "scoreMean": info.get('scoreMean', info.get('scoreLead', 0.0))
+            })
+            if len(move_infos) >= moves:
+                break
+
+        if not move_infos:
+            return None
+        result = {"moveInfos": move_infos}
+        if 'visits' in response.get('rootInfo', {}):
+            result['visits'] = response['rootInfo']['visits']
+        return result
+
+    def analyze_position(self, request_data, moves=10, priority=0):
+        """分析局面并返回最佳着法和局势评估（一次JSON查询）"""
+        board_size = request_data.get('boardSize', 19)
+        future = self.submit(self.build_query(request_data, priority=priority))
+        responses = self.wait(future)
+        if not responses:
+            return None
+        return self.convert_response(responses[-1], board_size, moves)
+
+    def analyze_stream(self, request_data, interval=0.1, max_duration=30.0, moves=10, priority=0):
+        """流式分析：每隔interval秒产出一次中间结果，最后产出最终结果
+
+        超过max_duration仍未完成时终止查询，以最后一次中间结果为准。
+        """
+        board_size = request_data.get('boardSize', 19)
+        updates = queue.Queue()
+        query = self.build_query(request_data, priority=priority)
+        query['reportDuringSearchEvery'] = interval
+        future = self.submit(query, on_partial=updates.put)
+        future.add_done_callback(lambda _: updates.put(None))
+
+        deadline = time.monotonic() + max_duration
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    partial = updates.get(timeout=remaining)
+                except queue.Empty:
+                    return
+                if partial is None:
+                    break
+                result = self.convert_response(partial, board_size, moves)
+                if result:
+                    yield result
+
+            try:
+                responses = future.result(0)
+            except Exception as e:
+                log.error("KataGo分析查询失败", error=e)
+                return
+            result = self.convert_response(responses[-1], board_size, moves)
+            if result:
+                yield result
+        finally:
+            if not future.done():
+                self.terminate(future.query_id)
+
+    def analyze_positions(self, request_data, turns, chunk_size=16, moves=10, priority=0):
+        """同一盘棋的多个局面（turns 为手数）按 chunk_size 分成几条查询，返回 {手数: 分析结果}
+
+        前面的查询优先级更高、先算完，每条查询单独计算超时；
+        超时或失败的查询保留已经收到的局面，其余局面没有结果。
+        """
+        board_size = request_data.get('boardSize', 19)
+        futures = []
+        try:
+            for index, start in enumerate(range(0, len(turns), chunk_size)):
+                chunk = turns[start:start + chunk_size]
+                query = self.build_query(request_data, analyze_turns=chunk, priority=priority - index)
+                futures.append(self.submit(query, expected_responses=len(chunk)))
+        except EnginePoolExhausted:
+            for future in futures:
+                self.terminate(future.query_id)
+            raise
+
+        results = {}
+        for future in futures:
+            responses = self.wait(future)
+            if responses is None:
+                responses = list(future.responses)
+            for response in responses:
+                result = self.convert_response(response, board_size, moves)
+                if result:
+                    results[response.get('turnNumber')] = result
+        return results
+
+    def metrics(self):
+        """返回分析引擎运行指标"""
+        with self._pending_lock:
+            inflight = len(self._pending)
+        return {
+            'alive': self.is_alive(),
+            'inflight': inflight,
+            'maxInflight': self.max_inflight,
+            'queries': self._queries,
+            'completed': self._completed,
+            'errors': self._errors,
+            'rejected': self._rejected,
+            'timeouts': self._timeouts,
+        }
@@ -0,0 +1,137 @@
+"""
+ASGI模式 - 流式分析路由直接在事件循环里推送，其余路由交给Flask
+
+使用方法（需要 pip install uvicorn asgiref）:
+python unified-server.py --asgi
+"""
+
+import asyncio
+import json
+
+
+class StreamRequestError(Exception):
+    """流式路由在开始推送之前拒绝请求：以 status 和JSON响应体 payload 返回"""
+
+    def __init__(self, status, payload):
+        super().__init__(payload.get('error'))
+        self.status = status
+        self.payload = payload
+
+
+def format_sse(event, payload):
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get('body', b"")
+        if not message.get('more_body'):
+            return body
+
+
+def _header_list(headers):
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers.items()]
+
+
+def request_client(scope):
+    """与Flask路由相同的客户端标识：X-Client-Id 头，没有时为来源地址"""
+    for name, value in scope.get('headers', ()):
+        if name == b'x-client-id':
+            return value.decode('latin-1')
+    client = scope.get('client')
+    return client[0] if client else None
+
+
+async def _send_json(send, status, payload, headers=None):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json; charset=utf-8')] + _header_list(headers or {}),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream_events(open_stream, scope, receive, send):
+    """把 open_stream(data, client) 返回的 (同步事件生成器, 附加响应头) 以SSE推送给客户端
+
+    open_stream 负责像Flask路由一样解码请求，拒绝时抛出 StreamRequestError。
+    生成器在线程池中逐步推进，工作线程只在等待下一个事件时占用；
+    客户端断开后关闭生成器，引擎随之停止分析。
+    """
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        await _send_json(send, 400, {'error': '请求体不是有效的JSON'})
+        return
+
+    loop = asyncio.get_running_loop()
+    try:
+        events, headers = await loop.run_in_executor(None, open_stream, data, request_client(scope))
+    except StreamRequestError as e:
+        await _send_json(send, e.status, e.payload)
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ] + _header_list(headers),
+    })
+
+    disconnected = asyncio.Event()
+    finished = object()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        while not disconnected.is_set():
+            item = await loop.run_in_executor(None, next, events, finished)
+            if item is finished or disconnected.is_set():
+                break
+            await send({
+                'type': 'http.response.body',
+                'body': format_sse(*item).encode('utf-8'),
+                'more_body': True,
+            })
+    finally:
+        watcher.cancel()
+        await loop.run_in_executor(None, events.close)
+
+    if not disconnected.is_set():
+        await send({'type': 'http.response.body', 'body': b"", 'more_body': False})
+
+
+def create_asgi_app(flask_app, stream_routes):
+    """创建ASGI应用：stream_routes（路径 -> open_stream）中的POST路由原生流式处理，其余转给Flask"""
+    from asgiref.wsgi import WsgiToAsgi
+
+    wsgi_app = WsgiToAsgi(flask_app)
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] in stream_routes:
+            await stream_events(stream_routes[scope['path']], scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        else:
+            await wsgi_app(scope, receive, send)
+
+    return app
@@ -0,0 +1,256 @@
+"""
+服务器端棋盘 - 根据着法序列计算局面（含提子、劫争）
+
+棋子取值与前端一致：1 = 黑，-1 = 白，0 = 空
+棋盘用一维数组保存，点 (x, y) 的下标为 y * size + x
+双方棋子数和提子数随落子增量维护，棋块和气按需泛洪计算，
+形势评估可以直接读取，不需要向引擎发送showboard。
+"""
+
+import random
+from functools import lru_cache
+
+EMPTY = 0
+BLACK = 1
+WHITE = -1
+
+
+class IllegalMove(ValueError):
+    """着法非法（落在已有棋子上、超出棋盘、自杀或提劫）"""
+
+
+@lru_cache(maxsize=None)
+def zobrist_table(size):
+    """每个点、每种颜色一个固定的64位随机数（固定种子，重启后哈希不变）"""
+    rng = random.Random(0x60B0A2D + size)
+    return tuple(
+        (rng.getrandbits(64), rng.getrandbits(64))
+        for _ in range(size * size)
+    )
+
+
+@lru_cache(maxsize=None)
+def neighbor_table(size):
+    """每个点的相邻点下标"""
+    table = []
+    for index in range(size * size):
+        x, y = index % size, index // size
+        adjacent = []
+        if x > 0:
+            adjacent.append(index - 1)
+        if x < size - 1:
+            adjacent.append(index + 1)
+        if y > 0:
+            adjacent.append(index - size)
+        if y < size - 1:
+            adjacent.append(index + size)
+        table.append(tuple(adjacent))
+    return tuple(table)
+
+
+class Board:
+    def __init__(self, size=19):
+        self.size = size
+        self.cells = [EMPTY] * (size * size)
+        self.hash = 0
+        self.move_count = 0
+        self.ko = None  # 下一手禁止落子的劫点下标
+        self.stones = {BLACK: 0, WHITE: 0}
+        self.captures = {BLACK: 0, WHITE: 0}  # 各方提掉的对方棋子数
+        self._history = []  # 每手的 (落子点, 颜色, 被提的点, 之前的劫点)，用于undo
+        self._zobrist = zobrist_table(size)
+        self._neighbors = neighbor_table(size)
+
+    @classmethod
+    def from_moves(cls, size, moves):
+        """按黑先、交替的顺序摆出 [(x, y), ...]"""
+        board = cls(size)
+        color = BLACK
+        for x, y in moves:
+            board.play(x, y, color)
+            color = -color
+        return board
+
+    def copy(self):
+        """复制局面（不复制悔棋记录）"""
+        board = Board.__new__(Board)
+        board.size = self.size
+        board.cells = self.cells[:]
+        board.hash = self.hash
+        board.move_count = self.move_count
+        board.ko = self.ko
+        board.stones = dict(self.stones)
+        board.captures = dict(self.captures)
+        board._history = []
+        board._zobrist = self._zobrist
+        board._neighbors = self._neighbors
+        return board
+
+    @property
+    def to_move(self):
+        return BLACK if self.move_count % 2 == 0 else WHITE
+
+    def _set(self, index, color):
+        old = self.cells[index]
+        if old != EMPTY:
+            self.hash ^= self._zobrist[index][0 if old == BLACK else 1]
+            self.stones[old] -= 1
+        if color != EMPTY:
+            self.hash ^= self._zobrist[index][0 if color == BLACK else 1]
+            self.stones[color] += 1
+        self.cells[index] = color
+
+    def _group_has_liberty(self, index):
+        """泛洪查找棋块，返回 (是否有气, 棋块所有点)
+
+        找到第一口气就停止，此时返回的棋块不完整；没有气时返回完整棋块。
+        """
+        cells = self.cells
+        neighbors = self._neighbors
+        color = cells[index]
+        stack = [index]
+        group = {index}
+        while stack:
+            point = stack.pop()
+            for neighbor in neighbors[point]:
+                value = cells[neighbor]
+                if value == EMPTY:
+                    return True, group
+                if value == color and neighbor not in group:
+                    group.add(neighbor)
+                    stack.append(neighbor)
+        return False, group
+
+    def group_at(self, index):
+        """返回 (棋块所有点, 棋块的气) ，空点返回两个空集合"""
+        color = self.cells[index]
+        if color == EMPTY:
+            return set(), set()
+        stack = [index]
+        group = {index}
+        liberties = set()
+        while stack:
+            point = stack.pop()
+            for neighbor in self._neighbors[point]:
+                value = self.cells[neighbor]
+                if value == EMPTY:
+                    liberties.add(neighbor)
+                elif value == color and neighbor not in group:
+                    group.add(neighbor)
+                    stack.append(neighbor)
+        return group, liberties
+
+    def groups(self):
+        """遍历棋盘上所有棋块，产出 (颜色, 棋块所有点, 气)"""
+        seen = set()
+        for index, color in enumerate(self.cells):
+            if color == EMPTY or index in seen:
+                continue
+            group, liberties = self.group_at(index)
+            seen |= group
+            yield color, group, liberties
+
+    def liberties(self, x, y):
+        """(x, y) 所在棋块的气数，空点返回0"""
+        return len(self.group_at(y * self.size + x)[1])
+
+    def play(self, x, y, color):
+        """落子并提走无气的对方棋子，返回被提的点下标列表"""
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IllegalMove(f"({x}, {y}) 超出 {self.size}x{self.size} 棋盘")
+        index = y * self.size + x
+        if self.cells[index] != EMPTY:
+            raise IllegalMove(f"({x}, {y}) 已有棋子")
+        if index == self.ko:
+            raise IllegalMove(f"({x}, {y}) 是劫，需要先在别处应一手")
+
+        self._set(index, color)
+        captured = []
+        next_to_empty = False
+        for neighbor in self._neighbors[index]:
+            value = self.cells[neighbor]
+            if value == EMPTY:
+                next_to_empty = True
+            elif value == -color:
+                has_liberty, group = self._group_has_liberty(neighbor)
+                if not has_liberty:
+                    for point in group:
+                        self._set(point, EMPTY)
+                    captured.extend(group)
+
+        # 禁止自杀（中国规则）；旁边有空点时一定有气
+        if not captured and not next_to_empty:
+            has_liberty, _ = self._group_has_liberty(index)
+            if not has_liberty:
+                self._set(index, EMPTY)
+                raise IllegalMove(f"({x}, {y}) 是自杀着法")
+
+        # 单子提单子、且落下的子只剩被提的这一口气时形成劫
+        previous_ko = self.ko
+        self.ko = None
+        if len(captured) == 1:
+            group, liberties = self.group_at(index)
+            if len(group) == 1 and len(liberties) == 1:
+                self.ko = captured[0]
+
+        self._history.append((index, color, captured, previous_ko))
+        self.captures[color] += len(captured)
+        self.move_count += 1
+        return captured
+
+    def pass_move(self):
+        """停一手（解除劫的限制）"""
+        self._history.append((None, None, (), self.ko))
+        self.ko = None
+        self.move_count += 1
+
+    def undo(self):
+        """撤销最后一手（恢复被提的棋子和劫点）"""
+        index, color, captured, previous_ko = self._history.pop()
+        if index is not None:
+            self._set(index, EMPTY)
+            for point in captured:
+                self._set(point, -color)
+            self.captures[color] -= len(captured)
+        self.ko = previous_ko
+        self.move_count -= 1
+
+    def is_eye(self, index, color):
+        """简单眼位判断：四周都是color的棋子"""
+        cells = self.cells
+        return all(cells[neighbor] == color for neighbor in self._neighbors[index])
+
+    def area_score(self, komi=0.0):
+        """数子法黑方领先的子数（棋子 + 只与一方相邻的空点，减去贴目）"""
+        cells = self.cells
+        score = self.stones[BLACK] - self.stones[WHITE]
+        seen = set()
+        for index, value in enumerate(cells):
+            if value != EMPTY or index in seen:
+                continue
+            region = [index]
+            seen.add(index)
+            borders = set()
+            stack = [index]
+            while stack:
+                point = stack.pop()
+                for neighbor in self._neighbors[point]:
+                    neighbor_value = cells[neighbor]
+                    if neighbor_value == EMPTY:
+                        if neighbor not in seen:
+                            seen.add(neighbor)
+                            region.append(neighbor)
+                            stack.append(neighbor)
+                    else:
+                        borders.add(neighbor_value)
+            if len(borders) == 1:
+                score += len(region) * borders.pop()
+        return score - komi
+
+    def get(self, x, y):
+        return self.cells[y * self.size + x]
+
+    def to_2d(self):
+        """转换为前端使用的二维数组 board[y][x]"""
+        size = self.size
+        return [self.cells[row * size:(row + 1) * size] for row in range(size)]
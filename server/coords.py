@@ -0,0 +1,44 @@
+"""
+坐标转换工具
+
+数组坐标：x为列，y为行，(0, 0) 是左上角
+GTP坐标：A1 = 左下角，列字母跳过I
+"""
+
+GTP_LETTERS = "ABCDEFGHJKLMNOPQRSTUVWXYZ"  # 跳过I
+
+
+def coord_to_gtp(x, y, board_size):
+    """将数组坐标转换为GTP坐标"""
+    return f"{GTP_LETTERS[x]}{board_size - y}"
+
+
+def gtp_to_coord(gtp_move, board_size):
+    """将GTP坐标转换为数组坐标，无法解析时返回 (None, None)"""
+    if not gtp_move or len(gtp_move) < 2:
+        return None, None
+
+    col_char = gtp_move[0].upper()
+    row_str = gtp_move[1:]
+
+    try:
+        x = GTP_LETTERS.index(col_char)
+        y = board_size - int(row_str)
+        return x, y
+    except ValueError:
+        return None, None
+
+
+def request_moves(request_data):
+    """从请求中取出有效着法 [(x, y), ...]，黑棋先行、双方交替
+
+    moves 是 {x, y} 字典列表，或紧凑编码解码出的 (x, y) 元组列表（server.wire）。
+    """
+    moves = request_data.get('moves', [])
+    if moves and isinstance(moves[0], tuple):
+        return list(moves)
+    return [
+        (move['x'], move['y'])
+        for move in request_data.get('moves', [])
+        if 'x' in move and 'y' in move
+    ]
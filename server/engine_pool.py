@@ -0,0 +1,436 @@
+"""
+KataGo引擎池 - 多个引擎进程并发处理分析请求
+
+每个请求独占签出一个引擎，用完归还；所有引擎繁忙时请求排队等待，
+排队人数超过上限或等待超时则拒绝（背压），由路由返回503。
+
+排队不是先来先服务：归还的引擎先交给优先级高的请求（interactive：对弈中的落子，
+batch：整盘复盘），同一优先级内按客户端轮流，最久没有分到引擎的客户端优先，
+一个客户端的大量复盘请求不会堵住其他人。排队的请求越多，visit_budget() 给出的
+访问数越少，让对弈请求的尾延迟保持有界。
+
+会话亲和：带 session 的请求优先签出上次为这个会话服务的引擎，引擎里还保留着
+这盘棋的局面，下一手只需要补下一两手再搜索。其他请求优先使用没有绑定会话、
+或绑定的会话最久没有使用的引擎（LRU淘汰）；会话的引擎被占用后，下次请求
+在另一个引擎上按着法序列重建局面，对调用方透明。
+
+supervise() 启动后台监护线程：定期用廉价的GTP命令ping空闲引擎，
+退出或无响应的引擎不再分配给请求，在后台重启并预热后才重新投入使用；
+没有任何就绪引擎时签出立即失败（EngineNotReady），不让请求等待模型加载。
+"""
+
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from server.log import get_logger
+from server.metrics import STAGE_SECONDS
+
+log = get_logger('pool')
+
+# 优先级类别，越靠前越先分到引擎
+PRIORITIES = ('interactive', 'batch')
+
+# 记录最近分到引擎时间的客户端数上限
+MAX_TRACKED_CLIENTS = 1024
+
+
+class EnginePoolExhausted(Exception):
+    """所有引擎繁忙且等待队列已满或等待超时"""
+
+
+class EngineNotReady(EnginePoolExhausted):
+    """没有就绪的引擎：全部正在后台重启或预热"""
+
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class EngineUnavailable(Exception):
+    """引擎无法启动（例如KataGo路径不存在）"""
+
+
+class _Waiter:
+    __slots__ = ('rank', 'client', 'session', 'seq', 'engine')
+
+    def __init__(self, rank, client, session, seq):
+        self.rank = rank
+        self.client = client
+        self.session = session
+        self.seq = seq
+        self.engine = None
+
+
+class EnginePool:
+    def __init__(self, engine_factory, size=1, max_waiters=16, checkout_timeout=30.0, min_visits=50):
+        self.engine_factory = engine_factory
+        self.size = max(1, int(size))
+        self.max_waiters = max(0, int(max_waiters))
+        self.checkout_timeout = checkout_timeout
+        self.min_visits = max(1, int(min_visits))
+
+        self.engines = [engine_factory() for _ in range(self.size)]
+        self._idle = deque(self.engines)
+        self._restarting = set()
+        self._cond = threading.Condition()
+        self._waiters = []  # 排队中的 _Waiter
+        self._served = OrderedDict()  # 客户端 -> 最近一次分到引擎的时间
+        self._sessions = OrderedDict()  # 会话 -> 保存着它的局面的引擎（LRU）
+        self._engine_sessions = {}  # 引擎 -> 会话
+        self._seq = itertools.count()
+
+        # 监护线程
+        self.ping_interval = None
+        self._supervisor = None
+        self._stopping = threading.Event()
+        self._start_seconds = None  # 最近一次成功启动+预热的耗时
+
+        # 统计数据
+        self._checkouts = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._restarts = 0
+        self._failed_starts = 0
+        self._pings = 0
+        self._ping_failures = 0
+        self._budget_cuts = 0
+        self._affinity_hits = 0
+        self._affinity_misses = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def supervised(self):
+        return self._supervisor is not None
+
+    def start(self):
+        """启动池中所有未运行的引擎（监护模式下在后台启动）"""
+        if self.ping_interval is not None:
+            self.supervise(self.ping_interval)
+            return self.is_available
+        for engine in self.engines:
+            if not engine.is_alive():
+                engine.start()
+        return self.is_available
+
+    def stop(self):
+        """停止监护线程和池中所有引擎"""
+        supervisor, self._supervisor = self._supervisor, None
+        if supervisor is not None:
+            self._stopping.set()
+            supervisor.join()
+        for engine in self.engines:
+            engine.stop()
+
+    @property
+    def is_available(self):
+        with self._cond:
+            return any(engine.is_alive() for engine in self.engines if engine not in self._restarting)
+
+    def supervise(self, interval=5.0):
+        """启动监护线程，未运行的引擎立即在后台启动"""
+        self.ping_interval = interval
+        if self._supervisor is not None:
+            return
+        self._stopping.clear()
+        self._supervisor = threading.Thread(target=self._supervise_loop, name='engine-supervisor', daemon=True)
+        self._supervisor.start()
+
+        with self._cond:
+            dead = [engine for engine in self._idle if not engine.is_alive()]
+            for engine in dead:
+                self._idle.remove(engine)
+        for engine in dead:
+            self._restart_later(engine, crashed=False)
+
+    def _supervise_loop(self):
+        while not self._stopping.wait(self.ping_interval):
+            for engine in self.engines:
+                with self._cond:
+                    if engine not in self._idle:
+                        continue
+                    self._idle.remove(engine)
+                self._pings += 1
+                if self._ping(engine):
+                    self.checkin(engine)
+                else:
+                    self._ping_failures += 1
+                    log.warning("引擎没有响应ping，后台重启")
+                    self._restart_later(engine)
+
+    @staticmethod
+    def _ping(engine):
+        ping = getattr(engine, 'ping', None)
+        return engine.is_alive() and (ping is None or ping())
+
+    @staticmethod
+    def _warm_up(engine):
+        warm_up = getattr(engine, 'warm_up', None)
+        return warm_up is None or warm_up()
+
+    def _restart_later(self, engine, crashed=True):
+        """把引擎移出服务，在后台线程中重启、预热后归还"""
+        with self._cond:
+            if engine in self._restarting:
+                return
+            self._restarting.add(engine)
+            self._bind(engine, None)
+            if crashed:
+                self._restarts += 1
+            # 排队的请求重新检查：没有就绪的引擎时立即失败，不等到超时
+            self._cond.notify_all()
+        threading.Thread(target=self._restart, args=(engine,), name='engine-restart', daemon=True).start()
+
+    def _restart(self, engine):
+        delay = 1.0
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            engine.stop()
+            engine.start()
+            if engine.is_alive() and self._warm_up(engine) and engine.is_alive():
+                self._start_seconds = time.monotonic() - started
+                log.info("引擎已就绪", seconds=round(self._start_seconds, 2))
+                if self._stopping.is_set():
+                    engine.stop()
+                break
+            self._failed_starts += 1
+            engine.stop()
+            log.warning("引擎启动失败，稍后重试", retryIn=delay)
+            if self._stopping.wait(delay):
+                break
+            delay = min(delay * 2, 30.0)
+
+        with self._cond:
+            self._restarting.discard(engine)
+            self._release(engine)
+
+    def retry_after(self):
+        """建议客户端多少秒后重试：按最近一次启动+预热的耗时估计"""
+        if self._start_seconds is None:
+            return 5
+        return max(1, math.ceil(self._start_seconds))
+
+    def _not_ready(self):
+        """监护模式下所有引擎都在重启中"""
+        return self.supervised and not self._idle and len(self._restarting) >= self.size
+
+    def _rank(self, priority):
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {priority}")
+        return PRIORITIES.index(priority)
+
+    def _mark_served(self, client):
+        self._served[client] = time.monotonic()
+        self._served.move_to_end(client)
+        if len(self._served) > MAX_TRACKED_CLIENTS:
+            self._served.popitem(last=False)
+
+    def _bind(self, engine, session):
+        """（持有锁）记录引擎现在保存的是哪个会话的局面"""
+        previous = self._engine_sessions.pop(engine, None)
+        if previous is not None and self._sessions.get(previous) is engine:
+            del self._sessions[previous]
+        if session is not None:
+            old_engine = self._sessions.pop(session, None)
+            if old_engine is not None:
+                self._engine_sessions.pop(old_engine, None)
+            self._sessions[session] = engine
+            self._engine_sessions[engine] = session
+
+    def _assign(self, engine, session):
+        """（持有锁）引擎分配给请求：统计会话亲和命中并重新绑定"""
+        if session is not None:
+            if self._sessions.get(session) is engine:
+                self._affinity_hits += 1
+            else:
+                self._affinity_misses += 1
+        self._bind(engine, session)
+
+    def _take_idle(self, session):
+        """（持有锁）取一个空闲引擎：会话自己的引擎，其次没有绑定会话的，再次会话最久未用的"""
+        engine = self._sessions.get(session) if session is not None else None
+        if engine is None or engine not in self._idle:
+            recency = {bound: order for order, bound in enumerate(self._sessions.values())}
+            engine = min(self._idle, key=lambda candidate: recency.get(candidate, -1))
+        self._idle.remove(engine)
+        return engine
+
+    def _release(self, engine):
+        """（持有锁）把引擎交给排在最前的请求，没有人排队则放回空闲队列
+
+        同一优先级中有请求的会话绑定在这个引擎上时，优先交给它。
+        """
+        if not self._waiters:
+            self._idle.append(engine)
+            return
+        waiter = min(self._waiters, key=lambda w: (w.rank, self._served.get(w.client, 0.0), w.seq))
+        owner = self._engine_sessions.get(engine)
+        if owner is not None and waiter.session != owner:
+            waiter = next((w for w in self._waiters if w.rank == waiter.rank and w.session == owner), waiter)
+        self._waiters.remove(waiter)
+        waiter.engine = engine
+        self._mark_served(waiter.client)
+        self._assign(engine, waiter.session)
+        self._cond.notify_all()
+
+    def checkout(self, timeout=None, priority='interactive', client=None, session=None):
+        """签出一个空闲引擎，必要时按优先级和客户端轮流排队等待；session 为会话亲和的键"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        rank = self._rank(priority)
+        start_time = time.monotonic()
+        deadline = start_time + timeout
+
+        while True:
+            with self._cond:
+                if self._not_ready():
+                    self._rejected += 1
+                    raise EngineNotReady("没有就绪的KataGo引擎，正在后台启动", self.retry_after())
+
+                if self._idle and not self._waiters:
+                    engine = self._take_idle(session)
+                    self._mark_served(client)
+                    self._assign(engine, session)
+                else:
+                    if sum(1 for w in self._waiters if w.rank == rank) >= self.max_waiters:
+                        self._rejected += 1
+                        raise EnginePoolExhausted(f"所有{self.size}个引擎繁忙，等待队列已满")
+                    engine = self._wait(_Waiter(rank, client, session, next(self._seq)), deadline, timeout)
+
+            if engine.is_alive():
+                break
+
+            # 进程已退出：监护模式下交给后台重启，换一个引擎；否则在签出时直接重启
+            if self.supervised:
+                self._restart_later(engine)
+                continue
+            if engine.process is not None:
+                self._restarts += 1
+            engine.stop()
+            engine.start()
+            if not engine.is_alive():
+                self._failed_starts += 1
+                self.checkin(engine)
+                raise EngineUnavailable("KataGo引擎启动失败")
+            break
+
+        waited = time.monotonic() - start_time
+        STAGE_SECONDS.observe(waited, 'queue_wait')
+        with self._cond:
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return engine
+
+    def _wait(self, waiter, deadline, timeout):
+        """（持有锁）排队直到 _release 把引擎交给这个请求"""
+        self._waiters.append(waiter)
+        try:
+            while waiter.engine is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise EnginePoolExhausted(f"等待空闲引擎超时（{timeout}秒）")
+                if self._not_ready():
+                    self._rejected += 1
+                    raise EngineNotReady("没有就绪的KataGo引擎，正在后台启动", self.retry_after())
+                self._cond.wait(remaining)
+            return waiter.engine
+        finally:
+            if waiter.engine is None:
+                self._waiters.remove(waiter)
+
+    def try_checkout(self, session=None):
+        """不排队地签出一个空闲引擎（后台预读用）：没有空闲引擎或有请求在排队时返回None"""
+        with self._cond:
+            if self._not_ready() or not self._idle or self._waiters:
+                return None
+            engine = self._take_idle(session)
+            self._assign(engine, session)
+        if not engine.is_alive():
+            self.checkin(engine)
+            return None
+        return engine
+
+    def has_waiters(self):
+        """有请求在排队等待引擎（后台预读据此提前归还引擎）"""
+        with self._cond:
+            return bool(self._waiters)
+
+    def checkin(self, engine):
+        """归还引擎；监护模式下已崩溃的引擎不放回空闲队列，而是后台重启"""
+        if self.supervised and not engine.is_alive():
+            self._restart_later(engine)
+            return
+        with self._cond:
+            self._release(engine)
+
+    def yield_engine(self, engine, priority='batch', client=None, timeout=None):
+        """长时间占用引擎的批量任务在两个局面之间调用：有更高优先级的请求排队时
+        先归还引擎让它插队，再重新排队签出（可能换成另一个引擎）"""
+        rank = self._rank(priority)
+        with self._cond:
+            preempted = any(w.rank < rank for w in self._waiters)
+        if not preempted:
+            return engine
+        self.checkin(engine)
+        return self.checkout(timeout, priority, client)
+
+    def visit_budget(self, requested, priority='interactive'):
+        """按排队长度缩减访问数：每个引擎平均多一个排队请求，访问数就少一份，不低于 min_visits"""
+        rank = self._rank(priority)
+        with self._cond:
+            # 对弈请求只受排在它前面（同级及更高优先级）的请求影响
+            queued = sum(1 for w in self._waiters if w.rank <= rank)
+        if queued == 0 or requested <= self.min_visits:
+            return requested
+        budget = max(self.min_visits, int(requested * self.size / (self.size + queued)))
+        if budget < requested:
+            self._budget_cuts += 1
+        return budget
+
+    @contextmanager
+    def engine(self, timeout=None, priority='interactive', client=None, session=None):
+        """with katago_pool.engine() as engine: ..."""
+        engine = self.checkout(timeout, priority, client, session)
+        try:
+            yield engine
+        finally:
+            self.checkin(engine)
+
+    def metrics(self):
+        """返回引擎池运行指标"""
+        with self._cond:
+            idle = len(self._idle)
+            restarting = len(self._restarting)
+            return {
+                'size': self.size,
+                'alive': sum(1 for engine in self.engines if engine.is_alive()),
+                'idle': idle,
+                'busy': self.size - idle - restarting,
+                'restarting': restarting,
+                'supervised': self.supervised,
+                'waiting': len(self._waiters),
+                'waitingByPriority': {
+                    priority: sum(1 for w in self._waiters if w.rank == rank)
+                    for rank, priority in enumerate(PRIORITIES)
+                },
+                'maxWaiters': self.max_waiters,
+                'checkouts': self._checkouts,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'restarts': self._restarts,
+                'failedStarts': self._failed_starts,
+                'pings': self._pings,
+                'pingFailures': self._ping_failures,
+                'minVisits': self.min_visits,
+                'budgetCuts': self._budget_cuts,
+                'sessions': len(self._sessions),
+                'affinityHits': self._affinity_hits,
+                'affinityMisses': self._affinity_misses,
+                'avgWaitMs': round(self._total_wait / self._checkouts * 1000, 2) if self._checkouts else 0.0,
+                'maxWaitMs': round(self._max_wait * 1000, 2),
+            }
@@ -0,0 +1,297 @@
+"""
+异步GTP客户端
+
+所有引擎进程的读写都在一个后台asyncio事件循环里完成，Flask工作线程只等待结果，
+并且每条命令都有截止时间，引擎卡住或崩溃都不会占住工作线程。
+
+- 每条命令带数字id（"12 genmove b" -> "=12 Q16"），响应按id匹配
+- 按GTP规范分帧：响应以 = 或 ? 开头，以空行结束，多行响应完整读取
+- 独立任务持续读取stderr，避免管道写满导致引擎阻塞
+- kata-analyze 等持续输出的命令可以逐行流式读取，随时停止
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import queue
+import threading
+from collections import deque
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """返回后台事件循环（首次调用时在守护线程中启动）"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gtp-event-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+class GTPError(Exception):
+    """GTP传输错误（进程未启动或已退出）"""
+
+
+class GTPTimeout(GTPError):
+    """命令超过截止时间仍未响应"""
+
+
+class GTPResponse:
+    def __init__(self, command_id, ok, lines):
+        self.id = command_id
+        self.ok = ok
+        self.lines = lines
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
+
+    def __str__(self):
+        """与旧接口兼容的格式："= Q16" / "? illegal move" """
+        prefix = "=" if self.ok else "?"
+        return f"{prefix} {self.text}" if self.lines else prefix
+
+
+class AsyncGTPClient:
+    def __init__(self, cmd, stderr_lines=50):
+        self.cmd = cmd
+        self.process = None
+        self.stderr_tail = deque(maxlen=stderr_lines)
+        self._ids = itertools.count(1)
+        self._pending = {}  # 命令id -> Future
+        self._streams = {}  # 流式命令id -> asyncio.Queue
+        self._write_lock = None
+        self._tasks = []
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        self._write_lock = asyncio.Lock()
+        self._tasks = [
+            asyncio.ensure_future(self._read_stdout()),
+            asyncio.ensure_future(self._drain_stderr()),
+        ]
+
+    def is_alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def _send(self, command_id, command):
+        if not self.is_alive():
+            raise GTPError("GTP引擎未运行")
+        try:
+            async with self._write_lock:
+                self.process.stdin.write(f"{command_id} {command}\n".encode())
+                await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise GTPError(f"GTP引擎管道已关闭: {e}")
+
+    async def command(self, command, timeout):
+        """发送一条命令并等待响应，超时抛出GTPTimeout"""
+        command_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[command_id] = future
+        try:
+            await self._send(command_id, command)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise GTPTimeout(f"命令 '{command}' 超过 {timeout} 秒未响应")
+        finally:
+            self._pending.pop(command_id, None)
+
+    async def stream(self, command, timeout):
+        """发送持续输出的命令（如kata-analyze），逐行产出
+
+        timeout是相邻两行之间的最长间隔。调用方停止迭代后，
+        发送一条空操作命令让引擎结束输出，并等待引擎回到空闲状态。
+        """
+        command_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        lines = asyncio.Queue()
+        self._pending[command_id] = future
+        self._streams[command_id] = lines
+        try:
+            await self._send(command_id, command)
+            while True:
+                try:
+                    line = await asyncio.wait_for(lines.get(), timeout)
+                except asyncio.TimeoutError:
+                    raise GTPTimeout(f"命令 '{command}' 超过 {timeout} 秒没有输出")
+                if line is None:
+                    break
+                yield line
+        finally:
+            self._streams.pop(command_id, None)
+            if not future.done() and self.is_alive():
+                # 任何新命令都会让KataGo停止当前分析
+                try:
+                    await self.command("protocol_version", timeout)
+                except GTPError:
+                    pass
+            self._pending.pop(command_id, None)
+
+    def cancel_pending(self, error=None):
+        """取消所有等待中的命令"""
+        for future in list(self._pending.values()):
+            if not future.done():
+                if error is None:
+                    future.cancel()
+                else:
+                    future.set_exception(error)
+                    # 流式命令的Future没有人await：标记异常已读取，避免事件循环报告
+                    # "Future exception was never retrieved"，等待中的命令仍会收到异常
+                    future.exception()
+        self._pending.clear()
+
+    async def _read_stdout(self):
+        """按GTP规范分帧读取响应"""
+        current = None
+        try:
+            while True:
+                raw = await self.process.stdout.readline()
+                if not raw:
+                    break
+                line = raw.decode('utf-8', errors='replace').strip()
+
+                if current is None:
+                    if not line or line[0] not in "=?":
+                        continue  # 响应之间的空行或杂项输出
+                    head, _, text = line[1:].partition(" ")
+                    if head.isdigit():
+                        command_id = int(head)
+                    else:
+                        command_id, text = None, line[1:].strip()
+                    current = GTPResponse(command_id, line[0] == "=", [text] if text else [])
+                elif line:
+                    stream = self._streams.get(current.id)
+                    if stream is not None:
+                        stream.put_nowait(line)
+                    else:
+                        current.lines.append(line)
+                else:
+                    self._resolve(current)
+                    stream = self._streams.get(current.id)
+                    if stream is not None:
+                        stream.put_nowait(None)
+                    current = None
+        finally:
+            self.cancel_pending(GTPError("GTP引擎进程已退出"))
+
+    def _resolve(self, response):
+        future = self._pending.get(response.id)
+        if future is None and response.id is None and self._pending:
+            # 引擎没有回显id时按先后顺序匹配
+            future = self._pending[min(self._pending)]
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    async def _drain_stderr(self):
+        """持续读取stderr，保留最近几行用于诊断"""
+        while True:
+            raw = await self.process.stderr.readline()
+            if not raw:
+                break
+            self.stderr_tail.append(raw.decode('utf-8', errors='replace').rstrip())
+
+    async def close(self, timeout=5.0):
+        """终止进程并等待退出，超时则强制结束"""
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                self.process.terminate()
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+            except ProcessLookupError:
+                pass
+        self.cancel_pending(GTPError("GTP引擎已停止"))
+        for stream in self._streams.values():
+            stream.put_nowait(None)
+        for task in self._tasks:
+            task.cancel()
+
+
+class GTPClient:
+    """AsyncGTPClient的同步外观，供Flask工作线程调用"""
+
+    def __init__(self, cmd):
+        self.loop = get_event_loop()
+        self.client = AsyncGTPClient(cmd)
+
+    def _run(self, coro, timeout):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise GTPTimeout(f"等待GTP引擎超过 {timeout} 秒")
+        except Exception:
+            future.cancel()
+            raise
+
+    def start(self, timeout=60.0):
+        self._run(self.client.start(), timeout)
+
+    def command(self, command, timeout):
+        # 额外留一秒余量，正常情况下由事件循环内的wait_for先超时
+        return self._run(self.client.command(command, timeout), timeout + 1.0)
+
+    def stream(self, command, timeout):
+        """同步生成器：逐行产出流式命令的输出
+
+        调用方关闭生成器（break或close）后，会等到引擎停止输出才返回，
+        保证引擎归还引擎池时已经空闲。
+        """
+        lines = queue.Queue()
+        stop = threading.Event()
+
+        async def pump():
+            output = self.client.stream(command, timeout)
+            try:
+                async for line in output:
+                    lines.put(line)
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                lines.put(e)
+            finally:
+                await output.aclose()
+                lines.put(None)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                try:
+                    item = lines.get(timeout=timeout + 1.0)
+                except queue.Empty:
+                    raise GTPTimeout(f"命令 '{command}' 超过 {timeout} 秒没有输出")
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            try:
+                future.result(timeout + 1.0)
+            except Exception:
+                future.cancel()
+
+    def is_alive(self):
+        return self.client.is_alive()
+
+    def close(self, timeout=5.0):
+        self._run(self.client.close(timeout), timeout + 1.0)
+
+    @property
+    def stderr_tail(self):
+        return list(self.client.stderr_tail)
@@ -0,0 +1,70 @@
+"""
+NumPy势力/归属估计 - 整个棋盘（或一批棋盘）一次卷积完成
+
+与前端 calculateInfluence 使用相同的影响力模型：每个棋子向曼哈顿距离3以内的点
+扩散 max(0, 4 - 距离) 的影响力，黑为正、白为负。前端在JS里逐点四重循环，
+这里把卷积核的每个偏移量当作一次整盘平移相加，(N, size, size) 的批次一起计算。
+
+需要 pip install numpy
+"""
+
+import numpy as np
+
+INFLUENCE_RADIUS = 3
+OWNERSHIP_SCALE = 4.0  # 影响力换算为归属度的缩放系数
+
+
+def _kernel_offsets(radius=INFLUENCE_RADIUS):
+    """卷积核的 (dy, dx, 权重) 列表"""
+    offsets = []
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            distance = abs(dx) + abs(dy)
+            if distance <= radius:
+                offsets.append((dy, dx, radius + 1 - distance))
+    return offsets
+
+
+def influence_map(boards, radius=INFLUENCE_RADIUS):
+    """计算影响力图
+
+    boards 为 (size, size) 或 (N, size, size) 的数组，取值 1 = 黑、-1 = 白、0 = 空，
+    返回同形状的浮点数组。
+    """
+    boards = np.asarray(boards, dtype=np.float32)
+    single = boards.ndim == 2
+    if single:
+        boards = boards[np.newaxis]
+
+    size = boards.shape[-1]
+    padded = np.pad(boards, ((0, 0), (radius, radius), (radius, radius)))
+    influence = np.zeros_like(boards)
+    for dy, dx, weight in _kernel_offsets(radius):
+        # 棋子在 (y, x) 对 (y + dy, x + dx) 的影响 = 输入平移后加权相加
+        influence += weight * padded[:, radius - dy:radius - dy + size, radius - dx:radius - dx + size]
+
+    return influence[0] if single else influence
+
+
+def estimate_ownership(boards, radius=INFLUENCE_RADIUS, scale=OWNERSHIP_SCALE):
+    """估计每个点的归属，范围 [-1, 1]（1 = 黑方，-1 = 白方）
+
+    有子的点归棋子一方，空点按影响力的tanh压缩。
+    """
+    boards = np.asarray(boards, dtype=np.float32)
+    ownership = np.tanh(influence_map(boards, radius) / scale)
+    return np.where(boards != 0, boards, ownership)
+
+
+def estimate_score(ownership, komi=6.5):
+    """按数子法估计黑方领先的目数（已扣除贴目），支持批次"""
+    ownership = np.asarray(ownership)
+    return ownership.sum(axis=(-2, -1)) - komi
+
+
+def territory_counts(ownership, threshold=0.5):
+    """归属度超过阈值的点数 (黑, 白)，用于领地显示"""
+    ownership = np.asarray(ownership)
+    black = int((ownership >= threshold).sum())
+    white = int((ownership <= -threshold).sum())
+    return black, white
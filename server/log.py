@@ -0,0 +1,163 @@
+"""
+结构化日志 - 分级、异步队列输出、逐手调试事件抽样
+
+日志调用只把记录放进队列，由后台线程写到标准输出，请求线程不等待IO。
+每条日志是一句固定的消息加上若干字段（key=value，或 LOG_FORMAT=json 时一行JSON），
+级别不够时直接返回，不会格式化字段。逐手、逐条GTP命令这类高频调试事件用 sampled()，
+即使打开DEBUG也只输出每N条中的一条。
+
+各模块使用 get_logger('gtp') 这样的短名字，级别可以在运行时单独调整：
+set_level('gtp', 'DEBUG')，或 PUT /api/log-level。
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+ROOT_LOGGER = 'goserver'
+
+_listener = None
+_lock = threading.Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = getattr(record, 'fields', None) or {}
+        module = record.name[len(ROOT_LOGGER) + 1:] or ROOT_LOGGER
+        if self.json_lines:
+            entry = {
+                'time': round(record.created, 3),
+                'level': record.levelname,
+                'module': module,
+                'message': record.getMessage(),
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        timestamp = time.strftime('%H:%M:%S', time.localtime(record.created))
+        line = f"{timestamp} {record.levelname:<7} {module}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class StructuredLogger:
+    """logging.Logger 的薄包装：消息 + 关键字字段"""
+
+    def __init__(self, name, sample_every=100):
+        self.logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+        self.sample_every = max(1, sample_every)
+        self._sample_count = 0
+
+    def _log(self, level, message, fields, exc_info=False):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, extra={'fields': fields}, exc_info=exc_info)
+
+    def debug(self, message, **fields):
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message, **fields):
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message, **fields):
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message, **fields):
+        self._log(logging.ERROR, message, fields)
+
+    def exception(self, message, **fields):
+        """记录错误和当前异常的调用栈"""
+        self._log(logging.ERROR, message, fields, exc_info=True)
+
+    def sampled(self, message, **fields):
+        """高频调试事件：打开DEBUG时每 sample_every 条输出一条"""
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self._sample_count += 1
+        if self._sample_count % self.sample_every == 1 or self.sample_every == 1:
+            fields['sampled'] = f"1/{self.sample_every}"
+            self.logger.log(logging.DEBUG, message, extra={'fields': fields})
+
+    def is_debug(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+
+_loggers = {}
+_sample_every = 100
+
+
+def get_logger(name):
+    """取得模块日志器（同名返回同一个实例）"""
+    with _lock:
+        if name not in _loggers:
+            _loggers[name] = StructuredLogger(name, _sample_every)
+        return _loggers[name]
+
+
+def configure(level='INFO', module_levels='', json_lines=False, sample_every=100, stream=None):
+    """安装队列日志：level 为默认级别，module_levels 形如 'gtp=DEBUG,routes=WARNING'"""
+    global _listener, _sample_every
+    with _lock:
+        _sample_every = max(1, sample_every)
+        for logger in _loggers.values():
+            logger.sample_every = _sample_every
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(_level(level))
+    root.propagate = False
+
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(StructuredFormatter(json_lines))
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        atexit.register(shutdown)
+
+    for entry in filter(None, (part.strip() for part in module_levels.split(','))):
+        name, _, module_level = entry.partition('=')
+        set_level(name.strip(), module_level.strip())
+
+
+def shutdown():
+    """把队列中剩余的日志写完"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _level(level):
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"无效的日志级别: {level}")
+    return value
+
+
+def set_level(module, level):
+    """运行时调整某个模块（或 '' 表示全部）的日志级别"""
+    name = f"{ROOT_LOGGER}.{module}" if module else ROOT_LOGGER
+    logging.getLogger(name).setLevel(_level(level))
+
+
+def levels():
+    """当前默认级别和单独设置过的模块级别"""
+    result = {'': logging.getLevelName(logging.getLogger(ROOT_LOGGER).level)}
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        if name.startswith(ROOT_LOGGER + '.') and isinstance(logger, logging.Logger) and logger.level:
+            result[name[len(ROOT_LOGGER) + 1:]] = logging.getLevelName(logger.level)
+    return result
@@ -0,0 +1,317 @@
+"""
+内置蒙特卡洛树搜索引擎 - 没有安装KataGo时的后备引擎
+
+UCT树搜索 + 随机对局（不填自己的眼），在 server/board.py 的棋盘上落子和撤销。
+每个请求有模拟次数（maxVisits）和时间（maxTime）两个预算，先到者为准，
+因此延迟是可预期的。多个工作进程各自独立搜索（根并行），最后合并根节点统计。
+
+接口与KataGoEngine.analyze_position一致，返回 {"moveInfos": [...]}，胜率为黑方视角。
+"""
+
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from server.board import BLACK, EMPTY, Board, IllegalMove
+from server.coords import coord_to_gtp, request_moves
+from server.log import get_logger
+
+UCT_EXPLORATION = 1.0
+RANDOM_TRIES = 8
+PASS = -1
+
+log = get_logger('mcts')
+
+
+class Node:
+    __slots__ = ('move', 'color', 'parent', 'children', 'untried', 'visits', 'wins', 'score_sum')
+
+    def __init__(self, move, color, parent, untried):
+        self.move = move          # 落子点下标，PASS 表示停一手
+        self.color = color        # 走出这一手的一方（根节点为None）
+        self.parent = parent
+        self.children = []
+        self.untried = untried    # 尚未展开的候选点
+        self.visits = 0
+        self.wins = 0.0           # 以走出这一手的一方计的胜局数
+        self.score_sum = 0.0      # 黑方视角的终局目差之和
+
+    def select_child(self):
+        log_visits = math.log(self.visits)
+        return max(
+            self.children,
+            key=lambda c: c.wins / c.visits + UCT_EXPLORATION * math.sqrt(log_visits / c.visits)
+        )
+
+
+def candidate_moves(board, color):
+    """可以考虑的着法：空点中不填自己眼的点（合法性在落子时检查）"""
+    return [
+        index for index, value in enumerate(board.cells)
+        if value == EMPTY and index != board.ko and not board.is_eye(index, color)
+    ]
+
+
+def _play(board, index, color):
+    """按下标落子，非法返回False"""
+    if index == PASS:
+        board.pass_move()
+        return True
+    try:
+        board.play(index % board.size, index // board.size, color)
+        return True
+    except IllegalMove:
+        return False
+
+
+def rollout(board, rng, max_moves):
+    """从当前局面随机下到双方连续停一手，返回已下的手数（调用方负责撤销）"""
+    played = 0
+    passes = 0
+    cells = board.cells
+    points = len(cells)
+    while passes < 2 and played < max_moves:
+        color = board.to_move
+        # 先随机抽几个点试一试（空点多时几乎总能命中），都不行再打乱全部空点逐个尝试
+        for _ in range(RANDOM_TRIES):
+            index = rng.randrange(points)
+            if (cells[index] == EMPTY and index != board.ko
+                    and not board.is_eye(index, color) and _play(board, index, color)):
+                break
+        else:
+            empties = [i for i, value in enumerate(cells) if value == EMPTY]
+            rng.shuffle(empties)
+            for index in empties:
+                if index != board.ko and not board.is_eye(index, color) and _play(board, index, color):
+                    break
+            else:
+                board.pass_move()
+                passes += 1
+                played += 1
+                continue
+        passes = 0
+        played += 1
+    return played
+
+
+class MCTSSearch:
+    """一棵搜索树，可以分多次调用run继续搜索"""
+
+    def __init__(self, board, komi, seed=None):
+        self.board = board
+        self.komi = komi
+        self.rng = random.Random(seed)
+        self.max_rollout = board.size * board.size * 2
+        self.root = Node(None, None, None, candidate_moves(board, board.to_move))
+        self.rng.shuffle(self.root.untried)
+
+    def run(self, playouts, deadline=None):
+        """执行最多playouts次模拟，超过deadline（time.monotonic）提前停止，返回实际次数"""
+        board = self.board
+        done = 0
+        while done < playouts:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            node = self.root
+            depth = 0
+
+            # 选择：沿UCT值最大的子节点向下，直到还有未展开的候选点
+            while not node.untried and node.children:
+                node = node.select_child()
+                _play(board, node.move, node.color)
+                depth += 1
+
+            # 展开：取一个合法的未展开着法；都不合法时停一手
+            color = board.to_move
+            while node.untried:
+                move = node.untried.pop()
+                if _play(board, move, color):
+                    break
+            else:
+                move = PASS if not node.children else None
+                if move == PASS:
+                    board.pass_move()
+            if move is not None:
+                untried = candidate_moves(board, board.to_move) if move != PASS else []
+                self.rng.shuffle(untried)
+                child = Node(move, color, node, untried)
+                node.children.append(child)
+                node = child
+                depth += 1
+
+            # 模拟，然后撤销到根局面
+            played = rollout(board, self.rng, self.max_rollout)
+            score = board.area_score(self.komi)
+            for _ in range(played + depth):
+                board.undo()
+
+            # 回传
+            black_wins = 1.0 if score > 0 else 0.0
+            while node is not None:
+                node.visits += 1
+                node.score_sum += score
+                if node.color is not None:
+                    node.wins += black_wins if node.color == BLACK else 1.0 - black_wins
+                node = node.parent
+            done += 1
+        return done
+
+    def root_stats(self):
+        """根节点各子节点的 {着法: [访问数, 胜局数, 目差和]}"""
+        return {
+            child.move: [child.visits, child.wins, child.score_sum]
+            for child in self.root.children
+        }
+
+
+def search_worker(board_size, moves, komi, playouts, time_limit, seed):
+    """工作进程入口：独立搜索一棵树，返回根节点统计"""
+    board = Board.from_moves(board_size, moves)
+    search = MCTSSearch(board, komi, seed)
+    search.run(playouts, time.monotonic() + time_limit)
+    return search.root_stats()
+
+
+class MCTSEngine:
+    def __init__(self, workers=1, time_limit=5.0):
+        self.workers = max(1, workers)
+        self.time_limit = time_limit
+        self._executor = None
+
+        # 统计数据
+        self._searches = 0
+        self._playouts = 0
+
+    def start(self):
+        """预先启动工作进程，避免第一个请求等待进程启动"""
+        if self.workers > 1:
+            futures = [
+                self._pool().submit(search_worker, 9, [], 0.0, 1, 1.0, seed)
+                for seed in range(self.workers)
+            ]
+            for future in futures:
+                future.result()
+        return True
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def is_alive(self):
+        return True
+
+    def _pool(self):
+        # spawn启动的工作进程不继承服务器的线程和引擎进程
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _budget(self, request_data):
+        playouts = int(request_data.get('maxVisits', 400))
+        time_limit = float(request_data.get('maxTime', self.time_limit))
+        return playouts, time_limit
+
+    def _position(self, request_data):
+        board_size = request_data.get('boardSize', 19)
+        moves = request_moves(request_data)
+        komi = float(request_data.get('komi', 6.5))
+        return board_size, moves, komi
+
+    def convert_stats(self, stats, board_size, to_move, moves=10):
+        """把根节点统计转换为与KataGo相同的结果格式（黑方视角）"""
+        move_infos = []
+        for move, (visits, wins, score_sum) in sorted(stats.items(), key=lambda item: -item[1][0]):
+            if move == PASS or not visits:
+                continue
+            x, y = move % board_size, move // board_size
+            winrate = wins / visits
+            if to_move != BLACK:
+                winrate = 1.0 - winrate
+            move_infos.append({
+                "move": coord_to_gtp(x, y, board_size),
+                "x": x,
+                "y": y,
+                "visits": visits,
+                "winrate": round(winrate, 4),
+                "scoreLead": round(score_sum / visits, 2),
+                "scoreMean": round(score_sum / visits, 2)
+            })
+            if len(move_infos) >= moves:
+                break
+
+        if not move_infos:
+            return None
+        return {"moveInfos": move_infos}
+
+    def analyze_position(self, request_data, moves=10):
+        """搜索局面并返回候选着法；工作进程多于一个时根并行"""
+        board_size, move_list, komi = self._position(request_data)
+        try:
+            board = Board.from_moves(board_size, move_list)
+        except IllegalMove as e:
+            log.warning("着法非法", error=e)
+            return None
+        playouts, time_limit = self._budget(request_data)
+
+        start = time.monotonic()
+        if self.workers == 1:
+            search = MCTSSearch(board, komi)
+            search.run(playouts, start + time_limit)
+            stats = search.root_stats()
+        else:
+            share = -(-playouts // self.workers)
+            futures = [
+                self._pool().submit(search_worker, board_size, move_list, komi, share, time_limit, seed)
+                for seed in range(self.workers)
+            ]
+            stats = {}
+            for future in futures:
+                for move, values in future.result().items():
+                    merged = stats.setdefault(move, [0, 0.0, 0.0])
+                    for i, value in enumerate(values):
+                        merged[i] += value
+
+        total = sum(values[0] for values in stats.values())
+        self._searches += 1
+        self._playouts += total
+        log.debug("MCTS搜索完成", playouts=total, seconds=round(time.monotonic() - start, 2))
+        result = self.convert_stats(stats, board_size, board.to_move, moves)
+        if result:
+            result['visits'] = total
+        return result
+
+    def analyze_stream(self, request_data, interval=0.1, max_duration=30.0, moves=10):
+        """流式搜索：每隔interval秒产出一次当前结果，最后产出最终结果"""
+        board_size, move_list, komi = self._position(request_data)
+        try:
+            board = Board.from_moves(board_size, move_list)
+        except IllegalMove as e:
+            log.warning("着法非法", error=e)
+            return
+        playouts, time_limit = self._budget(request_data)
+        deadline = time.monotonic() + min(time_limit, max_duration)
+
+        search = MCTSSearch(board, komi)
+        done = 0
+        while done < playouts and time.monotonic() < deadline:
+            done += search.run(playouts - done, min(deadline, time.monotonic() + interval))
+            result = self.convert_stats(search.root_stats(), board_size, board.to_move, moves)
+            if result:
+                yield result
+        self._searches += 1
+        self._playouts += done
+
+    def metrics(self):
+        """返回后备引擎运行指标"""
+        return {
+            'workers': self.workers,
+            'timeLimit': self.time_limit,
+            'searches': self._searches,
+            'playouts': self._playouts,
+        }
@@ -0,0 +1,162 @@
+"""
+开局库 - 内存映射的局面哈希索引
+
+由 tools/build-opening-book.py 从SGF棋谱离线生成，服务器只读。局面按8种对称变换
+规范化（server.symmetry），同形的局面只保存一次；每个局面记录棋谱中下一手的
+着法、出现次数、黑方胜率和平均目差（来自棋谱结果）。
+
+文件格式（小端）：
+    文件头  magic(8) version(u32) 槽数(u32) 局面数(u32) 着法数(u32) 最大手数(u32) 保留(u32)
+    槽      键(u64) 首个着法序号(u32) 着法数(u16) 保留(u16)，键为0表示空槽，线性探测
+    着法    点下标(u16，规范方向) 保留(u16) 次数(u32) 黑方胜率(f32) 黑方目差(f32)
+查询只用mmap按偏移读取几个槽，不把文件读进内存，多个进程共享同一份页缓存。
+"""
+
+import mmap
+import os
+import struct
+import threading
+
+from server.board import BLACK, Board, IllegalMove
+from server.symmetry import canonical_hash, inverse_table
+
+MAGIC = b"GOBOOK\x00\x01"
+VERSION = 1
+HEADER = struct.Struct("<8s6I")
+SLOT = struct.Struct("<QIHH")
+MOVE = struct.Struct("<HHIff")
+
+_MASK64 = (1 << 64) - 1
+
+
+def book_key(board):
+    """局面的规范键和所用的对称变换 (key, t)：规范哈希混入棋盘大小和轮到谁下"""
+    value, t = canonical_hash(board)
+    value ^= (board.size * 0x9E3779B97F4A7C15) & _MASK64
+    if board.to_move != BLACK:
+        value ^= 0xD6E8FEB86659FD93
+    return (value or 1), t
+
+
+def write_book(path, positions, max_moves):
+    """写入开局库：positions 为 {键: [(规范点下标, 次数, 黑方胜率, 黑方目差), ...]}"""
+    slot_count = 1
+    while slot_count < len(positions) * 2:
+        slot_count *= 2
+
+    slots = [None] * slot_count
+    move_records = []
+    for key, moves in positions.items():
+        index = key & (slot_count - 1)
+        while slots[index] is not None:
+            index = (index + 1) & (slot_count - 1)
+        slots[index] = (key, len(move_records), len(moves))
+        move_records.extend(moves)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, slot_count, len(positions), len(move_records), max_moves, 0))
+        empty = SLOT.pack(0, 0, 0, 0)
+        for slot in slots:
+            f.write(SLOT.pack(slot[0], slot[1], slot[2], 0) if slot else empty)
+        for point, count, winrate, score_lead in move_records:
+            f.write(MOVE.pack(point, 0, count, winrate, score_lead))
+    os.replace(temp_path, path)
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._map = None
+        self._mtime = None
+        self.slot_count = 0
+        self.positions = 0
+        self.max_moves = 0
+
+        # 统计数据
+        self._lookups = 0
+        self._hits = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _open(self):
+        """打开（或文件被重新生成后重新打开）内存映射，文件不存在返回None"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return None
+        if self._map is not None and mtime == self._mtime:
+            return self._map
+
+        with self._lock:
+            if self._map is not None and mtime == self._mtime:
+                return self._map
+            with open(self.path, "rb") as f:
+                book_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, slot_count, positions, _, max_moves, _ = HEADER.unpack_from(book_map, 0)
+            if magic != MAGIC or version != VERSION:
+                book_map.close()
+                raise ValueError(f"不是开局库文件或版本不符: {self.path}")
+            self.slot_count, self.positions, self.max_moves = slot_count, positions, max_moves
+            self._map, self._mtime = book_map, mtime
+            return book_map
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def lookup(self, board_size, moves):
+        """查找 [(x, y), ...] 之后的局面，返回按次数降序的
+        [{'x', 'y', 'count', 'winrate', 'scoreLead'}, ...]（请求方向、黑方视角），不在库中返回None
+        """
+        book_map = self._open()
+        if book_map is None or len(moves) > self.max_moves:
+            return None
+        try:
+            board = Board.from_moves(board_size, moves)
+        except IllegalMove:
+            return None
+
+        self._lookups += 1
+        key, t = book_key(board)
+        mask = self.slot_count - 1
+        slots_offset = HEADER.size
+        moves_offset = slots_offset + self.slot_count * SLOT.size
+        index = key & mask
+        while True:
+            slot_key, first, count, _ = SLOT.unpack_from(book_map, slots_offset + index * SLOT.size)
+            if slot_key == 0:
+                return None
+            if slot_key == key:
+                break
+            index = (index + 1) & mask
+
+        self._hits += 1
+        inverse = inverse_table(board_size)[t]
+        entries = []
+        for i in range(first, first + count):
+            point, _, times, winrate, score_lead = MOVE.unpack_from(book_map, moves_offset + i * MOVE.size)
+            original = inverse[point]
+            entries.append({
+                'x': original % board_size,
+                'y': original // board_size,
+                'count': times,
+                'winrate': winrate,
+                'scoreLead': score_lead,
+            })
+        return entries
+
+    def metrics(self):
+        """返回开局库指标"""
+        return {
+            'loaded': self._map is not None,
+            'positions': self.positions,
+            'maxMoves': self.max_moves,
+            'lookups': self._lookups,
+            'hits': self._hits,
+        }
+
@@ -0,0 +1,108 @@
+"""
+后台预读（pondering）- 对方思考期间预先分析接下来最可能出现的局面
+
+/api/katago/analyze 返回AI的着法后，引擎在人类思考期间本来是空闲的：预读任务
+在后台线程中继续分析AI落子后的局面，再依次分析其中最可能的几种应手之后的局面，
+结果按会话保存一小段时间。人类的着法命中预读过的分支时，下一个请求直接返回。
+
+同一会话的分析请求到达时调用 cancel(session)，这个会话的预读在下一次中间结果时停止
+并归还引擎；其他会话的预读由调用方在引擎池有请求排队时自行让出。只有完整搜索完的
+局面才会保存，被取消或超时的半截结果直接丢弃。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from server.log import get_logger
+
+log = get_logger('ponder')
+
+
+class Ponderer:
+    def __init__(self, ttl=120.0, max_sessions=256):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+
+        self._results = OrderedDict()  # 会话 -> {缓存键: (过期时间, 结果)}
+        self._tasks = {}  # 会话 -> 取消事件
+        self._lock = threading.Lock()
+
+        # 统计数据
+        self._started = 0
+        self._cancelled = 0
+        self._positions = 0
+        self._lookups = 0
+        self._hits = 0
+
+    def start(self, session, task):
+        """在后台线程中运行 task(cancelled, store)：cancelled 为取消事件，
+        store(key, result) 保存一个预读结果。同一会话之前的预读先取消，结果清空。"""
+        cancelled = threading.Event()
+        with self._lock:
+            previous = self._tasks.get(session)
+            if previous is not None:
+                previous.set()
+            self._tasks[session] = cancelled
+            self._results.pop(session, None)
+            self._started += 1
+
+        def run():
+            try:
+                task(cancelled, lambda key, result: self._store(session, key, result))
+            except Exception:
+                log.exception("预读失败", session=session)
+            finally:
+                with self._lock:
+                    if self._tasks.get(session) is cancelled:
+                        del self._tasks[session]
+
+        threading.Thread(target=run, name=f"ponder-{session}", daemon=True).start()
+
+    def cancel(self, session=None):
+        """取消一个会话正在进行的预读，session为None时取消全部（已经保存的结果保留）"""
+        with self._lock:
+            if session is None:
+                tasks = list(self._tasks.values())
+            else:
+                tasks = [self._tasks[session]] if session in self._tasks else []
+            for cancelled in tasks:
+                if not cancelled.is_set():
+                    cancelled.set()
+                    self._cancelled += 1
+
+    def _store(self, session, key, result):
+        if key is None or result is None:
+            return
+        with self._lock:
+            entries = self._results.setdefault(session, {})
+            entries[key] = (time.monotonic() + self.ttl, result)
+            self._results.move_to_end(session)
+            while len(self._results) > self.max_sessions:
+                self._results.popitem(last=False)
+            self._positions += 1
+
+    def get(self, session, key):
+        """取会话预读过的结果，没有或已过期返回None"""
+        if key is None:
+            return None
+        with self._lock:
+            self._lookups += 1
+            entry = self._results.get(session, {}).get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self._hits += 1
+            return entry[1]
+
+    def metrics(self):
+        """返回预读指标"""
+        with self._lock:
+            return {
+                'active': sum(1 for cancelled in self._tasks.values() if not cancelled.is_set()),
+                'sessions': len(self._results),
+                'started': self._started,
+                'cancelled': self._cancelled,
+                'positions': self._positions,
+                'lookups': self._lookups,
+                'hits': self._hits,
+            }
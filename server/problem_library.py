@@ -0,0 +1,157 @@
+"""
+死活题库 - SQLite存储的预生成题目
+
+由 tools/build-tsumego-library.py 离线生成，服务器只读。每道题保存为一行JSON，
+按 (棋盘大小, 难度, 标签) 建索引。同一组内的题目有连续的序号 seq，各组题数单独保存，
+随机取题先按各组题数选组、再按序号直接定位；分页用 id 作为游标，都不需要扫表。
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+
+from server.tsumego import DIFFICULTY_LEVELS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS problems (
+    id INTEGER PRIMARY KEY,
+    problem_id TEXT NOT NULL UNIQUE,
+    board_size INTEGER NOT NULL,
+    difficulty INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    nodes INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS problems_group ON problems (board_size, difficulty, tag, seq);
+CREATE INDEX IF NOT EXISTS problems_page ON problems (board_size, difficulty, tag, id);
+CREATE TABLE IF NOT EXISTS problem_groups (
+    board_size INTEGER NOT NULL,
+    difficulty INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (board_size, difficulty, tag)
+);
+"""
+
+
+def difficulty_value(difficulty):
+    """难度参数可以是名称（easy/medium/hard）或数字，未指定时返回None"""
+    if difficulty in (None, ''):
+        return None
+    for name, value, _ in DIFFICULTY_LEVELS:
+        if str(difficulty) in (name, str(value)):
+            return value
+    raise ValueError(f"无效的难度: {difficulty}")
+
+
+class ProblemLibrary:
+    def __init__(self, path, readonly=True):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        if not readonly:
+            self._connection().executescript(SCHEMA)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _connection(self):
+        # sqlite连接不能跨线程使用，每个线程一个
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self.readonly:
+                connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                connection = sqlite3.connect(self.path)
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def add(self, problems):
+        """批量写入题目，已存在的题目（相同problem_id）跳过，返回新增数"""
+        connection = self._connection()
+        added = 0
+        with connection:
+            for problem in problems:
+                board_size = problem['boardSize']
+                difficulty = problem['difficulty']
+                tag = problem.get('tags', ['generated'])[0]
+                group = (board_size, difficulty, tag)
+                row = connection.execute(
+                    "SELECT count FROM problem_groups WHERE board_size = ? AND difficulty = ? AND tag = ?", group
+                ).fetchone()
+                seq = row[0] if row else 0
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO problems (problem_id, board_size, difficulty, tag, seq, nodes, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (problem['id'], board_size, difficulty, tag, seq,
+                     problem.get('rating', {}).get('nodes', 0),
+                     json.dumps(problem, ensure_ascii=False, separators=(',', ':')))
+                )
+                if cursor.rowcount:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO problem_groups (board_size, difficulty, tag, count) VALUES (?, ?, ?, ?)",
+                        group + (seq + 1,)
+                    )
+                    added += 1
+        return added
+
+    def _where(self, board_size=None, difficulty=None, tag=None):
+        clauses, params = [], []
+        for column, value in (('board_size', board_size), ('difficulty', difficulty), ('tag', tag)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def groups(self, board_size=None, difficulty=None, tag=None):
+        """各组的题数 [(棋盘大小, 难度, 标签, 题数)]"""
+        where, params = self._where(board_size, difficulty, tag)
+        return self._connection().execute(
+            f"SELECT board_size, difficulty, tag, count FROM problem_groups{where} "
+            "ORDER BY board_size, difficulty, tag", params
+        ).fetchall()
+
+    def count(self, board_size=None, difficulty=None, tag=None):
+        return sum(group[3] for group in self.groups(board_size, difficulty, tag))
+
+    def page(self, board_size=None, difficulty=None, tag=None, cursor=0, limit=20):
+        """从游标之后取一页，返回 (题目列表, 下一页游标或None)"""
+        where, params = self._where(board_size, difficulty, tag)
+        where = (where + " AND" if where else " WHERE") + " id > ?"
+        rows = self._connection().execute(
+            f"SELECT id, data FROM problems{where} ORDER BY id LIMIT ?", params + [cursor, limit]
+        ).fetchall()
+        next_cursor = rows[-1][0] if len(rows) == limit else None
+        return [json.loads(data) for _, data in rows], next_cursor
+
+    def get(self, problem_id):
+        row = self._connection().execute(
+            "SELECT data FROM problems WHERE problem_id = ?", (problem_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def random(self, board_size=None, difficulty=None, tag=None, rng=random):
+        """随机取一道题：按题数加权选组，再按组内序号定位"""
+        groups = self.groups(board_size, difficulty, tag)
+        total = sum(group[3] for group in groups)
+        if not total:
+            return None
+        pick = rng.randrange(total)
+        for group_size, group_difficulty, group_tag, count in groups:
+            if pick < count:
+                break
+            pick -= count
+        row = self._connection().execute(
+            "SELECT data FROM problems WHERE board_size = ? AND difficulty = ? AND tag = ? AND seq = ?",
+            (group_size, group_difficulty, group_tag, pick)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
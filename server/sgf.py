@@ -0,0 +1,386 @@
+"""
+SGF棋谱读写 - 流式解析多局棋谱文件（含变化），写出带注释的棋谱
+
+iter_games() 按块读取文本流，每读完一局就产出这局的根节点（SGFNode树），
+整个棋谱集合不会一次读进内存；game_record() 取一局的主线（每个分支的第一个变化），
+variations() 列出从根到每个叶子的全部变化。write_tree() 逐个节点写出一局棋，
+game_tree() 由着法列表和每手的注释构造要写出的树。
+
+坐标与前端 coordinateToSGF 一致：两个小写字母，第一个是x，第二个是y。
+着法为 [{'x', 'y', 'color'}, ...]；game_record() 的主线保留停一手（x、y 为None），
+分析请求只接受黑先交替、没有停一手的着法（alternating_prefix）。
+"""
+
+import io
+import os
+import re
+
+SGF_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+# 每次从文本流读取的字符数
+CHUNK_SIZE = 1 << 16
+
+_TOKEN = re.compile(r"\s*(?:([();])|([A-Za-z]+)|\[((?:\\.|[^\]\\])*)\])", re.S)
+_SOFT_BREAK = re.compile(r"\\\r?\n")
+_ESCAPED = re.compile(r"\\(.)", re.S)
+
+
+class SGFError(ValueError):
+    """SGF内容无法解析"""
+
+
+class SGFNode:
+    """一个节点：properties 为 {属性名: [值, ...]}，children 的第一个为主线"""
+
+    __slots__ = ('properties', 'children')
+
+    def __init__(self, properties=None):
+        self.properties = properties if properties is not None else {}
+        self.children = []
+
+    def get(self, name, default=None):
+        values = self.properties.get(name)
+        return values[0] if values else default
+
+
+def _chunks(source):
+    if isinstance(source, str):
+        yield source
+        return
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _tokens(source):
+    """词法分析：产出 ('(' | ')' | ';' | 'name' | 'value', 值)，棋谱之外的文字跳过"""
+    chunks = _chunks(source)
+    buffer = ""
+    pos = 0
+    depth = 0
+    eof = False
+    while True:
+        if depth == 0:
+            start = buffer.find("(", pos)
+            if start < 0:
+                buffer, pos = "", 0
+                if eof:
+                    return
+                chunk = next(chunks, None)
+                if chunk is None:
+                    eof = True
+                else:
+                    buffer = chunk
+                continue
+            pos = start
+
+        match = _TOKEN.match(buffer, pos)
+        # 属性名或属性值可能被块边界截断，读入下一块再匹配
+        if match is None or (match.end() == len(buffer) and not eof):
+            if eof:
+                rest = buffer[pos:].strip()
+                if rest:
+                    raise SGFError(f"无法解析: {rest[:20]!r}")
+                return
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        pos = match.end()
+        punct, name, value = match.groups()
+        if punct:
+            if punct == "(":
+                depth += 1
+            elif punct == ")":
+                depth -= 1
+            yield punct, None
+        elif name:
+            yield 'name', name
+        else:
+            yield 'value', value
+
+
+def _unescape(value):
+    if "\\" not in value:
+        return value
+    return _ESCAPED.sub(r"\1", _SOFT_BREAK.sub("", value))
+
+
+def iter_games(source):
+    """逐局产出棋谱集合（字符串或文本流）中每局棋的根节点，只在内存中保留当前这一局"""
+    stack = []  # 每个 '(' 处的父节点，')' 时回到那里
+    current = None
+    root = None
+    name = None
+    for kind, value in _tokens(source):
+        if kind == "(":
+            stack.append(current)
+        elif kind == ")":
+            current = stack.pop()
+            if not stack:
+                if root is not None:
+                    yield root
+                root = current = None
+        elif kind == ";":
+            node = SGFNode()
+            if current is not None:
+                current.children.append(node)
+            elif root is None:
+                root = node
+            else:
+                raise SGFError("一局棋只能有一个根节点")
+            current = node
+            name = None
+        elif kind == 'name':
+            if current is None:
+                raise SGFError(f"属性 {value} 不在节点中")
+            name = value.upper()
+        else:
+            if name is None:
+                raise SGFError("属性值缺少属性名")
+            current.properties.setdefault(name, []).append(_unescape(value))
+    if stack:
+        raise SGFError("SGF不完整：缺少 ')'")
+
+
+def sgf_to_coord(value, board_size):
+    """SGF坐标 'pd' -> (x, y)，停一手（空或 'tt'）返回 (None, None)"""
+    value = value.strip()
+    if len(value) != 2 or (value == "tt" and board_size <= 19):
+        return None, None
+    x, y = SGF_LETTERS.find(value[0]), SGF_LETTERS.find(value[1])
+    if not (0 <= x < board_size and 0 <= y < board_size):
+        raise SGFError(f"坐标 '{value}' 超出 {board_size}x{board_size} 棋盘")
+    return x, y
+
+
+def coord_to_sgf(x, y):
+    """(x, y) -> SGF坐标 'pd'"""
+    return SGF_LETTERS[x] + SGF_LETTERS[y]
+
+
+def _points(value, board_size):
+    """摆子属性的值：单个点 'dd' 或压缩的矩形 'aa:cc'"""
+    if ":" not in value:
+        x, y = sgf_to_coord(value, board_size)
+        return [] if x is None else [(x, y)]
+    first, last = value.split(":", 1)
+    x1, y1 = sgf_to_coord(first, board_size)
+    x2, y2 = sgf_to_coord(last, board_size)
+    if x1 is None or x2 is None:
+        raise SGFError(f"无效的矩形 [{value}]")
+    return [(x, y) for y in range(min(y1, y2), max(y1, y2) + 1) for x in range(min(x1, x2), max(x1, x2) + 1)]
+
+
+def board_size_of(root):
+    value = root.get("SZ", "19")
+    try:
+        return int(value.split(":")[0])
+    except ValueError:
+        raise SGFError(f"无效的棋盘大小 SZ[{value}]")
+
+
+def node_moves(node, board_size, passes=False):
+    """节点上的着法 [{'x', 'y', 'color'}]；停一手跳过，passes 为真时保留（x、y 为None）"""
+    moves = []
+    for color in ("B", "W"):
+        for value in node.properties.get(color, ()):
+            x, y = sgf_to_coord(value, board_size)
+            if x is not None or passes:
+                moves.append({'x': x, 'y': y, 'color': color})
+    return moves
+
+
+def alternating_prefix(moves):
+    """从第一手起黑先交替、没有停一手的着法数：之后的局面下一手颜色无法只由手数推出"""
+    for i, move in enumerate(moves):
+        if move['x'] is None or move['color'] != ("B" if i % 2 == 0 else "W"):
+            return i
+    return len(moves)
+
+
+def main_line(root):
+    """主线上的节点：每个分支取第一个变化"""
+    node = root
+    while node is not None:
+        yield node
+        node = node.children[0] if node.children else None
+
+
+def game_record(root):
+    """一局棋的主线，返回 {'boardSize', 'komi', 'result', 'setup', 'moves'}
+
+    setup 为根节点上摆放的棋子（AB/AW，如让子）[{'x', 'y', 'color'}, ...]；
+    moves 包含停一手（x、y 为None）。
+    """
+    board_size = board_size_of(root)
+    komi = root.get("KM")
+    if komi is not None:
+        try:
+            komi = float(komi)
+        except ValueError:
+            raise SGFError(f"无效的贴目 KM[{komi}]")
+    setup = [
+        {'x': x, 'y': y, 'color': color[1]}
+        for color in ("AB", "AW")
+        for value in root.properties.get(color, ())
+        for x, y in _points(value, board_size)
+    ]
+    moves = []
+    for node in main_line(root):
+        moves.extend(node_moves(node, board_size, passes=True))
+    return {
+        'boardSize': board_size,
+        'komi': komi,
+        'result': (root.get("RE") or "").strip() or None,
+        'setup': setup,
+        'moves': moves,
+    }
+
+
+def variations(root):
+    """从根到每个叶子的着法序列，深度优先、主线在前"""
+    board_size = board_size_of(root)
+    path = []
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        del path[depth:]
+        path.extend(node_moves(node, board_size))
+        if not node.children:
+            yield list(path)
+        for child in reversed(node.children):
+            stack.append((child, len(path)))
+
+
+def sgf_files(paths):
+    """展开目录，列出全部 .sgf 文件"""
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith('.sgf'):
+                        yield os.path.join(directory, name)
+        else:
+            yield path
+
+
+def parse_sgf(text):
+    """解析SGF中第一局棋的主线，返回 {'boardSize', 'komi', 'result', 'setup', 'moves'}"""
+    for root in iter_games(text):
+        return game_record(root)
+    raise SGFError("不是SGF棋谱：缺少 '('")
+
+
+def sgf_escape(text):
+    return str(text).replace("\\", "\\\\").replace("]", "\\]")
+
+
+def _write_node(out, node):
+    out.write(";")
+    for name, values in node.properties.items():
+        out.write(name)
+        for value in values:
+            out.write(f"[{sgf_escape(value)}]")
+
+
+def write_tree(out, root):
+    """把一局棋写入文本流：主线逐个节点写出，只在分支处嵌套括号"""
+    out.write("(")
+    node = root
+    _write_node(out, node)
+    while len(node.children) == 1:
+        node = node.children[0]
+        _write_node(out, node)
+    for child in node.children:
+        write_tree(out, child)
+    out.write(")")
+
+
+def game_tree(board_size, moves, komi=None, result=None, properties=None, annotations=None):
+    """由着法列表构造一局棋：moves 为 [{'x', 'y'[, 'color']}] 或 [(x, y)]（黑先交替），
+    properties 为根节点的附加属性，annotations 为 {手数: {属性: 值}}（0为根节点，如 C 注释、BM 恶手）"""
+    root = SGFNode({"GM": ["1"], "FF": ["4"], "CA": ["UTF-8"], "SZ": [str(board_size)]})
+    if komi is not None:
+        root.properties["KM"] = [f"{float(komi):g}"]
+    if result:
+        root.properties["RE"] = [result]
+    for name, value in (properties or {}).items():
+        root.properties[name] = [value]
+
+    annotations = annotations or {}
+    node = root
+    for number, move in enumerate(moves, 1):
+        if isinstance(move, dict):
+            x, y, color = move['x'], move['y'], move.get('color')
+        else:
+            x, y = move
+            color = None
+        child = SGFNode({color or ("B" if number % 2 else "W"): [coord_to_sgf(x, y)]})
+        node.children.append(child)
+        node = child
+        for name, value in annotations.get(number, {}).items():
+            node.properties[name] = [value]
+    for name, value in annotations.get(0, {}).items():
+        root.properties[name] = [value]
+    return root
+
+
+def dumps_tree(root):
+    """一局棋的SGF文本"""
+    out = io.StringIO()
+    write_tree(out, root)
+    return out.getvalue()
+
+
+def request_from_sgf(data, until_pass=False):
+    """请求中的 sgf 展开为 moves：game 选择棋谱集合中的第几局（从0开始），取主线，
+    moveNumber 只取前几手；棋盘大小、贴目以请求中给出的为准。
+    终局时双方成对的停一手会被去掉；until_pass 时在第一个停一手处截断，
+    截断位置记在 stoppedAtPass（停一手是第几手）。其余停一手或不是黑白交替时抛出SGFError"""
+    if not data.get('sgf') or data.get('moves') or 'movesPacked' in data:
+        return data
+    try:
+        game = int(data.get('game', 0))
+        move_number = None if data.get('moveNumber') is None else int(data['moveNumber'])
+    except (TypeError, ValueError):
+        raise SGFError("game 和 moveNumber 必须是整数")
+
+    for index, root in enumerate(iter_games(data['sgf'])):
+        if index == game:
+            record = game_record(root)
+            break
+    else:
+        raise SGFError(f"棋谱中没有第 {game} 局")
+    if record['setup']:
+        raise SGFError("不支持带摆子（AB/AW）的棋谱，让子请改为着法")
+
+    moves = record['moves'] if move_number is None else record['moves'][:move_number]
+    # 成对的停一手不改变轮到谁下，终局的 B[];W[] 直接去掉
+    end = len(moves)
+    while end >= 2 and moves[end - 1]['x'] is None and moves[end - 2]['x'] is None:
+        end -= 2
+    moves = moves[:end]
+    count = alternating_prefix(moves)
+    stopped = None
+    if count < len(moves):
+        move = moves[count]
+        if until_pass and move['x'] is None:
+            moves, stopped = moves[:count], count + 1
+        else:
+            problem = "停一手" if move['x'] is None else f"是{'黑' if move['color'] == 'B' else '白'}棋，不是黑白交替"
+            raise SGFError(f"第 {count + 1} 手{problem}：只支持黑先交替落子，可以用 moveNumber 只取前 {count} 手")
+
+    data = {key: value for key, value in data.items() if key != 'sgf'}
+    data['moves'] = [(move['x'], move['y']) for move in moves]
+    if stopped is not None:
+        data['stoppedAtPass'] = stopped
+    data.setdefault('boardSize', record['boardSize'])
+    if record['komi'] is not None:
+        data.setdefault('komi', record['komi'])
+    return data
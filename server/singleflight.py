@@ -0,0 +1,70 @@
+"""
+相同请求合并（single-flight）
+
+同一个键同时只执行一次计算：第一个请求负责计算，计算期间到达的相同请求等待
+并共享它的结果（或异常）。计算完成后键立即移除，之后的请求由缓存负责。
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        # 统计数据
+        self._executed = 0
+        self._shared = 0
+
+    def do(self, key, fn):
+        """执行 fn() 并返回结果；相同key正在计算时等待那次计算的结果"""
+        if key is None:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def metrics(self):
+        """返回合并指标"""
+        with self._lock:
+            return {
+                'inFlight': len(self._calls),
+                'executed': self._executed,
+                'shared': self._shared,
+            }
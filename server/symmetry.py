@@ -0,0 +1,152 @@
+"""
+棋盘的8种对称变换（旋转、翻转）和黑白互换
+
+点下标 y*size+x；transform_table(size)[t][index] 是点 index 经过变换 t 后的下标，
+inverse_table 是逆变换。canonical_hash(board) 在8种变换下的Zobrist哈希中取最小值，
+同形的局面得到同一个键，同时返回取到最小值的变换：规范方向上的着法经过
+inverse_table(size)[t] 就回到请求的方向。
+
+canonical_position(board, komi) 还考虑黑白互换（轮到谁下互换、贴目取反）和劫点，
+返回规范键和 Symmetry：缓存、合并请求等按规范键保存规范方向的结果，
+每个请求用自己的 Symmetry.restore() 把结果（着法坐标、黑方胜率和目差）变换回来。
+"""
+
+from functools import lru_cache
+
+from server.board import BLACK
+from server.coords import coord_to_gtp
+
+SYMMETRIES = 8
+
+
+def transform_point(t, x, y, size):
+    """变换 t：bit 2 交换x/y（沿主对角线翻转），bit 0 左右翻转，bit 1 上下翻转"""
+    if t & 4:
+        x, y = y, x
+    if t & 1:
+        x = size - 1 - x
+    if t & 2:
+        y = size - 1 - y
+    return x, y
+
+
+@lru_cache(maxsize=None)
+def transform_table(size):
+    """每种变换下每个点的新下标"""
+    table = []
+    for t in range(SYMMETRIES):
+        mapping = []
+        for index in range(size * size):
+            x, y = transform_point(t, index % size, index // size, size)
+            mapping.append(y * size + x)
+        table.append(tuple(mapping))
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def inverse_table(size):
+    """每种变换的逆变换：inverse_table(size)[t][transform_table(size)[t][i]] == i"""
+    table = []
+    for mapping in transform_table(size):
+        inverse = [0] * len(mapping)
+        for index, target in enumerate(mapping):
+            inverse[target] = index
+        table.append(tuple(inverse))
+    return tuple(table)
+
+
+def symmetric_hashes(board, swap=False):
+    """局面在8种变换下的Zobrist哈希（下标即变换 t，t=0 与 board.hash 相同）；swap 为黑白互换后的局面"""
+    zobrist = board._zobrist
+    black = 1 if swap else 0
+    stones = [(index, black if color == BLACK else 1 - black) for index, color in enumerate(board.cells) if color]
+    hashes = []
+    for mapping in transform_table(board.size):
+        value = 0
+        for index, color in stones:
+            value ^= zobrist[mapping[index]][color]
+        hashes.append(value)
+    return hashes
+
+
+def canonical_hash(board):
+    """8种变换下最小的Zobrist哈希和对应的变换 (hash, t)"""
+    hashes = symmetric_hashes(board)
+    best = min(hashes)
+    return best, hashes.index(best)
+
+
+class Symmetry:
+    """请求方向与规范方向之间的变换：t 为8种对称之一，swap 表示黑白互换"""
+
+    __slots__ = ('size', 't', 'swap')
+
+    def __init__(self, size, t=0, swap=False):
+        self.size = size
+        self.t = t
+        self.swap = swap
+
+    @property
+    def identity(self):
+        return self.t == 0 and not self.swap
+
+    def to_canonical(self, x, y):
+        index = transform_table(self.size)[self.t][y * self.size + x]
+        return index % self.size, index // self.size
+
+    def from_canonical(self, x, y):
+        index = inverse_table(self.size)[self.t][y * self.size + x]
+        return index % self.size, index // self.size
+
+    def canonical_moves(self, moves):
+        """[(x, y), ...] 变换到规范方向"""
+        mapping = transform_table(self.size)[self.t]
+        size = self.size
+        return [(index % size, index // size) for index in (mapping[y * size + x] for x, y in moves)]
+
+    def apply(self, result):
+        """请求方向的分析结果 -> 规范方向"""
+        return self._map_result(result, self.to_canonical)
+
+    def restore(self, result):
+        """规范方向的分析结果 -> 请求方向"""
+        return self._map_result(result, self.from_canonical)
+
+    def _map_result(self, result, map_point):
+        if result is None or self.identity or 'moveInfos' not in result:
+            return result
+        move_infos = []
+        for info in result['moveInfos']:
+            info = dict(info)
+            if info.get('x') is not None and info.get('y') is not None:
+                info['x'], info['y'] = map_point(info['x'], info['y'])
+                info['move'] = coord_to_gtp(info['x'], info['y'], self.size)
+            if self.swap:
+                # 胜率和目差都是黑方视角，黑白互换后取反
+                if 'winrate' in info:
+                    info['winrate'] = 1 - info['winrate']
+                for field in ('scoreLead', 'scoreMean'):
+                    if field in info:
+                        info[field] = -info[field]
+            move_infos.append(info)
+        return dict(result, moveInfos=move_infos)
+
+
+def canonical_position(board, komi):
+    """局面在8种对称和黑白互换下的规范形式 (hash, 轮到谁下, 贴目, 劫点, Symmetry)
+
+    黑白互换时轮到谁下互换、贴目取反；劫点（禁止立即提回的点，没有为-1）随局面一起变换。
+    16种形式中取 (哈希, 轮到谁下, 贴目, 劫点) 最小的一种。
+    """
+    best = None
+    tables = transform_table(board.size)
+    for swap in (False, True):
+        to_move = board.to_move if not swap else -board.to_move
+        variant_komi = -komi if swap else komi
+        for t, value in enumerate(symmetric_hashes(board, swap)):
+            ko = -1 if board.ko is None else tables[t][board.ko]
+            candidate = (value, to_move, variant_komi, ko, t, swap)
+            if best is None or candidate < best:
+                best = candidate
+    value, to_move, variant_komi, ko, t, swap = best
+    return value, to_move, variant_komi, ko, Symmetry(board.size, t, swap)
@@ -0,0 +1,440 @@
+"""
+死活题求解与生成 - 证明数搜索（proof-number search）
+
+求解：在限定区域内搜索，攻方提掉目标棋块即为攻方胜；目标棋块做出两个真眼、
+或双方连续停一手（包括双活）即为守方胜。置换表保存已经证明/否证的局面，
+每次求解有节点预算，超出预算返回 None（未知）。
+
+生成：在角上随机摆出一块被包围的棋，用求解器验证"黑先"有解且不走就不行，
+列出所有正解，并按搜索节点数和变化深度评定难度。题目总是黑先，与前端一致。
+"""
+
+import random
+import time
+
+from server.board import BLACK, EMPTY, WHITE, Board, IllegalMove, zobrist_table
+
+PASS = -1
+INFINITY = 10 ** 9
+
+# 按搜索节点数评定难度：(难度名, 数值难度, 节点数上限)
+DIFFICULTY_LEVELS = (
+    ('easy', 1, 60),
+    ('medium', 2, 600),
+    ('hard', 3, INFINITY),
+)
+
+
+class Node:
+    __slots__ = ('move', 'parent', 'children', 'pn', 'dn', 'is_or', 'depth')
+
+    def __init__(self, move, parent, is_or, depth):
+        self.move = move
+        self.parent = parent
+        self.children = None  # None 表示尚未展开
+        self.pn = 1           # 证明数：证明攻方胜还需要的最少叶子数
+        self.dn = 1           # 否证数
+        self.is_or = is_or    # 攻方行棋的节点
+        self.depth = depth
+
+
+class ProofNumberSolver:
+    """证明数搜索：判断攻方能否提掉 target 所在的棋块"""
+
+    def __init__(self, board, region, target, attacker, node_budget=5000, max_depth=None, table=None):
+        self.board = board
+        self.region = list(region)
+        self.target = target
+        self.attacker = attacker
+        self.defender = -attacker
+        self.node_budget = node_budget
+        self.max_depth = max_depth or len(self.region) * 2 + 4
+        # (局面哈希, 轮到谁, 劫点, 是否刚停一手) -> True/False，同一道题的多次求解可以共用
+        self.table = {} if table is None else table
+        self.nodes = 0
+        self.cutoffs = 0  # 因深度限制判为守方胜的节点数，大于0时结果不可靠
+        self._diagonals = _diagonal_table(board.size)
+
+    def _key(self, to_move, passed):
+        board = self.board
+        return (board.hash, to_move, board.ko, passed)
+
+    def _has_two_eyes(self):
+        """目标棋块是否有两个真眼（单个空点，四周都是该棋块，斜角攻方棋子不超过限度）"""
+        board = self.board
+        cells = board.cells
+        neighbors = board._neighbors
+        defender = self.defender
+        # 先不泛洪，只找四周都是守方棋子的空点，不到两个就不可能有两只眼
+        # 这里是求解的热点：用显式循环代替 all()/sum() 生成器
+        attacker = self.attacker
+        diagonal_table = self._diagonals
+        candidates = []
+        for point in self.region:
+            if cells[point] != EMPTY:
+                continue
+            for n in neighbors[point]:
+                if cells[n] != defender:
+                    break
+            else:
+                diagonals = diagonal_table[point]
+                enemy = 0
+                for d in diagonals:
+                    if cells[d] == attacker:
+                        enemy += 1
+                if enemy <= (1 if len(diagonals) == 4 else 0):
+                    candidates.append(point)
+        if len(candidates) < 2:
+            return False
+        group, _ = board.group_at(self.target)
+        eyes = sum(1 for point in candidates if all(n in group for n in neighbors[point]))
+        return eyes >= 2
+
+    def _evaluate(self, passes):
+        """终局判断：True 攻方胜，False 守方胜，None 未定"""
+        if self.board.cells[self.target] != self.defender:
+            return True
+        if passes >= 2 or self._has_two_eyes():
+            return False
+        return None
+
+    def _play(self, move, color):
+        if move == PASS:
+            self.board.pass_move()
+        else:
+            self.board.play(move % self.board.size, move // self.board.size, color)
+
+    def _set_solved(self, node, attacker_wins):
+        node.pn, node.dn = (0, INFINITY) if attacker_wins else (INFINITY, 0)
+
+    def _expand(self, node, path, passes):
+        """展开区域内的合法着法（禁止全局同形）和停一手；找到一个必胜着法即可停止"""
+        board = self.board
+        color = self.attacker if node.is_or else self.defender
+        node.children = []
+        for move in self.region + [PASS]:
+            if move != PASS:
+                if board.cells[move] != EMPTY or move == board.ko:
+                    continue
+                try:
+                    board.play(move % board.size, move // board.size, color)
+                except IllegalMove:
+                    continue
+                if (board.hash, -color) in path:
+                    board.undo()
+                    continue
+            else:
+                board.pass_move()
+            self.nodes += 1
+            child = Node(move, node, not node.is_or, node.depth + 1)
+            child_passes = passes + 1 if move == PASS else 0
+            result = self._evaluate(child_passes)
+            if result is None:
+                result = self.table.get(self._key(-color, child_passes > 0))
+            if result is None and child.depth >= self.max_depth:
+                result = False
+                self.cutoffs += 1
+            if result is not None:
+                self._set_solved(child, result)
+            node.children.append(child)
+            board.undo()
+            if result is not None and result == node.is_or:
+                break
+
+    def _update(self, node):
+        if node.is_or:
+            node.pn = min(child.pn for child in node.children)
+            node.dn = min(INFINITY, sum(child.dn for child in node.children))
+        else:
+            node.pn = min(INFINITY, sum(child.pn for child in node.children))
+            node.dn = min(child.dn for child in node.children)
+
+    def solve(self, to_move):
+        """搜索直到证明/否证或用完节点预算，返回 True/False/None"""
+        root = Node(None, None, to_move == self.attacker, 0)
+        result = self._evaluate(0)
+        if result is not None:
+            self._set_solved(root, result)
+            self.root = root
+            return result
+
+        while root.pn and root.dn and self.nodes < self.node_budget:
+            # 沿最有希望的路径下到未展开的叶子
+            node = root
+            color = to_move
+            passes = 0
+            path = {(self.board.hash, color)}
+            while node.children is not None:
+                pick = (lambda c: c.pn) if node.is_or else (lambda c: c.dn)
+                node = min(node.children, key=pick)
+                self._play(node.move, color)
+                passes = passes + 1 if node.move == PASS else 0
+                color = -color
+                path.add((self.board.hash, color))
+
+            self._expand(node, path, passes)
+
+            # 回溯更新证明数，同时撤销着法
+            while True:
+                self._update(node)
+                if (node.pn == 0 or node.dn == 0) and not self.cutoffs:
+                    self.table[self._key(color, node.move == PASS)] = node.pn == 0
+                if node.parent is None:
+                    break
+                self.board.undo()
+                color = -color
+                node = node.parent
+
+        self.root = root
+        if root.pn == 0:
+            return True
+        if root.dn == 0:
+            return False
+        return None
+
+    def principal_variation(self, limit=12):
+        """证明/否证路径上的着法 [(下标, 颜色)]"""
+        variation = []
+        node = self.root
+        color = BLACK if node.is_or == (self.attacker == BLACK) else WHITE
+        attacker_wins = node.pn == 0
+        while node.children and len(variation) < limit:
+            if attacker_wins:
+                solved = [c for c in node.children if c.pn == 0]
+            else:
+                solved = [c for c in node.children if c.dn == 0]
+            if not solved:
+                break
+            node = solved[0]
+            variation.append((node.move, color))
+            color = -color
+        return variation
+
+
+def _diagonal_table(size):
+    table = []
+    for index in range(size * size):
+        x, y = index % size, index // size
+        table.append(tuple(
+            (y + dy) * size + (x + dx)
+            for dx, dy in ((-1, -1), (1, -1), (-1, 1), (1, 1))
+            if 0 <= x + dx < size and 0 <= y + dy < size
+        ))
+    return tuple(table)
+
+
+def solve(board, region, target, attacker, to_move, node_budget=5000, table=None):
+    """求解一次，返回 (结果, 求解器)"""
+    solver = ProofNumberSolver(board, region, target, attacker, node_budget, table=table)
+    return solver.solve(to_move), solver
+
+
+def _random_corner_position(rng, board_size, attacker):
+    """在左上角摆一块被包围的守方棋，返回 (棋盘, 区域, 目标点) 或 None"""
+    defender = -attacker
+    width = rng.randint(4, min(6, board_size - 3))
+    height = rng.randint(3, min(4, board_size - 3))
+    board = Board(board_size)
+
+    def place(x, y, color):
+        try:
+            if board.play(x, y, color):
+                return False  # 摆子时不允许提子
+        except IllegalMove:
+            return False
+        return True
+
+    # 攻方的外墙（区域外，守方无法突破）
+    for x in range(width + 1):
+        place(x, height, attacker)
+    for y in range(height):
+        place(width, y, attacker)
+
+    # 守方的L形外壳，随机去掉几个子留出弱点
+    shell = [(x, height - 1) for x in range(width)] + [(width - 1, y) for y in range(height - 1)]
+    for x, y in shell:
+        if rng.random() > 0.18:
+            place(x, y, defender)
+
+    # 眼位里随机放入双方的子
+    interior = [(x, y) for x in range(width - 1) for y in range(height - 1)]
+    for x, y in interior:
+        roll = rng.random()
+        if roll < 0.12:
+            place(x, y, defender)
+        elif roll < 0.22:
+            place(x, y, attacker)
+
+    # 目标是守方最大的棋块
+    region = [y * board_size + x for y in range(height) for x in range(width)]
+    best = None
+    seen = set()
+    for point in region:
+        if board.cells[point] == defender and point not in seen:
+            group, _ = board.group_at(point)
+            seen |= group
+            if best is None or len(group) > len(best):
+                best = group
+    if not best or len(best) < 3:
+        return None
+    return board, region, min(best)
+
+
+def _transform(rng, board_size):
+    """随机选择一个角（翻转/转置），返回坐标变换函数"""
+    flip_x, flip_y, transpose = rng.random() < 0.5, rng.random() < 0.5, rng.random() < 0.5
+    last = board_size - 1
+
+    def apply(x, y):
+        if transpose:
+            x, y = y, x
+        return (last - x if flip_x else x), (last - y if flip_y else y)
+    return apply
+
+
+def rate(nodes):
+    """按搜索节点数评定难度，返回 (难度名, 数值难度)"""
+    for name, value, limit in DIFFICULTY_LEVELS:
+        if nodes <= limit:
+            return name, value
+    return DIFFICULTY_LEVELS[-1][:2]
+
+
+def find_problem(board_size=9, difficulty='easy', rng=None, node_budget=5000, attempts=200, time_limit=None):
+    """随机生成并验证一道黑先死活题，难度与要求一致时立即返回
+
+    尝试完 attempts 个局面或超过 time_limit 秒仍没有要求难度的题时，返回难度最接近的
+    一道（rating.level 与 rating.requested 不同）；一道都没有时返回 None。
+    """
+    rng = rng or random.Random()
+    board_size = max(7, min(19, board_size))
+    target_value = _difficulty_value(difficulty)
+    # 超过要求难度节点数上限的局面不可能符合要求，不必求解到底
+    root_budget = min(node_budget, DIFFICULTY_LEVELS[target_value - 1][2])
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    closest = None  # (与要求难度的差距, 候选题)
+
+    for _ in range(attempts):
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        kind = rng.choice(('kill', 'live'))
+        attacker = BLACK if kind == 'kill' else WHITE
+        position = _random_corner_position(rng, board_size, attacker)
+        if position is None:
+            continue
+        board, region, target = position
+
+        # 黑先必须成功，而黑棋停一手（白先）则失败，题目才有意义
+        black_wins = kind == 'kill'
+        table = {}
+        result, solver = solve(board, region, target, attacker, BLACK, root_budget, table)
+        if result is not black_wins or solver.cutoffs:
+            continue
+        name, value = rate(solver.nodes)
+        distance = abs(value - target_value)
+        if closest is not None and distance >= closest[0]:
+            continue
+        pass_result, pass_solver = solve(board, region, target, attacker, WHITE, node_budget, table)
+        if pass_result is black_wins or pass_result is None or pass_solver.cutoffs:
+            continue
+
+        solutions = _solutions(board, region, target, attacker, black_wins, node_budget, table)
+        if not solutions or len(solutions) > 2:
+            continue
+
+        candidate = (board, region, target, kind, solutions, solver, name, value, difficulty)
+        if distance == 0:
+            return _problem_dict(rng, *candidate)
+        closest = (distance, candidate)
+
+    return _problem_dict(rng, *closest[1]) if closest else None
+
+
+def _solutions(board, region, target, attacker, black_wins, node_budget, table):
+    """列出所有正解（黑棋第一手）"""
+    size = board.size
+    solutions = []
+    for point in region:
+        if board.cells[point] != EMPTY:
+            continue
+        try:
+            board.play(point % size, point // size, BLACK)
+        except IllegalMove:
+            continue
+        if board.cells[target] != -attacker:
+            outcome, reliable = True, True  # 直接提掉了目标
+        else:
+            outcome, check = solve(board, region, target, attacker, WHITE, node_budget, table)
+            reliable = not check.cutoffs
+        board.undo()
+        if outcome is black_wins and reliable:
+            solutions.append(point)
+    return solutions
+
+
+def _difficulty_value(name):
+    for level, value, _ in DIFFICULTY_LEVELS:
+        if level == name:
+            return value
+    return 1
+
+
+def _position_hash(position):
+    """题目局面的Zobrist哈希（与 build-tsumego-library.py 导入SGF题目的id一致）"""
+    size = len(position)
+    zobrist = zobrist_table(size)
+    value = 0
+    for y, row in enumerate(position):
+        for x, color in enumerate(row):
+            if color != EMPTY:
+                value ^= zobrist[y * size + x][0 if color == BLACK else 1]
+    return value
+
+
+def _problem_dict(rng, board, region, target, kind, solutions, solver, name, value, requested):
+    size = board.size
+    transform = _transform(rng, size)
+    position = [[EMPTY] * size for _ in range(size)]
+    for index, color in enumerate(board.cells):
+        if color != EMPTY:
+            x, y = transform(index % size, index // size)
+            position[y][x] = color
+
+    def point_xy(point):
+        return transform(point % size, point // size)
+
+    reason = '提掉白棋' if kind == 'kill' else '做出两只真眼'
+    solution_list = []
+    for point in solutions:
+        x, y = point_xy(point)
+        solution_list.append({'x': x, 'y': y, 'reason': f'正解：黑棋由此可以{reason}'})
+
+    variation = []
+    for move, color in solver.principal_variation():
+        if move == PASS:
+            variation.append({'pass': True, 'color': 'B' if color == BLACK else 'W'})
+        else:
+            x, y = point_xy(move)
+            variation.append({'x': x, 'y': y, 'color': 'B' if color == BLACK else 'W'})
+
+    group, liberties = board.group_at(target)
+    return {
+        # 按变换后实际给出的局面计算，同一局面换个角落是不同的题
+        'id': f'pns_{kind}_{size}_{_position_hash(position):016x}',
+        'title': '自动生成 - 黑先杀白' if kind == 'kill' else '自动生成 - 黑先做活',
+        'difficulty': value,
+        'description': '黑先，杀死角上的白棋' if kind == 'kill' else '黑先，让角上的黑棋活下来',
+        'boardSize': size,
+        'initialPosition': position,
+        'solutions': solution_list,
+        'hints': [
+            f'目标棋块有 {len(group)} 个子、{len(liberties)} 口气',
+            '先看眼位：两只真眼才能活' if kind == 'live' else '破坏白棋的眼位',
+            f'正解共 {len(solution_list)} 个',
+        ],
+        'tags': [kind],
+        'principalVariation': variation,
+        'rating': {'level': name, 'requested': requested, 'nodes': solver.nodes, 'depth': len(variation)},
+        'generated': True,
+        'generator': 'proof-number search'
+    }
@@ -0,0 +1,171 @@
+"""
+紧凑的请求/响应编码（可选）
+
+着法：每手一个小端uint16点序号 y*size+x，整段base64编码放在 movesPacked 字段；
+棋盘：按行展开的int8数组（1黑、-1白、0空），base64编码放在 boardPacked 字段；
+归属度：int8，实际值 = 字节值/127。
+解码用 array 整块转换、map/zip 拆出坐标，不逐个元素执行Python代码。
+
+增量请求：带 session 的请求只发送 baseMoves 手之后的着法，服务器按会话保存
+完整着法序列，拼接 stored[:baseMoves] + 新着法后再分析（悔棋时 baseMoves 变小即可）。
+会话不存在或比 baseMoves 短时抛出 SessionMismatch，客户端重新发送完整着法。
+"""
+
+import base64
+import binascii
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from itertools import chain
+
+from server.coords import request_moves
+
+ENCODING = 'packed'
+OWNERSHIP_SCALE = 127
+
+
+class WireError(ValueError):
+    """紧凑编码的请求无法解码"""
+
+
+class SessionMismatch(WireError):
+    """增量请求与服务器保存的会话不一致，需要重新发送完整着法"""
+
+    def __init__(self, message, stored_moves=0):
+        super().__init__(message)
+        self.stored_moves = stored_moves
+
+
+def _b64decode(text, field):
+    try:
+        return base64.b64decode(text, validate=True)
+    except (binascii.Error, TypeError, ValueError):
+        raise WireError(f"{field} 不是有效的base64")
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode('ascii')
+
+
+def pack_moves(moves, board_size):
+    """[(x, y), ...] -> base64（小端uint16点序号）"""
+    points = array('H', (y * board_size + x for x, y in moves))
+    if sys.byteorder == 'big':
+        points.byteswap()
+    return _b64encode(points.tobytes())
+
+
+def unpack_moves(text, board_size):
+    """base64（小端uint16点序号）-> [(x, y), ...]"""
+    raw = _b64decode(text, 'movesPacked')
+    if len(raw) % 2:
+        raise WireError("movesPacked 长度不是2字节的整数倍")
+    points = array('H')
+    points.frombytes(raw)
+    if sys.byteorder == 'big':
+        points.byteswap()
+    if points and max(points) >= board_size * board_size:
+        raise WireError(f"movesPacked 中的点序号超出 {board_size}x{board_size} 棋盘")
+    return list(zip(map(board_size.__rmod__, points), map(board_size.__rfloordiv__, points)))
+
+
+def pack_board(rows):
+    """board[y][x]（1、-1、0）-> base64（按行展开的int8）"""
+    return _b64encode(array('b', chain.from_iterable(rows)).tobytes())
+
+
+def unpack_board(text, board_size):
+    """base64（按行展开的int8）-> board[y][x]"""
+    raw = _b64decode(text, 'boardPacked')
+    if len(raw) != board_size * board_size:
+        raise WireError(f"boardPacked 应为 {board_size * board_size} 字节，实际 {len(raw)} 字节")
+    cells = array('b')
+    cells.frombytes(raw)
+    if min(cells) < -1 or max(cells) > 1:
+        raise WireError("boardPacked 只能包含 1、-1、0")
+    return [cells[row:row + board_size].tolist() for row in range(0, len(cells), board_size)]
+
+
+def pack_ownership(ownership):
+    """numpy归属度数组 [-1, 1] -> base64（int8，值/127）"""
+    return _b64encode((ownership * OWNERSHIP_SCALE).round().astype('int8').tobytes())
+
+
+class MoveSessions:
+    def __init__(self, max_sessions=1000, ttl=3600.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+        self._sessions = OrderedDict()  # 会话 -> (过期时间, 完整着法列表)
+        self._lock = threading.Lock()
+
+        # 统计数据
+        self._requests = 0
+        self._mismatches = 0
+        self._moves_received = 0
+        self._moves_reused = 0
+
+    def resolve(self, session, base_moves, new_moves):
+        """拼接出完整着法序列并保存，返回 [(x, y), ...]"""
+        now = time.monotonic()
+        with self._lock:
+            self._requests += 1
+            entry = self._sessions.get(session)
+            stored = entry[1] if entry is not None and entry[0] > now else []
+            if base_moves < 0 or base_moves > len(stored):
+                self._mismatches += 1
+                raise SessionMismatch(f"会话只有 {len(stored)} 手，无法从第 {base_moves} 手继续", len(stored))
+
+            moves = stored[:base_moves] + new_moves
+            self._sessions[session] = (now + self.ttl, moves)
+            self._sessions.move_to_end(session)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+            self._moves_received += len(new_moves)
+            self._moves_reused += base_moves
+            return moves
+
+    def metrics(self):
+        """返回增量请求指标"""
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'maxSessions': self.max_sessions,
+                'requests': self._requests,
+                'mismatches': self._mismatches,
+                'movesReceived': self._moves_received,
+                'movesReused': self._moves_reused,
+            }
+
+
+def decode_request(data, sessions):
+    """展开紧凑编码和增量请求：movesPacked/session -> moves（(x, y)元组列表），boardPacked -> board"""
+    if 'movesPacked' not in data and 'boardPacked' not in data and data.get('session') is None:
+        return data
+
+    board_size = data.get('boardSize', 19)
+    if not isinstance(board_size, int) or not 2 <= board_size <= 25:
+        raise WireError(f"无效的棋盘大小: {board_size}")
+
+    data = dict(data)
+    if 'movesPacked' in data:
+        moves = unpack_moves(data.pop('movesPacked') or '', board_size)
+    else:
+        moves = request_moves(data)
+
+    session = data.get('session')
+    if session is not None:
+        try:
+            base_moves = int(data.get('baseMoves', 0))
+        except (TypeError, ValueError):
+            raise WireError(f"无效的 baseMoves: {data.get('baseMoves')}")
+        data['session'] = session = str(session)
+        moves = sessions.resolve(session, base_moves, moves)
+    data['moves'] = moves
+
+    if 'boardPacked' in data:
+        data['board'] = unpack_board(data.pop('boardPacked') or '', board_size)
+    return data
@@ -0,0 +1,51 @@
+"""
+测试共用的夹具：服务器模块用 tools/fake-katago.py 作为KataGo加载，不需要真实的引擎和模型
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_server(**env):
+    """按给定的环境变量加载一份新的 unified-server.py 模块（每次都是独立的全局状态）"""
+    settings = {
+        'KATAGO_PATH': os.path.join(ROOT, 'tools', 'fake-katago.py'),
+        'OPENING_BOOK': '',
+        'KATAGO_PONDER_REPLIES': '0',
+        'KATAGO_POOL_SIZE': '1',
+    }
+    settings.update(env)
+    saved = {name: os.environ.get(name) for name in settings}
+    os.environ.update(settings)
+    try:
+        spec = importlib.util.spec_from_file_location('unified_server', os.path.join(ROOT, 'unified-server.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return module
+
+
+@pytest.fixture(params=['gtp', 'analysis'])
+def server(request):
+    """启动了模拟引擎的服务器模块，GTP和JSON分析引擎两种后端各运行一次"""
+    module = load_server(KATAGO_BACKEND=request.param)
+    if module.analysis_engine is not None:
+        module.analysis_engine.start()
+    else:
+        module.katago_pool.start()
+    yield module
+    module.ponderer.cancel()
+    if module.analysis_engine is not None:
+        module.analysis_engine.stop()
+    module.katago_pool.stop()
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pytest
+
+from server.wire import pack_moves
+
+pytest.importorskip('asgiref')
+
+
+def post(app, path, payload, headers=()):
+    """向ASGI应用发送一个POST请求，返回 (状态码, 响应头, 响应体)"""
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': list(headers),
+             'client': ('127.0.0.1', 5000), 'query_string': b'', 'root_path': '', 'http_version': '1.1'}
+    messages = [{'type': 'http.request', 'body': json.dumps(payload).encode('utf-8'), 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = sent[0]
+    headers = {name.decode(): value.decode() for name, value in start['headers']}
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return start['status'], headers, body.decode('utf-8')
+
+
+def stream_events(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@pytest.fixture
+def asgi_app(server):
+    return server.create_asgi_app(server.app, {'/api/katago/analyze-stream': server.open_analysis_stream})
+
+
+def test_stream_decodes_like_flask(asgi_app):
+    request = {'boardSize': 19, 'maxVisits': 100, 'reportInterval': 0.02}
+    status, _, body = post(asgi_app, '/api/katago/analyze-stream', dict(request, movesPacked=pack_moves([(3, 3), (15, 15)], 19)))
+    assert status == 200
+    event, payload = stream_events(body)[-1]
+    assert event == 'done'
+    packed_best = payload['moveInfos'][0]['move']
+
+    status, _, body = post(asgi_app, '/api/katago/analyze-stream', dict(request, sgf='(;SZ[19];B[dd];W[pp])'))
+    assert status == 200
+    assert stream_events(body)[-1][1]['moveInfos'][0]['move'] == packed_best
+
+
+def test_stream_sessions_and_errors(asgi_app):
+    request = {'boardSize': 19, 'maxVisits': 100, 'reportInterval': 0.02, 'session': 's1'}
+    status, headers, _ = post(asgi_app, '/api/katago/analyze-stream', dict(request, moves=[{'x': 3, 'y': 3}]))
+    assert (status, headers['x-session-moves']) == (200, '1')
+    status, headers, _ = post(asgi_app, '/api/katago/analyze-stream', dict(request, baseMoves=1, moves=[{'x': 15, 'y': 15}]))
+    assert (status, headers['x-session-moves']) == (200, '2')
+
+    status, _, body = post(asgi_app, '/api/katago/analyze-stream', dict(request, session='unknown', baseMoves=5, moves=[]))
+    assert status == 409
+    assert json.loads(body)['sessionMoves'] == 0
+    status, _, body = post(asgi_app, '/api/katago/analyze-stream', dict(request, session=None, sgf='(;SZ[19];B[dd];W[pp];B[])'))
+    assert status == 400
+    status, _, _ = post(asgi_app, '/api/katago/analyze-stream', dict(request, session=None, movesPacked='***'))
+    assert status == 400
@@ -0,0 +1,77 @@
+import re
+
+import pytest
+
+from server.analysis_cache import position_key
+from server.board import BLACK, WHITE, Board, IllegalMove, zobrist_table
+
+
+def recomputed_hash(board):
+    zobrist = zobrist_table(board.size)
+    value = 0
+    for index, color in enumerate(board.cells):
+        if color:
+            value ^= zobrist[index][0 if color == BLACK else 1]
+    return value
+
+
+def test_zobrist_table_is_fixed_per_size():
+    assert zobrist_table(19) == zobrist_table(19)
+    assert len(zobrist_table(9)) == 81
+    assert zobrist_table(9)[0] != zobrist_table(19)[0]
+
+
+def test_incremental_hash_follows_captures_and_undo():
+    board = Board(9)
+    hashes = [board.hash]
+    # 白子 (1, 0) 被黑棋提掉
+    for x, y, color in [(1, 0, WHITE), (0, 0, BLACK), (2, 0, BLACK), (5, 5, WHITE), (1, 1, BLACK)]:
+        board.play(x, y, color)
+        assert board.hash == recomputed_hash(board)
+        hashes.append(board.hash)
+    assert board.get(1, 0) == 0
+    for expected in reversed(hashes[:-1]):
+        board.undo()
+        assert board.hash == expected
+    assert board.hash == 0
+
+
+def test_same_position_from_different_move_orders():
+    first = Board.from_moves(19, [(3, 3), (15, 15), (15, 3), (3, 15)])
+    second = Board.from_moves(19, [(15, 3), (3, 15), (3, 3), (15, 15)])
+    assert first.hash == second.hash
+
+
+def test_position_key_fields():
+    data = {'moves': [(3, 3), (15, 15)], 'boardSize': 19, 'komi': 7.5, 'maxVisits': 200}
+    key, _ = position_key(data)
+    # 规范形式可能是黑白互换后的局面（轮到白下、贴目取反）
+    assert re.fullmatch(r'19:s[0-9a-f]{16}:[BW]:-?7\.5:200', key)
+    assert position_key(dict(data, moves=[{'x': 3, 'y': 3}, {'x': 15, 'y': 15}]))[0] == key
+    assert position_key(dict(data, maxVisits=400))[0] != key
+    assert position_key(dict(data, komi=6.5))[0] != key
+    assert position_key(dict(data, moves=[(3, 3)]))[0] != key
+
+
+def test_illegal_moves_are_not_cached():
+    with pytest.raises(IllegalMove):
+        Board.from_moves(9, [(0, 0), (0, 0)])
+    key, symmetry = position_key({'moves': [(0, 0), (0, 0)], 'boardSize': 9})
+    assert key is None and symmetry.identity
+
+
+def test_ko_ban_is_part_of_the_key():
+    """棋子和轮到谁下相同，但刚提劫的局面不能立即提回，不能共用缓存"""
+    shape = [(1, 0), (2, 0), (0, 1), (3, 1), (1, 2), (2, 2), (10, 10), (1, 1)]
+    with_ko = shape + [(16, 3), (16, 16), (2, 1)]
+    without_ko = shape + [(2, 1), (16, 16), (16, 3)]
+    first, second = Board.from_moves(19, with_ko), Board.from_moves(19, without_ko)
+    assert first.hash == second.hash and first.to_move == second.to_move
+    assert first.ko == 19 + 1 and second.ko is None
+
+    data = {'boardSize': 19, 'komi': 6.5, 'maxVisits': 100}
+    key, _ = position_key(dict(data, moves=with_ko))
+    assert key != position_key(dict(data, moves=without_ko))[0]
+    # 劫点随对称变换一起变换，同形的劫仍然命中同一个键
+    mirrored = [(18 - x, y) for x, y in with_ko]
+    assert position_key(dict(data, moves=mirrored))[0] == key
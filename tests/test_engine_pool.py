@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+from conftest import load_server
+from server.engine_pool import EngineNotReady
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def start_pool():
+    """按大小启动模拟引擎的引擎池，ping_interval 给出时以监护模式启动；测试结束后停止"""
+    pools = []
+
+    def start(size=1, ping_interval=None):
+        pool = load_server(KATAGO_POOL_SIZE=str(size)).katago_pool
+        pools.append(pool)
+        if ping_interval is None:
+            pool.start()
+        else:
+            pool.supervise(ping_interval)
+            wait_until(lambda: pool.metrics()['idle'] == size)
+        return pool
+    yield start
+    for pool in pools:
+        pool.stop()
+
+
+@pytest.fixture
+def supervised_pool(start_pool):
+    """监护模式下的单引擎池"""
+    return start_pool(ping_interval=60)
+
+
+def test_checkout_order_prefers_interactive_then_least_served_client(start_pool):
+    """归还的引擎先给对弈请求，复盘请求按客户端轮流，同一客户端内先来先得"""
+    pool = start_pool()
+    holder = pool.checkout(client='a')
+    order = []
+
+    def take(name, priority, client):
+        engine = pool.checkout(priority=priority, client=client)
+        order.append(name)
+        pool.checkin(engine)
+    threads = []
+    for count, args in enumerate([('a1', 'batch', 'a'), ('a2', 'batch', 'a'), ('b1', 'batch', 'b'), ('c1', 'interactive', 'c')], 1):
+        thread = threading.Thread(target=take, args=args, daemon=True)
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: pool.metrics()['waiting'] == count)
+
+    pool.checkin(holder)
+    for thread in threads:
+        thread.join(5)
+    assert order == ['c1', 'b1', 'a1', 'a2']
+    assert pool.metrics()['checkouts'] == 5
+
+
+def test_session_reuses_its_engine(start_pool):
+    pool = start_pool(size=2)
+    with pool.engine(session='s1') as first:
+        pass
+    # 其他会话优先使用没有绑定会话的引擎
+    with pool.engine(session='s2') as second:
+        assert second is not first
+    with pool.engine(session='s1') as again:
+        assert again is first
+    metrics = pool.metrics()
+    assert metrics['affinityHits'] == 1 and metrics['sessions'] == 2
+
+
+def test_crashed_engine_is_restarted_and_warmed_up(start_pool):
+    """监护线程ping发现崩溃的引擎，后台重启、预热后重新投入使用"""
+    pool = start_pool(ping_interval=0.05)
+    engine = pool.engines[0]
+    engine.process.client.process.kill()
+    wait_until(lambda: pool.metrics()['restarts'] == 1)
+    wait_until(lambda: pool.metrics()['idle'] == 1)
+    metrics = pool.metrics()
+    assert metrics['pingFailures'] >= 1 and metrics['failedStarts'] == 0
+    with pool.engine() as checked_out:
+        assert checked_out is engine and checked_out.ping()
+
+
+def test_requests_get_503_while_engines_start(monkeypatch):
+    """引擎还在启动（预热）时分析请求立即返回503和Retry-After"""
+    monkeypatch.setenv('FAKE_KATAGO_COMMAND_DELAY', '1')
+    server = load_server()
+    server.katago_pool.supervise(60)
+    try:
+        started = time.monotonic()
+        response = server.app.test_client().post('/api/katago/analyze', json={'moves': [], 'boardSize': 19})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '5'
+        assert time.monotonic() - started < 1
+    finally:
+        server.katago_pool.stop()
+
+
+def test_waiters_fail_fast_when_the_engine_restarts(supervised_pool, monkeypatch):
+    """引擎转入后台重启时唤醒排队的请求，没有就绪引擎时立即返回EngineNotReady"""
+    pool = supervised_pool
+    engine = pool.checkout()
+    outcome = []
+
+    def waiter():
+        started = time.monotonic()
+        try:
+            pool.checkout(timeout=30)
+        except EngineNotReady:
+            outcome.append(time.monotonic() - started)
+    thread = threading.Thread(target=waiter, daemon=True)
+    thread.start()
+    wait_until(pool.has_waiters)
+
+    # 重启很慢：新进程的每条GTP命令延迟1秒
+    monkeypatch.setenv('FAKE_KATAGO_COMMAND_DELAY', '1')
+    engine.stop()
+    pool.checkin(engine)
+    thread.join(2)
+    assert not thread.is_alive()
+    assert len(outcome) == 1 and outcome[0] < 1
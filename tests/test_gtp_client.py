@@ -0,0 +1,55 @@
+import asyncio
+import gc
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+from server.gtp_client import AsyncGTPClient, GTPError
+
+FAKE_KATAGO = os.path.join(ROOT, 'tools', 'fake-katago.py')
+
+
+async def exit_during(start_command):
+    """启动模拟引擎，start_command(client) 发出命令后杀掉进程；
+    返回事件循环报告的错误和 start_command 返回的收尾协程的结果"""
+    loop = asyncio.get_running_loop()
+    reported = []
+    loop.set_exception_handler(lambda loop, context: reported.append(context['message']))
+    client = AsyncGTPClient([sys.executable, FAKE_KATAGO, 'gtp'])
+    await client.start()
+    pending = await start_command(client)
+    client.process.kill()
+    await client._tasks[0]
+    await client.close()
+    result = await pending()
+    del client, pending
+    gc.collect()
+    return reported, result
+
+
+def test_engine_exit_during_stream_reports_nothing():
+    """流式命令的Future没有人等待，引擎退出时不应报告 "Future exception was never retrieved" """
+    async def start_stream(client):
+        lines = client.stream('kata-analyze B 5', timeout=5)
+        assert (await lines.__anext__()).startswith('info')
+        return lines.aclose
+    reported, _ = asyncio.run(exit_during(start_stream))
+    assert reported == []
+
+
+def test_engine_exit_fails_waiting_commands(monkeypatch):
+    monkeypatch.setenv('FAKE_KATAGO_GENMOVE_DELAY', '5')
+
+    async def start_genmove(client):
+        waiting = asyncio.ensure_future(client.command('genmove B', timeout=10))
+        await asyncio.sleep(0.1)
+
+        async def result():
+            with pytest.raises(GTPError):
+                await waiting
+            return 'failed'
+        return result
+    reported, result = asyncio.run(exit_during(start_genmove))
+    assert result == 'failed' and reported == []
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from server.ponder import Ponderer
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.01)
+
+
+def start_waiting(ponderer, session, finished):
+    def task(cancelled, store):
+        cancelled.wait(5)
+        finished[session] = cancelled.is_set()
+    ponderer.start(session, task)
+
+
+def test_cancel_only_stops_the_given_session():
+    ponderer = Ponderer()
+    finished = {}
+    start_waiting(ponderer, 'a', finished)
+    start_waiting(ponderer, 'b', finished)
+
+    ponderer.cancel('a')
+    wait_until(lambda: 'a' in finished)
+    assert finished == {'a': True}
+    assert ponderer.metrics()['active'] == 1
+
+    ponderer.cancel()
+    wait_until(lambda: 'b' in finished)
+    assert ponderer.metrics()['cancelled'] == 2
+
+
+def test_results_are_kept_per_session_until_restart():
+    ponderer = Ponderer(ttl=60)
+    stored = threading.Event()
+
+    def task(cancelled, store):
+        store('key', {'moveInfos': []})
+        stored.set()
+    ponderer.start('a', task)
+    assert stored.wait(5)
+
+    assert ponderer.get('a', 'key') == {'moveInfos': []}
+    assert ponderer.get('b', 'key') is None
+    ponderer.cancel('a')
+    assert ponderer.get('a', 'key') is not None
+
+    ponderer.start('a', lambda cancelled, store: None)
+    assert ponderer.get('a', 'key') is None
+
+
+def test_partial_search_is_not_stored(server, monkeypatch):
+    """超过 KATAGO_STREAM_MAX_DURATION 停止的搜索没有达到maxVisits，不保存"""
+    if server.analysis_engine is not None:
+        # 最终结果在中间结果之后1秒才返回
+        server.analysis_engine.stop()
+        monkeypatch.setenv('FAKE_KATAGO_ANALYSIS_DELAY', '1')
+        server.analysis_engine.start()
+    monkeypatch.setattr(server, 'KATAGO_STREAM_INTERVAL', 0.02)
+    monkeypatch.setattr(server, 'KATAGO_STREAM_MAX_DURATION', 0.3)
+    stored = []
+    data = {'moves': [(3, 3)], 'boardSize': 19, 'maxVisits': 100000}
+    result = server.ponder_position(data, 'a', threading.Event(), lambda key, value: stored.append(key))
+    assert result is not None
+    assert stored == []
+
+    monkeypatch.setattr(server, 'KATAGO_STREAM_MAX_DURATION', 5)
+    data = dict(data, maxVisits=50)
+    server.ponder_position(data, 'a', threading.Event(), lambda key, value: stored.append(key))
+    assert stored == [server.position_key(data)[0]]
+
+
+def test_search_stops_on_root_visits(server, monkeypatch):
+    """候选着法的访问数之和小于根节点访问数，停止和是否完整按根节点（rootInfo）判断"""
+    monkeypatch.setattr(server, 'KATAGO_STREAM_INTERVAL', 0.02)
+    monkeypatch.setattr(server, 'KATAGO_STREAM_MAX_DURATION', 5)
+    stored = []
+    data = {'moves': [(3, 3)], 'boardSize': 19, 'maxVisits': 100}
+    result = server.ponder_position(data, 'a', threading.Event(), lambda key, value: stored.append(key))
+    assert result['visits'] == 100
+    assert sum(info['visits'] for info in result['moveInfos']) < 100
+    assert server.search_complete(dict(data, maxTime=5), result)
+    assert stored == [server.position_key(data)[0]]
@@ -0,0 +1,69 @@
+QUIET_GAME = [(3, 3), (15, 15), (15, 3), (3, 15)]
+
+
+def test_quiet_game_has_no_blunders(server):
+    """模拟引擎的胜率只随双方子数变化，平稳的对局在两种后端上都不应该有恶手"""
+    review = server.review_game({'moves': QUIET_GAME, 'boardSize': 19, 'maxVisits': 100})
+    assert review['moveCount'] == 4
+    assert [position['moveNumber'] for position in review['positions']] == [0, 1, 2, 3, 4]
+    assert all(position['winrate'] is not None for position in review['positions'])
+    assert review['blunders'] == []
+
+
+def test_review_does_not_reuse_genmove_results(server):
+    """/analyze 的genmove结果评估的是AI落子后的局面，复盘不能从缓存中取用"""
+    data = {'moves': QUIET_GAME[:2], 'boardSize': 19, 'maxVisits': 100}
+    server.run_analysis(data)
+    review = server.review_game({'moves': QUIET_GAME, 'boardSize': 19, 'maxVisits': 100})
+    assert review['blunders'] == []
+
+
+def scripted_review(server, monkeypatch, winrates, **request):
+    """按给定的黑方胜率序列伪造每个局面的分析结果"""
+    def review_positions(base, moves, turns, client=None):
+        return {
+            turn: {'moveInfos': [{'move': 'D4', 'x': 3, 'y': 15, 'visits': 100,
+                                  'winrate': winrates[turn], 'scoreLead': (winrates[turn] - 0.5) * 40}]}
+            for turn in turns
+        }
+    monkeypatch.setattr(server, 'review_positions', review_positions)
+    return server.review_game(dict({'moves': QUIET_GAME, 'boardSize': 19}, **request))
+
+
+def test_blunders_are_judged_from_the_mover(monkeypatch):
+    from conftest import load_server
+    server = load_server()
+    # 第2手（白）让黑方胜率上升0.2，第3手（黑）让黑方胜率下降0.15
+    review = scripted_review(server, monkeypatch, [0.5, 0.5, 0.7, 0.55, 0.56])
+    assert [(b['moveNumber'], b['color'], b['winrateLoss']) for b in review['blunders']] == [(2, 'W', 0.2), (3, 'B', 0.15)]
+    assert review['blunders'][0]['move'] == 'Q4'
+
+    review = scripted_review(server, monkeypatch, [0.5, 0.5, 0.7, 0.55, 0.56], blunderThreshold=0.18)
+    assert [b['moveNumber'] for b in review['blunders']] == [2]
+
+
+def test_stride_skips_blunder_detection(monkeypatch):
+    from conftest import load_server
+    server = load_server()
+    review = scripted_review(server, monkeypatch, [0.5, 0.9, 0.1, 0.9, 0.1], stride=2)
+    assert [position['moveNumber'] for position in review['positions']] == [0, 2, 4]
+    assert review['blunders'] == []
+
+
+def test_analysis_review_keeps_positions_of_slow_chunks(monkeypatch):
+    """analysis后端每段查询单独计算超时，超时的一段保留已经算完的局面"""
+    from conftest import load_server
+    server = load_server(KATAGO_BACKEND='analysis', KATAGO_ANALYSIS_TIMEOUT='0.5')
+    monkeypatch.setenv('FAKE_KATAGO_TURN_DELAY', '0.1')
+    engine = server.analysis_engine
+    engine.start()
+    try:
+        data = {'moves': [(x, 3 if x % 2 else 15) for x in range(12)], 'boardSize': 19, 'maxVisits': 100}
+        turns = list(range(12))
+        # 一条查询要1.2秒，分成每段3手时每段都在超时之前完成
+        assert sorted(engine.analyze_positions(data, turns, chunk_size=3)) == turns
+        partial = engine.analyze_positions(data, turns, chunk_size=12)
+        assert 0 < len(partial) < 12
+        assert sorted(partial) == turns[:len(partial)]
+    finally:
+        engine.stop()
@@ -0,0 +1,122 @@
+import io
+
+import pytest
+
+from server import sgf
+from server.sgf import SGFError, alternating_prefix, dumps_tree, game_record, game_tree, iter_games, parse_sgf, request_from_sgf, variations
+
+COLLECTION = """
+(;GM[1]SZ[19]KM[7.5]RE[B+3.5]C[first \\] game]
+ ;B[pd];W[dp]
+ (;B[pp];W[dd])
+ (;B[dd]))
+noise between games
+(;GM[1]SZ[9]AB[aa:bb]AW[cc];W[ee])
+"""
+
+
+def test_game_record_main_line_and_setup():
+    first, second = [game_record(root) for root in iter_games(COLLECTION)]
+    assert first['boardSize'] == 19
+    assert first['komi'] == 7.5
+    assert first['result'] == 'B+3.5'
+    assert first['setup'] == []
+    assert [(m['x'], m['y'], m['color']) for m in first['moves']] == [(15, 3, 'B'), (3, 15, 'W'), (15, 15, 'B'), (3, 3, 'W')]
+    assert second['boardSize'] == 9
+    assert sorted((s['x'], s['y'], s['color']) for s in second['setup']) == [(0, 0, 'B'), (0, 1, 'B'), (1, 0, 'B'), (1, 1, 'B'), (2, 2, 'W')]
+
+
+def test_escaped_values():
+    root = next(iter_games(COLLECTION))
+    assert root.get('C') == 'first ] game'
+
+
+def test_variations_depth_first_main_line_first():
+    root = next(iter_games(COLLECTION))
+    lines = [[(m['x'], m['y']) for m in line] for line in variations(root)]
+    assert lines == [[(15, 3), (3, 15), (15, 15), (3, 3)], [(15, 3), (3, 15), (3, 3)]]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64])
+def test_chunked_stream_matches_whole_text(monkeypatch, chunk_size):
+    monkeypatch.setattr(sgf, 'CHUNK_SIZE', chunk_size)
+    streamed = [game_record(root) for root in iter_games(io.StringIO(COLLECTION))]
+    assert streamed == [game_record(root) for root in iter_games(COLLECTION)]
+
+
+@pytest.mark.parametrize('text', ['(;GM[1]SZ[19];B[pd]', '(;SZ[19];B[zz])', '(;SZ[x])', 'no game here'])
+def test_malformed_input(text):
+    with pytest.raises(SGFError):
+        parse_sgf(text)
+
+
+def test_passes_are_kept_in_game_record():
+    record = parse_sgf('(;GM[1]SZ[19];B[dd];W[];B[tt])')
+    assert [(m['x'], m['color']) for m in record['moves']] == [(3, 'B'), (None, 'W'), (None, 'B')]
+    assert alternating_prefix(record['moves']) == 1
+
+
+def test_write_and_read_back():
+    moves = [{'x': 3, 'y': 3}, {'x': 15, 'y': 15}, {'x': 2, 'y': 16}]
+    root = game_tree(19, moves, komi=6.5, result='W+R', annotations={0: {'C': 'a]b'}, 2: {'BM': '1'}})
+    record = parse_sgf(dumps_tree(root))
+    assert [(m['x'], m['y'], m['color']) for m in record['moves']] == [(3, 3, 'B'), (15, 15, 'W'), (2, 16, 'B')]
+    assert (record['komi'], record['result']) == (6.5, 'W+R')
+    assert next(iter_games(dumps_tree(root))).get('C') == 'a]b'
+
+
+def test_request_from_sgf():
+    data = request_from_sgf({'sgf': COLLECTION, 'moveNumber': 3, 'maxVisits': 50})
+    assert data == {'moves': [(15, 3), (3, 15), (15, 15)], 'boardSize': 19, 'komi': 7.5, 'maxVisits': 50, 'moveNumber': 3}
+    # 请求中给出的参数优先
+    assert request_from_sgf({'sgf': COLLECTION, 'komi': 6.5})['komi'] == 6.5
+    with pytest.raises(SGFError):
+        request_from_sgf({'sgf': COLLECTION, 'game': 1})
+    with pytest.raises(SGFError):
+        request_from_sgf({'sgf': COLLECTION, 'game': 2})
+
+
+def test_request_from_sgf_rejects_passes_and_repeated_colors():
+    """停一手之后该谁下无法由手数推出，不能当作黑白交替的着法分析"""
+    game = '(;GM[1]SZ[19]KM[7.5];B[dd];W[pp];B[])'
+    with pytest.raises(SGFError, match='第 3 手停一手'):
+        request_from_sgf({'sgf': game})
+    assert request_from_sgf({'sgf': game, 'moveNumber': 2})['moves'] == [(3, 3), (15, 15)]
+    with pytest.raises(SGFError, match='第 2 手'):
+        request_from_sgf({'sgf': '(;SZ[19];B[dd];B[pp])'})
+
+
+def test_request_from_sgf_passes_at_the_end_and_until_pass():
+    """终局的 B[];W[] 去掉；until_pass 在中间的停一手处截断，颜色重复仍然报错"""
+    finished = request_from_sgf({'sgf': '(;SZ[19];B[dd];W[pp];B[];W[])'})
+    assert finished['moves'] == [(3, 3), (15, 15)]
+    assert 'stoppedAtPass' not in finished
+    middle = '(;SZ[19];B[dd];W[];B[pp];W[dp])'
+    with pytest.raises(SGFError, match='第 2 手停一手'):
+        request_from_sgf({'sgf': middle})
+    cut = request_from_sgf({'sgf': middle}, until_pass=True)
+    assert cut['moves'] == [(3, 3)] and cut['stoppedAtPass'] == 2
+    with pytest.raises(SGFError, match='第 2 手'):
+        request_from_sgf({'sgf': '(;SZ[19];B[dd];B[pp];W[])'}, until_pass=True)
+
+
+def test_sgf_request_with_pass_returns_400():
+    from conftest import load_server
+    server = load_server()
+    response = server.app.test_client().post('/api/katago/analyze', json={'sgf': '(;GM[1]SZ[19]KM[7.5];B[dd];W[pp];B[])'})
+    assert response.status_code == 400
+
+
+def test_analyze_game_accepts_finished_games(server):
+    client = server.app.test_client()
+    finished = '(;GM[1]SZ[19]KM[7.5];B[dd];W[pp];B[dp];W[];B[pd];W[];B[])'
+    response = client.post('/api/katago/analyze-game', json={'sgf': finished, 'maxVisits': 50})
+    assert response.status_code == 200
+    review = response.get_json()
+    assert review['moveCount'] == 3 and review['stoppedAtPass'] == 4
+    finished = '(;GM[1]SZ[19]KM[7.5];B[dd];W[pp];B[];W[])'
+    response = client.post('/api/katago/analyze-game', json={'sgf': finished, 'maxVisits': 50})
+    assert response.status_code == 200
+    assert response.get_json()['moveCount'] == 2
+    response = client.post('/api/katago/analyze-game', json={'sgf': '(;SZ[19];B[dd];B[pp])'})
+    assert response.status_code == 400
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from server.singleflight import SingleFlight
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.01)
+
+
+def run_concurrently(flight, key, fn, count):
+    """count 个线程同时请求同一个键，第一个线程的计算在其余线程都加入后才结束"""
+    release = threading.Event()
+    outcomes = [None] * count
+
+    def blocked():
+        release.wait(5)
+        return fn()
+
+    def request(index):
+        try:
+            outcomes[index] = ('result', flight.do(key, blocked))
+        except Exception as e:
+            outcomes[index] = ('error', e)
+    threads = [threading.Thread(target=request, args=(index,), daemon=True) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: flight.metrics()['shared'] == count - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_requests_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    outcomes = run_concurrently(flight, 'k', lambda: calls.append(1) or {'visits': len(calls)}, 8)
+    assert len(calls) == 1
+    assert outcomes == [('result', {'visits': 1})] * 8
+    assert flight.metrics() == {'inFlight': 0, 'executed': 1, 'shared': 7}
+
+
+def test_leader_error_reaches_every_follower():
+    flight = SingleFlight()
+    error = RuntimeError("引擎崩溃")
+
+    def fail():
+        raise error
+    outcomes = run_concurrently(flight, 'k', fail, 5)
+    assert outcomes == [('error', error)] * 5
+    # 计算结束后键立即移除，下一次请求重新计算
+    assert flight.do('k', lambda: 'again') == 'again'
+
+
+def test_none_key_is_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do(None, lambda: 1) == 1
+    assert flight.metrics()['executed'] == 0
+
+
+def test_identical_analysis_requests_run_once(server, monkeypatch):
+    """相同局面的并发请求只调用一次引擎，所有请求得到同样的结果"""
+    compute = server.compute_analysis
+    calls = []
+
+    def counted(*args, **kwargs):
+        calls.append(args[1])
+        wait_until(lambda: server.analysis_flight.metrics()['shared'] == 3)
+        return compute(*args, **kwargs)
+    monkeypatch.setattr(server, 'compute_analysis', counted)
+    results = [None] * 4
+
+    def request(index):
+        results[index] = server.run_analysis({'moves': [(3, 3)], 'boardSize': 19, 'maxVisits': 50})
+    threads = [threading.Thread(target=request, args=(index,), daemon=True) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(calls) == 1
+    assert results[0] is not None and all(result == results[0] for result in results)
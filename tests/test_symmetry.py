@@ -0,0 +1,65 @@
+import pytest
+
+from server.analysis_cache import position_key
+from server.board import BLACK, WHITE, Board
+from server.coords import coord_to_gtp
+from server.symmetry import SYMMETRIES, Symmetry, canonical_position, inverse_table, transform_point, transform_table
+
+MOVES = [(2, 3), (15, 16), (16, 2), (9, 10)]
+
+
+@pytest.mark.parametrize('size', [9, 19])
+def test_inverse_table_round_trip(size):
+    for t in range(SYMMETRIES):
+        forward, backward = transform_table(size)[t], inverse_table(size)[t]
+        assert sorted(forward) == list(range(size * size))
+        assert all(backward[forward[index]] == index for index in range(size * size))
+
+
+def result_for(size=19):
+    """请求方向的分析结果：推荐点为 (4, 2)，黑方胜率0.6"""
+    x, y = 4, 2
+    return {'moveInfos': [{'move': coord_to_gtp(x, y, size), 'x': x, 'y': y, 'visits': 100,
+                           'winrate': 0.6, 'scoreLead': 2.5, 'scoreMean': 2.5}]}
+
+
+@pytest.mark.parametrize('t', range(SYMMETRIES))
+def test_transformed_positions_share_key_and_restore_moves(t):
+    data = {'moves': MOVES, 'boardSize': 19, 'komi': 6.5, 'maxVisits': 100}
+    key, symmetry = position_key(data)
+    canonical = symmetry.apply(result_for())
+
+    moved = [transform_point(t, x, y, 19) for x, y in MOVES]
+    other_key, other_symmetry = position_key(dict(data, moves=moved))
+    assert other_key == key
+
+    restored = other_symmetry.restore(canonical)['moveInfos'][0]
+    x, y = transform_point(t, 4, 2, 19)
+    assert (restored['x'], restored['y'], restored['move']) == (x, y, coord_to_gtp(x, y, 19))
+    assert (restored['winrate'], restored['scoreLead']) == (0.6, 2.5)
+
+
+def test_color_swap_negates_black_perspective_values():
+    board = Board(19)
+    board.play(3, 3, BLACK)
+    board.play(15, 15, WHITE)
+    swapped = Board(19)
+    swapped.play(3, 3, WHITE)
+    swapped.play(15, 15, BLACK)
+    swapped.pass_move()  # 轮到白下
+
+    first = canonical_position(board, 6.5)
+    second = canonical_position(swapped, -6.5)
+    assert first[:4] == second[:4]
+    assert first[4].swap != second[4].swap
+
+    canonical = first[4].apply(result_for())
+    restored = second[4].restore(canonical)['moveInfos'][0]
+    assert restored['winrate'] == pytest.approx(0.4)
+    assert restored['scoreLead'] == -2.5
+
+
+def test_identity_leaves_results_untouched():
+    result = result_for()
+    assert Symmetry(19).restore(result) is result
+    assert Symmetry(19, 3).restore(None) is None
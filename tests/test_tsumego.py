@@ -0,0 +1,61 @@
+import random
+import time
+
+import pytest
+
+from server.board import BLACK, WHITE, Board
+from server.tsumego import DIFFICULTY_LEVELS, find_problem, rate, solve
+
+
+def corner_region(size, width, height):
+    return [y * size + x for y in range(height) for x in range(width)]
+
+
+def test_solver_captures_a_single_stone():
+    board = Board(9)
+    board.play(0, 0, WHITE)
+    board.play(1, 0, BLACK)
+    result, solver = solve(board, corner_region(9, 3, 3), 0, BLACK, BLACK)
+    assert result is True
+    assert solver.principal_variation()[0] == (9, BLACK)
+
+
+def test_two_eyes_live():
+    board = Board(9)
+    for x, y in [(1, 0), (3, 0), (0, 1), (1, 1), (2, 1), (3, 1)]:
+        board.play(x, y, WHITE)
+    result, _ = solve(board, corner_region(9, 4, 2), 1, BLACK, BLACK)
+    assert result is False
+
+
+def test_rate_levels():
+    assert rate(1) == ('easy', 1)
+    assert rate(DIFFICULTY_LEVELS[0][2] + 1) == ('medium', 2)
+    assert rate(10 ** 6) == ('hard', 3)
+
+
+@pytest.mark.parametrize('difficulty', ['easy', 'medium'])
+def test_find_problem_matches_difficulty(difficulty):
+    for seed in range(5):
+        problem = find_problem(9, difficulty, random.Random(seed), attempts=2000)
+        assert problem['rating']['level'] == problem['rating']['requested'] == difficulty
+        assert problem['solutions']
+
+
+def test_problem_id_hashes_the_served_position():
+    problem = find_problem(9, 'easy', random.Random(3))
+    board = Board(9)
+    for y, row in enumerate(problem['initialPosition']):
+        for x, color in enumerate(row):
+            if color:
+                board.play(x, y, color)
+    kind = problem['tags'][0]
+    assert problem['id'] == f"pns_{kind}_9_{board.hash:016x}"
+
+
+def test_time_limit_bounds_the_search():
+    assert find_problem(9, 'hard', random.Random(0), time_limit=0) is None
+    started = time.monotonic()
+    find_problem(9, 'hard', random.Random(0), attempts=100000, time_limit=0.5)
+    # 超时检查在两次尝试之间，一次尝试最多求解几次、每次不超过节点预算
+    assert time.monotonic() - started < 5
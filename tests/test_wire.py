@@ -0,0 +1,61 @@
+import base64
+
+import pytest
+
+from server.wire import MoveSessions, SessionMismatch, WireError, decode_request, pack_board, pack_moves, unpack_board, unpack_moves
+
+
+def test_moves_round_trip_little_endian():
+    moves = [(0, 0), (18, 18), (3, 15), (15, 3)]
+    packed = pack_moves(moves, 19)
+    assert base64.b64decode(packed)[:4] == bytes([0, 0, 104, 1])  # 0, 360
+    assert unpack_moves(packed, 19) == moves
+    assert unpack_moves('', 19) == []
+
+
+@pytest.mark.parametrize('text', ['***', base64.b64encode(b'\x01').decode(), pack_moves([(0, 9)], 10)])
+def test_invalid_moves(text):
+    with pytest.raises(WireError):
+        unpack_moves(text, 9)
+
+
+def test_board_round_trip():
+    rows = [[0] * 9 for _ in range(9)]
+    rows[2][3], rows[6][6] = 1, -1
+    assert unpack_board(pack_board(rows), 9) == rows
+    with pytest.raises(WireError):
+        unpack_board(pack_board(rows), 13)
+    with pytest.raises(WireError):
+        unpack_board(base64.b64encode(bytes([2] * 81)).decode(), 9)
+
+
+def test_plain_requests_pass_through():
+    data = {'moves': [{'x': 3, 'y': 3}], 'boardSize': 19}
+    assert decode_request(data, MoveSessions()) is data
+
+
+def test_delta_requests_continue_a_session():
+    sessions = MoveSessions()
+    data = decode_request({'session': 7, 'moves': [{'x': 3, 'y': 3}, {'x': 15, 'y': 15}]}, sessions)
+    assert data['moves'] == [(3, 3), (15, 15)] and data['session'] == '7'
+
+    packed = pack_moves([(15, 3)], 19)
+    data = decode_request({'session': '7', 'baseMoves': 2, 'movesPacked': packed}, sessions)
+    assert data['moves'] == [(3, 3), (15, 15), (15, 3)]
+    assert 'movesPacked' not in data
+
+    # 悔棋：从更早的手数继续
+    data = decode_request({'session': '7', 'baseMoves': 1, 'moves': [{'x': 16, 'y': 16}]}, sessions)
+    assert data['moves'] == [(3, 3), (16, 16)]
+
+    with pytest.raises(SessionMismatch) as error:
+        decode_request({'session': '7', 'baseMoves': 5, 'moves': []}, sessions)
+    assert error.value.stored_moves == 2
+    assert sessions.metrics()['mismatches'] == 1
+
+
+def test_invalid_request_fields():
+    with pytest.raises(WireError):
+        decode_request({'session': 'a', 'baseMoves': 'x'}, MoveSessions())
+    with pytest.raises(WireError):
+        decode_request({'boardSize': 40, 'movesPacked': ''}, MoveSessions())
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+KataGo代理基准测试 - 测量服务器的请求延迟和吞吐量
+
+默认用模拟引擎（tools/fake-katago.py）在独立端口启动 unified-server.py，
+按设定的并发度回放棋谱：每个并发客户端沿着一盘棋逐手向前请求分析，
+与真实对局中前端的请求方式一致。对每个接口输出 p50/p95/p99 延迟、
+每秒请求数，以及每个请求平均发送的GTP命令数。
+
+使用方法:
+python tools/benchmark-server.py
+python tools/benchmark-server.py --concurrency 8 --requests 200 --command-delay 0.002
+python tools/benchmark-server.py --games games.json        # 回放记录的棋谱（着法列表或SGF文件路径的JSON数组）
+python tools/benchmark-server.py --url http://localhost:8000   # 测试已运行的服务器
+
+不依赖第三方库，只使用标准库。
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from server.board import Board, IllegalMove  # noqa: E402
+from server.sgf import alternating_prefix, game_record, iter_games  # noqa: E402
+
+ENDPOINTS = ('analyze', 'analyze-position', 'generate-tsumego')
+
+
+def generate_games(count, board_size, length, seed=1):
+    """生成确定性的合法棋谱（随机落子，跳过非法着法）"""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        board = Board(board_size)
+        moves = []
+        attempts = 0
+        while len(moves) < length and attempts < length * 20:
+            attempts += 1
+            x, y = rng.randrange(board_size), rng.randrange(board_size)
+            try:
+                board.play(x, y, board.to_move)
+            except IllegalMove:
+                continue
+            moves.append({'x': x, 'y': y})
+        games.append(moves)
+    return games
+
+
+def load_games(path):
+    """读取棋谱文件：JSON数组，元素为着法列表 [{'x', 'y'}, ...] 或SGF文件路径（文件中的每局棋都使用，
+    只取第一次停一手或不是黑白交替之前的着法，带摆子的对局跳过）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    games = []
+    base = os.path.dirname(os.path.abspath(path))
+    for entry in entries:
+        if isinstance(entry, str):
+            with open(os.path.join(base, entry), 'r', encoding='utf-8') as f:
+                for root in iter_games(f):
+                    record = game_record(root)
+                    if record['setup']:
+                        continue
+                    moves = record['moves'][:alternating_prefix(record['moves'])]
+                    games.append([{'x': move['x'], 'y': move['y']} for move in moves])
+            continue
+        games.append([{'x': move['x'], 'y': move['y']} for move in entry])
+    return games
+
+
+def http_json(url, payload=None, timeout=300):
+    """发送请求并解析JSON响应，返回 (状态码, 数据)"""
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def gtp_command_count(base_url):
+    """服务器累计发送的GTP命令数（analysis后端没有这一项）"""
+    _, status = http_json(f"{base_url}/api/katago/status")
+    return (status or {}).get('gtpCommands')
+
+
+def start_server(args):
+    """用模拟引擎启动服务器，等待引擎池就绪"""
+    env = dict(os.environ)
+    env.update({
+        'KATAGO_PATH': args.katago_path,
+        'KATAGO_POOL_SIZE': str(args.pool_size),
+        'KATAGO_MAX_WAITERS': str(max(args.concurrency * 2, 16)),
+        'FAKE_KATAGO_COMMAND_DELAY': str(args.command_delay),
+        'FAKE_KATAGO_GENMOVE_DELAY': str(args.genmove_delay),
+        'FAKE_KATAGO_ANALYSIS_DELAY': str(args.genmove_delay),
+    })
+    if args.backend:
+        env['KATAGO_BACKEND'] = args.backend
+    # 默认关闭所有不经过引擎就返回的捷径，测量完整路径
+    if not args.cache:
+        env['KATAGO_CACHE_SIZE'] = '0'
+    if not args.ponder:
+        env['KATAGO_PONDER_REPLIES'] = '0'
+    if not args.opening_book:
+        env['OPENING_BOOK'] = ''
+    if not args.coalesce:
+        env['KATAGO_COALESCE'] = '0'
+
+    log = open(args.server_log, 'w') if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'unified-server.py'), '--port', str(args.port)],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+    base_url = f"http://localhost:{args.port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器启动失败，退出码 {process.returncode}")
+        try:
+            _, status = http_json(f"{base_url}/api/katago/status", timeout=2)
+            if status and status.get('status') == 'ok':
+                return process, base_url
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("等待服务器就绪超时")
+
+
+def run_endpoint(base_url, endpoint, games, args):
+    """以设定并发度请求一个接口，返回统计结果"""
+    board_size = args.board_size
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def client(worker):
+        nonlocal errors
+        game = games[worker % len(games)]
+        turn = 0
+        for _ in counter:
+            if endpoint == 'generate-tsumego':
+                payload = {'difficulty': 'easy', 'boardSize': 9}
+            else:
+                # 沿着棋谱逐手向前，下到终局后从头开始
+                turn = turn % len(game) + 1
+                payload = {
+                    'moves': game[:turn],
+                    'boardSize': board_size,
+                    'komi': 6.5,
+                    'maxVisits': args.max_visits,
+                }
+            start = time.perf_counter()
+            try:
+                status, _ = http_json(f"{base_url}/api/katago/{endpoint}", payload)
+            except (urllib.error.URLError, ConnectionError):
+                status = None
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status != 200:
+                    errors += 1
+
+    commands_before = gtp_command_count(base_url)
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(client, range(args.concurrency)))
+    wall = time.perf_counter() - wall_start
+    commands_after = gtp_command_count(base_url)
+
+    latencies.sort()
+    count = len(latencies)
+
+    def percentile(p):
+        return latencies[min(count - 1, int(count * p / 100))] * 1000 if count else 0.0
+
+    round_trips = None
+    if commands_before is not None and commands_after is not None and count:
+        round_trips = (commands_after - commands_before) / count
+
+    return {
+        'endpoint': endpoint,
+        'requests': count,
+        'errors': errors,
+        'p50Ms': round(percentile(50), 2),
+        'p95Ms': round(percentile(95), 2),
+        'p99Ms': round(percentile(99), 2),
+        'meanMs': round(statistics.mean(latencies) * 1000, 2) if count else 0.0,
+        'requestsPerSecond': round(count / wall, 1) if wall else 0.0,
+        'gtpRoundTrips': round(round_trips, 2) if round_trips is not None else None,
+    }
+
+
+def print_table(results):
+    header = f"{'接口':<20}{'请求数':>8}{'错误':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'请求/秒':>10}{'GTP/请求':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        round_trips = f"{r['gtpRoundTrips']:.2f}" if r['gtpRoundTrips'] is not None else "-"
+        print(f"{r['endpoint']:<20}{r['requests']:>8}{r['errors']:>6}{r['p50Ms']:>10.2f}{r['p95Ms']:>10.2f}"
+              f"{r['p99Ms']:>10.2f}{r['requestsPerSecond']:>10.1f}{round_trips:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KataGo代理基准测试")
+    parser.add_argument('--url', help="测试已运行的服务器（不自动启动）")
+    parser.add_argument('--port', type=int, default=8765, help="自动启动服务器时使用的端口")
+    parser.add_argument('--katago-path', default=os.path.join(ROOT, 'tools', 'fake-katago.py'),
+                        help="引擎程序，默认使用模拟引擎")
+    parser.add_argument('--backend', choices=('gtp', 'analysis'), help="KATAGO_BACKEND")
+    parser.add_argument('--pool-size', type=int, default=2, help="引擎池大小")
+    parser.add_argument('--command-delay', type=float, default=0.0, help="模拟引擎每条GTP命令的延迟（秒）")
+    parser.add_argument('--genmove-delay', type=float, default=0.0, help="模拟引擎每次搜索的延迟（秒）")
+    parser.add_argument('--cache', action='store_true', help="保留分析缓存（默认关闭，测量完整路径）")
+    parser.add_argument('--ponder', action='store_true', help="保留后台预读（默认关闭）")
+    parser.add_argument('--opening-book', action='store_true', help="使用开局库（默认关闭）")
+    parser.add_argument('--coalesce', action='store_true', help="合并相同局面的并发请求（默认关闭）")
+    parser.add_argument('--concurrency', type=int, default=4, help="并发客户端数")
+    parser.add_argument('--requests', type=int, default=100, help="每个接口的请求数")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="要测试的接口，逗号分隔")
+    parser.add_argument('--games', help="棋谱文件（JSON数组）")
+    parser.add_argument('--board-size', type=int, default=19)
+    parser.add_argument('--game-length', type=int, default=120, help="自动生成棋谱的手数")
+    parser.add_argument('--max-visits', type=int, default=100)
+    parser.add_argument('--server-log', help="把服务器输出写入该文件")
+    parser.add_argument('--json', action='store_true', help="以JSON输出结果")
+    args = parser.parse_args()
+
+    if args.games:
+        games = load_games(args.games)
+    else:
+        games = generate_games(max(1, args.concurrency), args.board_size, args.game_length)
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        process, base_url = start_server(args)
+
+    try:
+        results = []
+        for endpoint in args.endpoints.split(','):
+            endpoint = endpoint.strip()
+            if endpoint not in ENDPOINTS:
+                parser.error(f"未知接口: {endpoint}")
+            results.append(run_endpoint(base_url, endpoint, games, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == '__main__':
+    main()
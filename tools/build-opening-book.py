@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+从SGF棋谱离线生成开局库 - 统计每个局面之后的着法、次数和棋谱结果
+
+SGF文件可以是包含多局棋的棋谱集合，逐局流式读取，只统计每局的主线。
+
+局面按8种对称变换规范化，同形的局面合并统计；局面本身对称时（例如空棋盘），
+等价的着法也合并为一个。每个着法保存出现次数、黑方胜率（胜1、和0.5）和平均目差
+（只统计 "B+3.5" 这样有目数的结果）。服务器用mmap读取生成的文件，
+开局库中的局面直接返回，不经过引擎。
+
+使用方法:
+python tools/build-opening-book.py games/
+python tools/build-opening-book.py games/*.sgf --max-moves 30 --min-count 5
+python tools/build-opening-book.py games/ --output /data/opening-book.bin --top-moves 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from server.board import Board, IllegalMove  # noqa: E402
+from server.opening_book import book_key, write_book  # noqa: E402
+from server.sgf import SGFError, alternating_prefix, game_record, iter_games, sgf_files  # noqa: E402
+from server.symmetry import symmetric_hashes, transform_table  # noqa: E402
+
+
+def parse_result(result):
+    """'B+3.5' -> (1.0, 3.5)，'W+R' -> (0.0, None)，和棋 -> (0.5, 0.0)，无法识别 -> (None, None)"""
+    if not result:
+        return None, None
+    result = result.strip().upper()
+    if result in ('0', 'DRAW', 'JIGO'):
+        return 0.5, 0.0
+    if len(result) < 2 or result[0] not in 'BW' or result[1] != '+':
+        return None, None
+    black_won = result[0] == 'B'
+    try:
+        margin = float(result[2:])
+    except ValueError:
+        return (1.0 if black_won else 0.0), None
+    return (1.0 if black_won else 0.0), (margin if black_won else -margin)
+
+
+def canonical_move(board, x, y):
+    """着法在规范方向上的点下标；局面对称时在所有等价变换中取最小的下标"""
+    hashes = symmetric_hashes(board)
+    best = min(hashes)
+    tables = transform_table(board.size)
+    point = y * board.size + x
+    return min(tables[t][point] for t, value in enumerate(hashes) if value == best)
+
+
+def add_game(stats, game, max_moves):
+    """把一局棋的前 max_moves 手计入统计，返回是否使用了这局棋"""
+    moves = game['moves'][:max_moves]
+    # 只统计黑先、交替落子的对局（让子棋和中途停一手的对局跳过）
+    if not moves or game['setup'] or alternating_prefix(moves) < len(moves):
+        return False
+    black_score, margin = parse_result(game.get('result'))
+    if black_score is None:
+        return False
+
+    board = Board(game['boardSize'])
+    for i, move in enumerate(moves):
+        key, _ = book_key(board)
+        point = canonical_move(board, move['x'], move['y'])
+        entry = stats.setdefault(key, {}).setdefault(point, [0, 0.0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += black_score
+        if margin is not None:
+            entry[2] += margin
+            entry[3] += 1
+        try:
+            board.play(move['x'], move['y'], 1 if i % 2 == 0 else -1)
+        except IllegalMove:
+            break
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从SGF棋谱生成开局库")
+    parser.add_argument('paths', nargs='+', help="SGF文件或目录")
+    parser.add_argument('--output', default=os.path.join(ROOT, 'opening-book.bin'), help="开局库文件")
+    parser.add_argument('--max-moves', type=int, default=30, help="每局统计的手数")
+    parser.add_argument('--min-count', type=int, default=2, help="着法至少出现的次数，更少的不写入")
+    parser.add_argument('--top-moves', type=int, default=8, help="每个局面最多保存的着法数")
+    args = parser.parse_args()
+
+    started = time.time()
+    stats = {}
+    games = skipped = 0
+    for path in sgf_files(args.paths):
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for root in iter_games(f):
+                    if add_game(stats, game_record(root), args.max_moves):
+                        games += 1
+                    else:
+                        skipped += 1
+        except (OSError, SGFError) as e:
+            # 文件中出错位置之前的对局已经统计
+            print(f"跳过 {path} 的其余部分: {e}")
+            skipped += 1
+
+    positions = {}
+    for key, moves in stats.items():
+        kept = [
+            (point, count, black_wins / count, score_sum / scored if scored else 0.0)
+            for point, (count, black_wins, score_sum, scored) in moves.items()
+            if count >= args.min_count
+        ]
+        if kept:
+            kept.sort(key=lambda move: -move[1])
+            positions[key] = kept[:args.top_moves]
+
+    write_book(args.output, positions, args.max_moves)
+    print(f"{games} 局棋谱（跳过 {skipped}），{len(positions)} 个局面写入 {args.output}，"
+          f"用时 {time.time() - started:.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()
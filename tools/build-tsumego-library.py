@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+离线生成死活题库 - 多进程生成并验证题目，写入SQLite题库
+
+每道题都经过证明数搜索验证（黑先有解、不走不行、正解不超过两个），
+相同局面（按Zobrist哈希去重）只保存一次。服务器通过 /api/problems 读取题库，
+请求时不需要引擎。
+
+使用方法:
+python tools/build-tsumego-library.py --count 1000
+python tools/build-tsumego-library.py --count 3000 --board-sizes 9,13,19 --workers 8
+python tools/build-tsumego-library.py --output /data/tsumego-library.sqlite --node-budget 10000
+
+可以多次运行向同一题库追加题目（使用不同的 --seed）。
+
+也可以用 --sgf 从SGF死活题集合导入（不生成）：每局棋为一道题，根节点的AB/AW为题目局面，
+根节点之后的变化为解答，注释含 RIGHT/CORRECT/正解 的变化为正解（都没有标记时取主线的
+第一手）；只导入黑先的题目，难度由 --sgf-difficulty 指定。
+python tools/build-tsumego-library.py --sgf problems/ --sgf-difficulty hard
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from server.board import BLACK, EMPTY, WHITE, zobrist_table  # noqa: E402
+from server.problem_library import ProblemLibrary  # noqa: E402
+from server.sgf import SGFError, game_record, iter_games, main_line, node_moves, sgf_files  # noqa: E402
+from server.tsumego import DIFFICULTY_LEVELS, find_problem  # noqa: E402
+
+BATCH_SIZE = 20
+
+# SGF死活题中标记正解变化的注释
+SOLUTION_MARKERS = ('RIGHT', 'CORRECT', '正解')
+
+
+def generate_batch(board_size, difficulty, count, seed, node_budget, attempts):
+    """工作进程入口：生成一批指定难度的题目（找不到合适难度的题目丢弃）"""
+    rng = random.Random(seed)
+    problems = []
+    for _ in range(count):
+        problem = find_problem(board_size, difficulty, rng, node_budget, attempts)
+        if problem and problem['rating']['level'] == difficulty:
+            problems.append(problem)
+    return problems
+
+
+def marked_solution(node):
+    """变化中有节点的注释带正解标记"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        comment = node.get('C', '').upper()
+        if any(marker in comment for marker in SOLUTION_MARKERS):
+            return True
+        stack.extend(node.children)
+    return False
+
+
+def sgf_problem(root, difficulty, source):
+    """把一道SGF死活题转换为题库格式，没有摆子或不是黑先的返回None"""
+    record = game_record(root)
+    size = record['boardSize']
+    if not record['setup'] or root.get('PL', 'B').upper() != 'B':
+        return None
+
+    zobrist = zobrist_table(size)
+    position = [[EMPTY] * size for _ in range(size)]
+    position_hash = 0
+    for stone in record['setup']:
+        color = BLACK if stone['color'] == 'B' else WHITE
+        position[stone['y']][stone['x']] = color
+        position_hash ^= zobrist[stone['y'] * size + stone['x']][0 if color == BLACK else 1]
+
+    first_moves = []
+    for child in root.children:
+        moves = node_moves(child, size)
+        if not moves or moves[0]['color'] != 'B':
+            return None
+        first_moves.append((child, moves[0]))
+    if not first_moves:
+        return None
+    if any(marked_solution(child) for child, _ in first_moves):
+        solutions = [move for child, move in first_moves if marked_solution(child)]
+    else:
+        solutions = [first_moves[0][1]]
+
+    variation = [move for node in main_line(root) for move in node_moves(node, size)]
+    name, value, _ = next(level for level in DIFFICULTY_LEVELS if level[0] == difficulty)
+    return {
+        'id': f'sgf_{size}_{position_hash:016x}',
+        'title': root.get('GN') or 'SGF导入 - 黑先',
+        'difficulty': value,
+        'description': root.get('C') or '黑先',
+        'boardSize': size,
+        'initialPosition': position,
+        'solutions': [{'x': move['x'], 'y': move['y'], 'reason': '正解'} for move in solutions],
+        'hints': [f'正解共 {len(solutions)} 个'],
+        'tags': ['sgf'],
+        'principalVariation': variation,
+        'rating': {'level': name, 'nodes': 0, 'depth': len(variation)},
+        'generated': False,
+        'source': source
+    }
+
+
+def import_sgf(library, paths, difficulty):
+    """从SGF死活题集合逐局导入，返回 (新增数, 读到的题数, 跳过数)"""
+    added = found = skipped = 0
+    problems = []
+    for path in sgf_files(paths):
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for root in iter_games(f):
+                    problem = sgf_problem(root, difficulty, os.path.basename(path))
+                    if problem is None:
+                        skipped += 1
+                        continue
+                    problems.append(problem)
+                    found += 1
+                    if len(problems) >= BATCH_SIZE:
+                        added += library.add(problems)
+                        problems = []
+        except (OSError, SGFError) as e:
+            print(f"跳过 {path} 的其余部分: {e}")
+            skipped += 1
+    added += library.add(problems)
+    return added, found, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线生成死活题库")
+    parser.add_argument('--output', default=os.path.join(ROOT, 'tsumego-library.sqlite'), help="题库文件")
+    parser.add_argument('--count', type=int, default=300, help="每种棋盘大小、每个难度生成的题数")
+    parser.add_argument('--board-sizes', default='9', help="棋盘大小，逗号分隔")
+    parser.add_argument('--difficulties', default=','.join(level[0] for level in DIFFICULTY_LEVELS),
+                        help="难度，逗号分隔")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument('--node-budget', type=int, default=5000, help="每次证明数搜索的节点预算")
+    parser.add_argument('--attempts', type=int, default=200, help="每道题最多尝试的随机局面数")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sgf', nargs='+', help="从SGF死活题文件或目录导入，不生成题目")
+    parser.add_argument('--sgf-difficulty', default='medium', choices=[level[0] for level in DIFFICULTY_LEVELS],
+                        help="导入题目的难度")
+    args = parser.parse_args()
+
+    library = ProblemLibrary(args.output, readonly=False)
+    if args.sgf:
+        added, found, skipped = import_sgf(library, args.sgf, args.sgf_difficulty)
+        print(f"导入：读到 {found} 道题，新增 {added} 道（跳过 {skipped}），题库共 {library.count()} 道")
+        library.close()
+        return
+    tasks = []
+    seed = args.seed * 1000003
+    for board_size in (int(size) for size in args.board_sizes.split(',')):
+        for difficulty in (name.strip() for name in args.difficulties.split(',')):
+            for start in range(0, args.count, BATCH_SIZE):
+                seed += 1
+                tasks.append((board_size, difficulty, min(BATCH_SIZE, args.count - start), seed))
+
+    print(f"生成 {len(tasks)} 批题目，{args.workers} 个工作进程，写入 {args.output}")
+    start = time.time()
+    added = generated = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(generate_batch, board_size, difficulty, count, seed, args.node_budget, args.attempts)
+            for board_size, difficulty, count, seed in tasks
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            problems = future.result()
+            generated += len(problems)
+            added += library.add(problems)
+            print(f"[{done}/{len(tasks)}] 已生成 {generated} 道，新增 {added} 道，用时 {time.time() - start:.1f} 秒")
+
+    print(f"完成：新增 {added} 道题（重复 {generated - added} 道），题库共 {library.count()} 道")
+    for board_size, difficulty, tag, count in library.groups():
+        print(f"  {board_size}路 难度{difficulty} {tag}: {count}")
+    library.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+模拟KataGo引擎 - 在没有KataGo二进制和模型的机器上测试服务器
+
+实现服务器用到的GTP命令子集，着法选择是确定性的（按星位、再按离中心距离）。
+命令行参数与KataGo一致，可以直接作为KATAGO_PATH使用:
+
+KATAGO_PATH=tools/fake-katago.py python unified-server.py
+
+支持 `gtp` 和 `analysis`（JSON分析引擎）两种模式。
+
+环境变量:
+FAKE_KATAGO_COMMAND_DELAY   每条GTP命令的延迟秒数，模拟进程通信开销（默认0）
+FAKE_KATAGO_GENMOVE_DELAY   每次genmove额外的延迟秒数（默认0）
+FAKE_KATAGO_ANALYSIS_DELAY  每个分析查询的延迟秒数（默认0）
+FAKE_KATAGO_TURN_DELAY      多手数查询中每一手的延迟秒数（默认0）
+"""
+
+import json
+import os
+import select
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LETTERS = "ABCDEFGHJKLMNOPQRSTUVWXYZ"
+
+
+class FakeGoBoard:
+    def __init__(self, size=19):
+        self.size = size
+        self.stones = {}
+        self.history = []
+
+    def clear(self):
+        self.stones = {}
+        self.history = []
+
+    def parse_vertex(self, vertex):
+        if vertex.lower() == "pass":
+            return None
+        x = LETTERS.index(vertex[0].upper())
+        y = self.size - int(vertex[1:])
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise ValueError(vertex)
+        return x, y
+
+    def vertex(self, point):
+        if point is None:
+            return "pass"
+        x, y = point
+        return f"{LETTERS[x]}{self.size - y}"
+
+    def play(self, color, vertex):
+        point = self.parse_vertex(vertex)
+        if point is not None and point in self.stones:
+            raise ValueError("illegal move")
+        if point is not None:
+            self.stones[point] = color
+        self.history.append(point)
+
+    def undo(self):
+        if not self.history:
+            raise ValueError("cannot undo")
+        point = self.history.pop()
+        if point is not None:
+            del self.stones[point]
+
+    def candidate_points(self):
+        lo, mid, hi = 3 if self.size >= 13 else 2, self.size // 2, self.size - (4 if self.size >= 13 else 3)
+        stars = [(hi, lo), (lo, hi), (hi, hi), (lo, lo), (mid, mid)]
+        rest = sorted(
+            ((x, y) for y in range(self.size) for x in range(self.size)),
+            key=lambda p: (abs(p[0] - mid) + abs(p[1] - mid), p[1], p[0])
+        )
+        return stars + rest
+
+    def choose_move(self):
+        for point in self.candidate_points():
+            if point not in self.stones:
+                return point
+        return None
+
+    def showboard(self):
+        rows = [f"MoveNum: {len(self.history)}"]
+        rows.append("   " + " ".join(LETTERS[:self.size]))
+        for y in range(self.size):
+            cells = []
+            for x in range(self.size):
+                color = self.stones.get((x, y))
+                cells.append("X" if color == "b" else "O" if color == "w" else ".")
+            rows.append(f"{self.size - y:2d} " + " ".join(cells))
+        next_player = "White" if len(self.history) % 2 else "Black"
+        rows.append(f"Next player: {next_player}")
+        return "\n".join(rows)
+
+
+class StdinLines:
+    """基于select的按行读取，kata-analyze输出期间可以检测到新命令"""
+
+    def __init__(self):
+        self.buffer = b""
+        self.eof = False
+
+    def readline(self, timeout=None):
+        """返回一行；超时返回None；EOF返回空字符串"""
+        while b"\n" not in self.buffer:
+            if self.eof:
+                line, self.buffer = self.buffer, b""
+                return line.decode()
+            ready, _, _ = select.select([0], [], [], timeout)
+            if not ready:
+                return None
+            chunk = os.read(0, 4096)
+            if not chunk:
+                self.eof = True
+            self.buffer += chunk
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line.decode() + "\n"
+
+
+def analyze_line(board, color, visits, root_info=False):
+    """生成一行kata-analyze输出（胜率按轮到下棋的一方）；
+    候选着法的访问数之和小于根节点访问数，root_info 时在行尾加上 rootInfo"""
+    black = sum(1 for c in board.stones.values() if c == "b")
+    white = len(board.stones) - black
+    lead = black - white - 6.5
+    if color == "w":
+        lead = -lead
+    winrate = max(0.05, min(0.95, 0.5 + lead / 40))
+    infos = []
+    candidates = (p for p in board.candidate_points() if p not in board.stones)
+    for order, point in enumerate(candidates):
+        if order >= 3:
+            break
+        move = board.vertex(point).upper()
+        infos.append(
+            f"info move {move} visits {max(1, visits >> (order + 1))} winrate {winrate:.4f} "
+            f"scoreMean {lead:.2f} scoreLead {lead:.2f} prior {0.5 / (order + 1):.3f} order {order} pv {move}"
+        )
+    if root_info:
+        infos.append(f"rootInfo visits {visits} winrate {winrate:.4f} scoreLead {lead:.2f}")
+    return " ".join(infos)
+
+
+def normalize_color(color):
+    color = color.lower()
+    if color in ("b", "black"):
+        return "b"
+    if color in ("w", "white"):
+        return "w"
+    raise ValueError(color)
+
+
+def run_gtp():
+    board = FakeGoBoard()
+    params = {}
+    command_delay = float(os.environ.get("FAKE_KATAGO_COMMAND_DELAY", "0"))
+    genmove_delay = float(os.environ.get("FAKE_KATAGO_GENMOVE_DELAY", "0"))
+
+    sys.stderr.write("KataGo fake engine: GTP ready\n")
+    sys.stderr.flush()
+
+    stdin = StdinLines()
+    pending = None
+    while True:
+        raw = pending if pending is not None else stdin.readline()
+        pending = None
+        if not raw:
+            return
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        parts = line.split()
+        command_id = ""
+        if parts[0].isdigit():
+            command_id = parts.pop(0)
+        if not parts:
+            continue
+        name, args = parts[0], parts[1:]
+        if command_delay:
+            time.sleep(command_delay)
+
+        ok, result = True, ""
+        try:
+            if name == "protocol_version":
+                result = "2"
+            elif name == "name":
+                result = "KataGo"
+            elif name == "version":
+                result = "fake"
+            elif name == "boardsize":
+                board = FakeGoBoard(int(args[0]))
+            elif name == "komi":
+                float(args[0])
+            elif name == "clear_board":
+                board.clear()
+            elif name == "play":
+                board.play(normalize_color(args[0]), args[1])
+            elif name == "undo":
+                board.undo()
+            elif name == "genmove":
+                if genmove_delay:
+                    time.sleep(genmove_delay)
+                color = normalize_color(args[0])
+                vertex = board.vertex(board.choose_move())
+                board.play(color, vertex)
+                result = vertex.upper() if vertex != "pass" else "pass"
+            elif name == "showboard":
+                result = board.showboard()
+            elif name == "kata-set-param":
+                params[args[0]] = args[1]
+            elif name == "kata-analyze":
+                # 持续输出分析行，直到收到下一条命令
+                color = normalize_color(args[0])
+                interval = int(args[1]) / 100.0 if len(args) > 1 else 0.1
+                root_info = any(a == "rootInfo" and b == "true" for a, b in zip(args, args[1:]))
+                sys.stdout.write(f"={command_id}\n")
+                sys.stdout.flush()
+                visits = 0
+                while True:
+                    pending = stdin.readline(timeout=interval)
+                    if pending is not None:
+                        break
+                    visits += 50
+                    sys.stdout.write(analyze_line(board, color, visits, root_info) + "\n")
+                    sys.stdout.flush()
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+                continue
+            elif name == "quit":
+                sys.stdout.write(f"={command_id}\n\n")
+                sys.stdout.flush()
+                return
+            else:
+                ok, result = False, "unknown command"
+        except (ValueError, IndexError) as e:
+            ok, result = False, str(e) or "illegal move"
+
+        prefix = "=" if ok else "?"
+        sys.stdout.write(f"{prefix}{command_id} {result}".rstrip() + "\n\n")
+        sys.stdout.flush()
+
+
+def analyze_query(query, turn, visits=None):
+    """为一条分析查询的某一手生成确定性的结果，visits 为已完成的访问数（默认maxVisits）"""
+    size = query.get("boardXSize", 19)
+    board = FakeGoBoard(size)
+    for color, vertex in query.get("moves", [])[:turn]:
+        board.play(normalize_color(color), vertex)
+
+    black = sum(1 for color in board.stones.values() if color == "b")
+    white = len(board.stones) - black
+    score_lead = black - white - float(query.get("komi", 6.5))
+    winrate = max(0.05, min(0.95, 0.5 + score_lead / 40))
+    if visits is None:
+        visits = int(query.get("maxVisits", 100))
+    player = "W" if turn % 2 else "B"
+
+    move_infos = []
+    for order, point in enumerate(p for p in board.candidate_points() if p not in board.stones):
+        if order >= 5:
+            break
+        move_infos.append({
+            "move": board.vertex(point).upper(),
+            "order": order,
+            "visits": max(1, visits >> (order + 1)),
+            "winrate": winrate,
+            "scoreLead": score_lead,
+            "scoreMean": score_lead,
+            "prior": 0.5 / (order + 1),
+        })
+
+    return {
+        "id": query["id"],
+        "turnNumber": turn,
+        "moveInfos": move_infos,
+        "rootInfo": {"winrate": winrate, "scoreLead": score_lead, "visits": visits, "currentPlayer": player},
+    }
+
+
+def run_analysis():
+    delay = float(os.environ.get("FAKE_KATAGO_ANALYSIS_DELAY", "0"))
+    turn_delay = float(os.environ.get("FAKE_KATAGO_TURN_DELAY", "0"))
+    write_lock = threading.Lock()
+    terminated = set()
+
+    def write(obj):
+        with write_lock:
+            sys.stdout.write(json.dumps(obj) + "\n")
+            sys.stdout.flush()
+
+    def handle(query):
+        turns = query.get("analyzeTurns") or [len(query.get("moves", []))]
+        every = query.get("reportDuringSearchEvery")
+        if every:
+            # 搜索过程中的中间结果
+            max_visits = int(query.get("maxVisits", 100))
+            for step in range(1, 4):
+                time.sleep(every)
+                if query["id"] in terminated:
+                    return
+                try:
+                    write(dict(analyze_query(query, turns[-1], max_visits * step // 4), isDuringSearch=True))
+                except (ValueError, IndexError):
+                    break
+        if delay:
+            time.sleep(delay)
+        if query["id"] in terminated:
+            return
+        for turn in turns:
+            if turn_delay:
+                time.sleep(turn_delay)
+                if query["id"] in terminated:
+                    return
+            try:
+                write(analyze_query(query, turn))
+            except (ValueError, IndexError) as e:
+                write({"id": query["id"], "error": f"illegal move: {e}"})
+                return
+
+    sys.stderr.write("KataGo fake engine: analysis ready\n")
+    sys.stderr.flush()
+
+    # 多线程处理，使响应可以乱序返回
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for raw in sys.stdin:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                query = json.loads(line)
+            except ValueError:
+                write({"error": "could not parse json"})
+                continue
+            if query.get("action") == "terminate":
+                terminated.add(query.get("terminateId"))
+                write({"id": query.get("id"), "action": "terminate", "terminateId": query.get("terminateId")})
+                continue
+            executor.submit(handle, query)
+
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else "gtp"
+    if mode == "gtp":
+        run_gtp()
+    elif mode == "analysis":
+        run_analysis()
+    else:
+        sys.stderr.write(f"unsupported mode: {mode}\n")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
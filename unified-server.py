@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 统一服务器 - 同时提供网页服务和KataGo代理
-运行在8000端口，彻底解决CORS问题
+运行在8000端口（可用 --port 参数或 SERVER_PORT 环境变量修改），彻底解决CORS问题
 
 安装要求:
 pip install flask
@@ -11,26 +11,153 @@ python unified-server.py
 然后访问 http://localhost:8000
 """
 
-import json
-import subprocess
-import tempfile
+import atexit
+import math
+import sys
+import time
 import os
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from flask import Flask, Response, g, request, jsonify, send_from_directory, send_file, stream_with_context
+
+from server.analysis_cache import AnalysisCache, position_key
+from server.analysis_engine import KataGoAnalysisEngine
+from server.asgi import StreamRequestError, create_asgi_app, format_sse
+from server.board import BLACK, WHITE, Board, IllegalMove
+from server.coords import coord_to_gtp, gtp_to_coord, request_moves
+from server.engine_pool import EnginePool, EnginePoolExhausted, EngineNotReady, EngineUnavailable
+from server.gtp_client import GTPClient, GTPError, GTPTimeout
+from server.log import configure as configure_logging, get_logger, levels as log_levels, set_level as set_log_level
+from server.mcts import MCTSEngine
+from server.opening_book import OpeningBook
+from server.ponder import Ponderer
+from server.metrics import GTP_COMMAND_ERRORS, GTP_COMMAND_SECONDS, REQUEST_ERRORS, REQUEST_SECONDS, STAGE_SECONDS, registry as metrics_registry
+from server.problem_library import ProblemLibrary, difficulty_value
+from server.sgf import SGFError, dumps_tree, game_tree, request_from_sgf
+from server.singleflight import SingleFlight
+from server.tsumego import find_problem
+from server.wire import ENCODING as PACKED_ENCODING, MoveSessions, SessionMismatch, WireError, decode_request, pack_board, pack_ownership
+
+try:
+    from server.influence import estimate_ownership, estimate_score, territory_counts
+except ImportError:
+    estimate_ownership = None  # 势力估计需要 pip install numpy
 
 app = Flask(__name__)
 
-# KataGo配置
-KATAGO_PATH = "/opt/homebrew/Cellar/katago/1.16.3/bin/katago"
-MODEL_PATH = "/opt/homebrew/Cellar/katago/1.16.3/share/katago/g170-b40c256x2-s5095420928-d1229425124.bin.gz"
-CONFIG_PATH = "/opt/homebrew/Cellar/katago/1.16.3/share/katago/configs/gtp_example.cfg"
+# KataGo配置（可通过环境变量覆盖，例如指向 tools/fake-katago.py 进行测试）
+KATAGO_PATH = os.environ.get("KATAGO_PATH", "/opt/homebrew/Cellar/katago/1.16.3/bin/katago")
+MODEL_PATH = os.environ.get("KATAGO_MODEL", "/opt/homebrew/Cellar/katago/1.16.3/share/katago/g170-b40c256x2-s5095420928-d1229425124.bin.gz")
+CONFIG_PATH = os.environ.get("KATAGO_CONFIG", "/opt/homebrew/Cellar/katago/1.16.3/share/katago/configs/gtp_example.cfg")
+ANALYSIS_CONFIG_PATH = os.environ.get("KATAGO_ANALYSIS_CONFIG", "/opt/homebrew/Cellar/katago/1.16.3/share/katago/configs/analysis_example.cfg")
+
+# 分析后端：gtp = 引擎池逐条发送GTP命令；analysis = 单个 `katago analysis` 进程批量处理JSON查询
+KATAGO_BACKEND = os.environ.get("KATAGO_BACKEND", "gtp")
+KATAGO_ANALYSIS_MAX_INFLIGHT = int(os.environ.get("KATAGO_ANALYSIS_MAX_INFLIGHT", 64))
+KATAGO_ANALYSIS_TIMEOUT = float(os.environ.get("KATAGO_ANALYSIS_TIMEOUT", 60))
+
+# 分析结果缓存：条目数上限、有效期（秒）、持久化文件（为空则只保存在内存中）
+KATAGO_CACHE_SIZE = int(os.environ.get("KATAGO_CACHE_SIZE", 10000))
+KATAGO_CACHE_TTL = float(os.environ.get("KATAGO_CACHE_TTL", 3600))
+KATAGO_CACHE_FILE = os.environ.get("KATAGO_CACHE_FILE") or None
+
+# 相同局面同时到达的分析请求只计算一次（0为关闭，基准测试用）
+KATAGO_COALESCE = os.environ.get("KATAGO_COALESCE", "1") != "0"
+
+# 引擎池配置：每个引擎是一个独立的KataGo进程
+KATAGO_POOL_SIZE = int(os.environ.get("KATAGO_POOL_SIZE", max(1, min(4, (os.cpu_count() or 2) // 2))))
+KATAGO_MAX_WAITERS = int(os.environ.get("KATAGO_MAX_WAITERS", KATAGO_POOL_SIZE * 4))
+KATAGO_CHECKOUT_TIMEOUT = float(os.environ.get("KATAGO_CHECKOUT_TIMEOUT", 30))
+
+# 排队时访问数随排队长度缩减的下限；analysis后端中对弈请求的查询优先级（复盘为0）
+KATAGO_MIN_VISITS = int(os.environ.get("KATAGO_MIN_VISITS", 50))
+KATAGO_INTERACTIVE_PRIORITY = int(os.environ.get("KATAGO_INTERACTIVE_PRIORITY", 10))
+
+# 引擎监护：空闲引擎的ping间隔和截止时间（秒），重启后预热分析的访问数（0表示不预热）
+KATAGO_PING_INTERVAL = float(os.environ.get("KATAGO_PING_INTERVAL", 5))
+KATAGO_PING_TIMEOUT = float(os.environ.get("KATAGO_PING_TIMEOUT", 2))
+KATAGO_WARMUP_VISITS = int(os.environ.get("KATAGO_WARMUP_VISITS", 16))
+
+# 没有KataGo时的后备引擎：mcts 使用内置蒙特卡洛树搜索，none 直接返回错误
+KATAGO_FALLBACK = os.environ.get("KATAGO_FALLBACK", "mcts")
+KATAGO_FALLBACK_WORKERS = int(os.environ.get("KATAGO_FALLBACK_WORKERS", min(4, os.cpu_count() or 1)))
+KATAGO_FALLBACK_TIME = float(os.environ.get("KATAGO_FALLBACK_TIME", 5))
+
+# 死活题生成：每次证明数搜索的节点预算、每个请求最多尝试的随机局面数和秒数
+TSUMEGO_NODE_BUDGET = int(os.environ.get("TSUMEGO_NODE_BUDGET", 5000))
+TSUMEGO_ATTEMPTS = int(os.environ.get("TSUMEGO_ATTEMPTS", 1000))
+TSUMEGO_TIME_LIMIT = float(os.environ.get("TSUMEGO_TIME_LIMIT", 3))
+
+# 离线生成的死活题库（tools/build-tsumego-library.py）
+TSUMEGO_LIBRARY = os.environ.get("TSUMEGO_LIBRARY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tsumego-library.sqlite"))
+
+# 开局库（tools/build-opening-book.py）：库中局面的总次数不少于该值时直接返回，不经过引擎
+OPENING_BOOK = os.environ.get("OPENING_BOOK", os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening-book.bin"))
+OPENING_BOOK_MIN_COUNT = int(os.environ.get("OPENING_BOOK_MIN_COUNT", 5))
+
+# 增量请求（只发送新增着法）的会话数上限和有效期（秒）
+MOVE_SESSIONS = int(os.environ.get("MOVE_SESSIONS", 1000))
+MOVE_SESSION_TTL = float(os.environ.get("MOVE_SESSION_TTL", 3600))
+
+# 后台预读：/api/katago/analyze 返回后预先分析的应手数（0表示关闭）、预读结果的有效期（秒）
+KATAGO_PONDER_REPLIES = int(os.environ.get("KATAGO_PONDER_REPLIES", 3))
+KATAGO_PONDER_TTL = float(os.environ.get("KATAGO_PONDER_TTL", 120))
+
+# 整盘复盘：胜率下降超过该阈值的着法标记为恶手
+KATAGO_BLUNDER_THRESHOLD = float(os.environ.get("KATAGO_BLUNDER_THRESHOLD", 0.1))
+
+# 服务器端口（也可以用 --port 参数指定）
+SERVER_PORT = int(os.environ.get("SERVER_PORT", 8000))
+
+# GTP命令截止时间（秒）：genmove需要搜索，其他命令应当立即返回
+KATAGO_COMMAND_TIMEOUT = float(os.environ.get("KATAGO_COMMAND_TIMEOUT", 10))
+KATAGO_GENMOVE_TIMEOUT = float(os.environ.get("KATAGO_GENMOVE_TIMEOUT", 120))
+
+# 流式分析参数：推送间隔和单次分析的最长时间（秒）
+KATAGO_STREAM_INTERVAL = float(os.environ.get("KATAGO_STREAM_INTERVAL", 0.1))
+KATAGO_STREAM_MAX_DURATION = float(os.environ.get("KATAGO_STREAM_MAX_DURATION", 30))
+
+# 限时请求的截止时间已经过了时（排队太久），仍然至少搜索这么多秒以便返回一个结果
+MIN_SEARCH_TIME = 0.05
+
+# 日志：默认级别、单独设置的模块级别（如 gtp=DEBUG,routes=WARNING）、格式（text或json）、
+# 逐手调试事件的抽样间隔（打开DEBUG时每N条输出一条）
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_SAMPLE_EVERY = int(os.environ.get("LOG_SAMPLE_EVERY", 100))
+
+configure_logging(LOG_LEVEL, LOG_LEVELS, json_lines=LOG_FORMAT == "json", sample_every=LOG_SAMPLE_EVERY)
+gtp_log = get_logger('gtp')
+engine_log = get_logger('engine')
+route_log = get_logger('routes')
 
 class KataGoEngine:
     def __init__(self):
-        self.process = None
+        self.process = None  # GTPClient
         self.is_initialized = False
+        
+        # 引擎中当前的局面：棋盘大小、贴目和已下的着法 [(color, gtp_move), ...]
+        # board_moves 为 None 表示状态未知，下次分析需要 clear_board 重建
+        self.board_size = None
+        self.komi = None
+        self.board_moves = None
+        
+        # 与board_moves对应的本地棋盘，形势评估直接读取，不需要showboard
+        self._board = None
+        self._board_moves_seen = ()
+        
+        # 已设置的 kata-set-param 参数，值不变时不再发送
+        self.params = {}
+        
+        # 累计发送的GTP命令数（基准测试用来统计每个请求的往返次数）
+        self.command_count = 0
     
     def start(self):
         """启动KataGo进程"""
+        self.board_moves = None
+        self.params = {}
+        started = time.perf_counter()
         try:
             cmd = [
                 KATAGO_PATH,
@@ -39,138 +166,244 @@ class KataGoEngine:
                 "-config", CONFIG_PATH
             ]
             
-            self.process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1
-            )
+            self.process = GTPClient(cmd)
+            self.process.start()
+            self.is_initialized = True
             
-            # 发送初始化命令
-            self.send_command("protocol_version")
+            # 发送初始化命令（加载模型可能需要较长时间）
+            if self.send_command("protocol_version", timeout=KATAGO_GENMOVE_TIMEOUT) is None:
+                raise GTPError("KataGo没有响应初始化命令")
             self.send_command("name")
             self.send_command("version")
             
-            self.is_initialized = True
-            print("KataGo引擎启动成功")
+            engine_log.info("KataGo引擎启动成功")
             
         except Exception as e:
-            print(f"启动KataGo失败: {e}")
+            engine_log.error("启动KataGo失败", error=e)
             self.is_initialized = False
+            if self.process is not None:
+                self.process.close()
+        STAGE_SECONDS.observe(time.perf_counter() - started, 'engine_start')
     
-    def send_command(self, command):
-        """发送GTP命令到KataGo"""
+    def is_alive(self):
+        """进程仍在运行且已完成初始化"""
+        return self.is_initialized and self.process is not None and self.process.is_alive()
+    
+    def send_command(self, command, timeout=None):
+        """发送GTP命令到KataGo，失败或超时返回None"""
         if not self.process or not self.is_initialized:
             return None
         
+        name = command.split()[0]
+        if timeout is None:
+            is_search = name in ("genmove", "kata-genmove_analyze")
+            timeout = KATAGO_GENMOVE_TIMEOUT if is_search else KATAGO_COMMAND_TIMEOUT
+        
+        self.command_count += 1
+        started = time.perf_counter()
         try:
-            self.process.stdin.write(command + "\n")
-            self.process.stdin.flush()
-            
-            # 读取响应
-            response_lines = []
-            first_line = True
-            
-            while True:
-                line = self.process.stdout.readline()
-                if not line:  # EOF
-                    break
-                    
-                line = line.strip()
-                if not line:  # 空行，可能是响应结束
-                    if response_lines and (response_lines[0].startswith("=") or response_lines[0].startswith("?")):
-                        break
-                    continue
-                
-                response_lines.append(line)
-                
-                # 如果是单行响应（成功=或失败?开头），直接结束
-                if first_line and (line.startswith("=") or line.startswith("?")):
-                    # 检查是否还有更多内容（对于分析命令）
-                    if "analyze" not in command.lower():
-                        break
-                
-                first_line = False
-            
-            response = "\n".join(response_lines)
-            print(f"命令 '{command}' 的完整响应: {response}")
+            response = str(self.process.command(command, timeout))
+            GTP_COMMAND_SECONDS.observe(time.perf_counter() - started, name)
+            gtp_log.sampled("GTP命令", command=command, response=response)
             return response
             
-        except Exception as e:
-            print(f"发送命令失败: {e}")
-            import traceback
-            traceback.print_exc()
+        except GTPTimeout as e:
+            # 引擎卡住：状态已不可信，结束进程，由引擎池在后台（或下次签出时）重启
+            GTP_COMMAND_ERRORS.inc(name, 'timeout')
+            gtp_log.warning("GTP命令超时，停止引擎", error=e)
+            self.stop()
+            return None
+        except GTPError as e:
+            GTP_COMMAND_ERRORS.inc(name, 'error')
+            gtp_log.error("发送命令失败", command=command, error=e)
+            self.is_initialized = False
             return None
     
+    def ping(self):
+        """廉价的存活检查：protocol_version 在截止时间内返回"""
+        response = self.send_command("protocol_version", timeout=KATAGO_PING_TIMEOUT)
+        return response is not None and response.startswith("=")
+    
+    def warm_up(self):
+        """用一次小规模分析预热（加载权重、建立搜索缓存），之后才分配给请求"""
+        if KATAGO_WARMUP_VISITS <= 0:
+            return self.is_alive()
+        with STAGE_SECONDS.time('warm_up'):
+            result = self.analyze_position({'boardSize': 19, 'moves': [], 'maxVisits': KATAGO_WARMUP_VISITS})
+        return result is not None and self.is_alive()
+    
+    def set_param(self, name, value):
+        """kata-set-param，与引擎中已设置的值相同时不发送"""
+        if self.params.get(name) == value:
+            return
+        response = self.send_command(f"kata-set-param {name} {value}")
+        if response and response.startswith("="):
+            self.params[name] = value
+    
+    def reset_board(self, board_size, komi):
+        """清空棋盘并设置棋盘大小和贴目"""
+        self.send_command("clear_board")
+        self.send_command(f"boardsize {board_size}")
+        self.send_command(f"komi {komi}")
+        gtp_log.debug("清空棋盘", boardSize=board_size, komi=komi)
+        
+        self.board_size = board_size
+        self.komi = komi
+        self.board_moves = []
+    
+    def sync_board(self, board_size, komi, target_moves):
+        """把引擎局面同步到目标着法序列
+        
+        只回退到与当前局面的公共前缀，再补下新的着法。
+        正常对弈中每次只需要一两条命令，而不是重放整盘棋。
+        """
+        if self.board_moves is None or self.board_size != board_size:
+            self.reset_board(board_size, komi)
+        elif self.komi != komi:
+            self.send_command(f"komi {komi}")
+            self.komi = komi
+        
+        common = 0
+        max_common = min(len(self.board_moves), len(target_moves))
+        while common < max_common and self.board_moves[common] == target_moves[common]:
+            common += 1
+        
+        undo_count = len(self.board_moves) - common
+        play_moves = target_moves[common:]
+        
+        # 回退步数比重放还多时，直接清空重建更省
+        if undo_count > common:
+            self.reset_board(board_size, komi)
+            common, undo_count, play_moves = 0, 0, target_moves
+        
+        gtp_log.debug("同步局面", common=common, undo=undo_count, play=len(play_moves))
+        
+        for _ in range(undo_count):
+            response = self.send_command("undo")
+            if not response or not response.startswith("="):
+                gtp_log.warning("undo失败，重建局面", response=response)
+                return self.replay_board(board_size, komi, target_moves)
+            self.board_moves.pop()
+        
+        for i, (color, move_coord) in enumerate(play_moves):
+            cmd = f"play {color} {move_coord}"
+            response = self.send_command(cmd)
+            gtp_log.sampled("同步着法", number=common + i + 1, command=cmd, response=response)
+            if not response or not response.startswith("="):
+                # 非法着法也保持与原来相同的行为：跳过继续
+                self.board_moves = None
+                continue
+            if self.board_moves is not None:
+                self.board_moves.append((color, move_coord))
+        
+        return True
+    
+    def current_board(self):
+        """返回与引擎局面一致的本地棋盘（不与引擎通信），局面未知时返回None
+        
+        新着法只在已有棋盘上增量落子，悔棋等其他变化才从头重建。
+        """
+        if self.board_moves is None or self.board_size is None:
+            return None
+        
+        moves = tuple(self.board_moves)
+        seen = self._board_moves_seen
+        board = self._board
+        if board is None or board.size != self.board_size or moves[:len(seen)] != seen:
+            board, seen = Board(self.board_size), ()
+        
+        try:
+            for color, move_str in moves[len(seen):]:
+                if move_str.upper() == "PASS":
+                    board.pass_move()
+                    continue
+                x, y = self.gtp_to_coord(move_str, self.board_size)
+                if x is None:
+                    raise IllegalMove(f"无法解析着法 {move_str}")
+                board.play(x, y, BLACK if color == 'black' else WHITE)
+        except IllegalMove as e:
+            engine_log.warning("本地棋盘与着法序列不一致", error=e)
+            self._board, self._board_moves_seen = None, ()
+            return None
+        
+        self._board, self._board_moves_seen = board, moves
+        return board
+    
+    def replay_board(self, board_size, komi, target_moves):
+        """清空棋盘并重放全部着法"""
+        self.reset_board(board_size, komi)
+        for color, move_coord in target_moves:
+            response = self.send_command(f"play {color} {move_coord}")
+            if response and response.startswith("="):
+                self.board_moves.append((color, move_coord))
+            else:
+                self.board_moves = None
+                return False
+        return True
+    
+    def prepare_position(self, request_data):
+        """设置搜索参数并把引擎同步到请求的局面，返回 (棋盘大小, 下一手颜色, maxVisits)"""
+        board_size = request_data.get('boardSize', 19)
+        komi = request_data.get('komi', 6.5)
+        
+        # 根据难度设置KataGo参数
+        max_visits = request_data.get('maxVisits', 400)
+        analyze_depth = request_data.get('analyzeDepth', 10)
+        
+        # 设置分析参数（如果KataGo支持这些命令）
+        try:
+            with STAGE_SECONDS.time('set_param'):
+                self.set_param("maxVisits", max_visits)
+                self.set_param("maxDepth", analyze_depth)
+            engine_log.debug("设置难度参数", maxVisits=max_visits, analyzeDepth=analyze_depth)
+        except Exception as e:
+            engine_log.warning("设置难度参数失败（可能不支持）", error=e)
+        
+        # 解析着法序列（黑棋先行，双方交替），增量同步到引擎
+        move_sequence = request_data.get('moves', [])
+        target_moves = [
+            ('black' if i % 2 == 0 else 'white', self.coord_to_gtp(x, y, board_size))
+            for i, (x, y) in enumerate(request_moves(request_data))
+        ]
+        with STAGE_SECONDS.time('sync'):
+            self.sync_board(board_size, komi, target_moves)
+        
+        # 根据已下着法数量确定下一步该谁下
+        next_player = 'black' if len(move_sequence) % 2 == 0 else 'white'
+        return board_size, next_player, max_visits
+    
     def analyze_position(self, request_data, moves=10):
-        """分析局面并返回最佳着法和局势评估"""
+        """分析局面并返回最佳着法和局势评估；请求带 maxTime 时限时分析"""
+        if request_data.get('maxTime') is not None:
+            return self.analyze_anytime(request_data, moves)
         try:
             if not self.is_initialized:
-                print("KataGo引擎未初始化")
+                engine_log.warning("KataGo引擎未初始化")
                 return None
             
-            print(f"开始分析局面，请求数据: {request_data}")
-            
-            # 清空棋盘
-            response = self.send_command("clear_board")
-            print(f"清空棋盘响应: {response}")
-            
-            # 设置棋盘大小和贴目
-            board_size = request_data.get('boardSize', 19)
-            self.send_command(f"boardsize {board_size}")
-            self.send_command("komi 6.5")
-            print(f"设置棋盘大小: {board_size}x{board_size}")
-            
-            # 根据难度设置KataGo参数
-            max_visits = request_data.get('maxVisits', 400)
-            analyze_depth = request_data.get('analyzeDepth', 10)
-            
-            # 设置分析参数（如果KataGo支持这些命令）
-            try:
-                self.send_command(f"kata-set-param maxVisits {max_visits}")
-                self.send_command(f"kata-set-param maxDepth {analyze_depth}")
-                print(f"设置难度参数: maxVisits={max_visits}, analyzeDepth={analyze_depth}")
-            except Exception as e:
-                print(f"设置难度参数失败（可能不支持）: {e}")
-            
-            # 解析并执行着法序列
-            move_sequence = request_data.get('moves', [])
-            current_player = 'black'  # 黑棋先行
-            
-            print(f"执行 {len(move_sequence)} 个着法...")
-            for i, move in enumerate(move_sequence):
-                if 'x' in move and 'y' in move:
-                    move_coord = self.coord_to_gtp(move['x'], move['y'], board_size)
-                    cmd = f"play {current_player} {move_coord}"
-                    response = self.send_command(cmd)
-                    print(f"着法 {i+1}: {cmd}, 响应: {response}")
-                    
-                    # 交替颜色
-                    current_player = 'white' if current_player == 'black' else 'black'
-            
-            # 根据已下着法数量确定下一步该谁下
-            next_player = 'black' if len(move_sequence) % 2 == 0 else 'white'
-            
-            # 使用改进的KataGo局势分析
-            print("使用KataGo进行整盘局势分析...")
+            board_size, next_player, max_visits = self.prepare_position(request_data)
             
             # 获取当前局面的最佳着法
-            response = self.send_command(f"genmove {next_player}")
-            print(f"genmove {next_player} 响应: {response}")
+            with STAGE_SECONDS.time('genmove'):
+                response = self.send_command(f"genmove {next_player}")
+            engine_log.debug("genmove", player=next_player, response=response)
             
             if response and response.startswith("="):
                 move_str = response.split("=")[1].strip()
+                # genmove会把着法下在引擎棋盘上，记录下来，
+                # 人机对弈时下一次请求正好以这一手为前缀
+                if self.board_moves is not None and move_str.lower() != "resign":
+                    self.board_moves.append((next_player, move_str))
                 if move_str and move_str.upper() != "PASS":
                     # 转换GTP坐标回到数组坐标
                     x, y = self.gtp_to_coord(move_str, board_size)
-                    print(f"KataGo推荐着法: {move_str} -> ({x}, {y})")
+                    engine_log.debug("KataGo推荐着法", move=move_str, x=x, y=y)
                     
                     # 真正的整盘分析：模拟双方对弈来评估局面
-                    winrate, score_lead = self.analyze_full_position_simple(next_player, board_size)
+                    with STAGE_SECONDS.time('evaluate'):
+                        winrate, score_lead = self.analyze_full_position_simple(next_player, board_size)
                     
-                    print(f"整盘分析结果 - 胜率: {winrate:.3f}, 分数差: {score_lead:.1f}")
+                    engine_log.debug("整盘分析结果", winrate=round(winrate, 3), scoreLead=round(score_lead, 1))
                     
                     return {
                         "moveInfos": [
@@ -183,36 +416,149 @@ class KataGoEngine:
                                 "scoreLead": score_lead,
                                 "scoreMean": score_lead
                             }
-                        ]
+                        ],
+                        "source": "genmove"
                     }
             
-            print("KataGo未能提供有效分析结果")
+            engine_log.warning("KataGo未能提供有效分析结果", response=response)
             return None
             
-        except Exception as e:
-            print(f"分析位置失败: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            engine_log.exception("分析位置失败")
+            return None
+    
+    def analyze_anytime(self, request_data, moves=10):
+        """限时分析：kata-analyze搜索到 maxTime 秒（或达到maxVisits）为止，
+        返回截止时的最佳结果，visits 为实际完成的访问数"""
+        max_time = max(MIN_SEARCH_TIME, float(request_data['maxTime']))
+        # 只有报告中间结果时才检查截止时间，间隔决定了超时的上限
+        interval = max(0.01, min(KATAGO_STREAM_INTERVAL, max_time / 10))
+        last = None
+        for last in self.analyze_stream(request_data, interval=interval, max_duration=max_time, moves=moves):
+            pass
+        if last is None:
+            return None
+        return dict(last, visits=result_visits(last))
+    
+    def analyze_stream(self, request_data, interval=0.1, max_duration=30.0, moves=10):
+        """用kata-analyze流式分析局面，每个间隔产出一次当前最佳结果
+        
+        结果格式与analyze_position相同，visits 为根节点访问数（rootInfo）；
+        根节点访问数达到maxVisits或超过max_duration后停止。
+        调用方可以随时关闭生成器，引擎会停止分析。
+        """
+        if not self.is_initialized:
+            engine_log.warning("KataGo引擎未初始化")
+            return
+        
+        board_size, next_player, max_visits = self.prepare_position(request_data)
+        centiseconds = max(1, int(interval * 100))
+        deadline = time.monotonic() + max_duration
+        
+        lines = self.process.stream(
+            f"kata-analyze {next_player} {centiseconds} maxmoves {moves} rootInfo true",
+            timeout=KATAGO_COMMAND_TIMEOUT
+        )
+        try:
+            for line in lines:
+                result = self.parse_kata_analyze_info(line, board_size, next_player)
+                if not result:
+                    continue
+                yield result
+                
+                if result_visits(result) >= max_visits or time.monotonic() >= deadline:
+                    break
+        except GTPTimeout as e:
+            engine_log.warning("kata-analyze超时，停止引擎", error=e)
+            self.stop()
+        except GTPError as e:
+            engine_log.error("kata-analyze失败", error=e)
+            self.is_initialized = False
+        finally:
+            lines.close()
+    
+    def parse_kata_analyze_info(self, line, board_size, next_player):
+        """解析一行kata-analyze输出（多个 "info move ..." 段和行尾的 rootInfo），胜率转换为黑棋视角"""
+        tokens = line.split()
+        infos = []
+        root = {}
+        current = None
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token == "info":
+                current = {}
+                infos.append(current)
+                i += 1
+            elif token == "rootInfo":
+                current = root
+                i += 1
+            elif current is None:
+                i += 1
+            elif token == "pv":
+                # 变化图一直延续到下一个info（或rootInfo）
+                j = i + 1
+                while j < len(tokens) and tokens[j] not in ("info", "rootInfo"):
+                    j += 1
+                current["pv"] = tokens[i + 1:j]
+                i = j
+            else:
+                if i + 1 < len(tokens):
+                    current[token] = tokens[i + 1]
+                i += 2
+        
+        # kata-analyze按轮到下棋的一方报告胜率
+        flip = next_player == 'white'
+        move_infos = []
+        for info in sorted(infos, key=lambda m: int(m.get("order", 0))):
+            move_str = info.get("move", "")
+            if not move_str or move_str.upper() == "PASS":
+                continue
+            try:
+                winrate = float(info.get("winrate", 0.5))
+                score_lead = float(info.get("scoreLead", info.get("scoreMean", 0.0)))
+                score_mean = float(info.get("scoreMean", score_lead))
+                visits = int(info.get("visits", 0))
+            except ValueError:
+                continue
+            if flip:
+                winrate, score_lead, score_mean = 1 - winrate, -score_lead, -score_mean
+            x, y = self.gtp_to_coord(move_str, board_size)
+            move_infos.append({
+                "move": move_str,
+                "x": x,
+                "y": y,
+                "visits": visits,
+                "winrate": winrate,
+                "scoreLead": score_lead,
+                "scoreMean": score_mean
+            })
+        
+        if not move_infos:
             return None
+        result = {"moveInfos": move_infos}
+        if root.get("visits", "").isdigit():
+            result["visits"] = int(root["visits"])
+        return result
     
     def analyze_full_position(self, current_player, board_size):
         """分析整个棋盘局势 - 真正的位置分析而非伪造胜率"""
         try:
-            print("开始真正的整盘局势分析...")
+            engine_log.debug("开始真正的整盘局势分析")
             
             # 核心改进：基于实际棋盘状态分析，而不是固定伪造胜率
             
             # 1. 获取当前棋盘状态
             board_state = self.get_current_board_state()
             if not board_state:
-                print("无法获取棋盘状态，使用默认分析")
+                engine_log.debug("无法获取棋盘状态，使用默认分析")
                 return 0.5, 0.0
             
             # 2. 计算双方的实际局面优势
             black_advantage = self.calculate_positional_advantage('black', board_state)
             white_advantage = self.calculate_positional_advantage('white', board_state)
             
-            print(f"局面分析: 黑棋优势={black_advantage:.3f}, 白棋优势={white_advantage:.3f}")
+            engine_log.debug("局面分析", blackAdvantage=round(black_advantage, 3), whiteAdvantage=round(white_advantage, 3))
             
             # 3. 基于实际位置计算胜率（而不是哈希值伪造）
             advantage_diff = black_advantage - white_advantage
@@ -233,11 +579,11 @@ class KataGoEngine:
             try:
                 katago_insight = self.get_katago_position_insight(current_player)
                 if katago_insight:
-                    print(f"KataGo洞察: {katago_insight}")
+                    engine_log.debug("KataGo洞察", insight=katago_insight)
                     # 结合KataGo的判断
                     base_winrate = base_winrate * 0.7 + katago_insight * 0.3
             except Exception as e:
-                print(f"KataGo洞察获取失败: {e}")
+                engine_log.warning("KataGo洞察获取失败", error=e)
             
             # 5. 限制胜率在合理范围
             final_winrate = max(0.1, min(0.9, base_winrate))
@@ -251,12 +597,12 @@ class KataGoEngine:
             elif stone_count > 150:
                 score_lead *= 1.3  # 官子分数差更明确
             
-            print(f"最终分析结果: 胜率={final_winrate:.3f}, 分数差={score_lead:.1f}, 基于{stone_count}子局面")
+            engine_log.debug("最终分析结果", winrate=round(final_winrate, 3), scoreLead=round(score_lead, 1), stones=stone_count)
             
             return final_winrate, score_lead
             
         except Exception as e:
-            print(f"整盘分析失败: {e}")
+            engine_log.warning("整盘分析失败", error=e)
             # 即使出错也返回基于当前时间的变化值，而不是固定55%
             import time
             time_factor = (time.time() % 100) / 100  # 0-1的时间因子
@@ -264,36 +610,33 @@ class KataGoEngine:
             return varied_winrate, (varied_winrate - 0.5) * 20
     
     def get_current_board_state(self):
-        """获取当前棋盘状态信息"""
+        """获取当前棋盘状态信息（读取本地棋盘）"""
         try:
-            # 使用showboard命令获取棋盘状态
-            board_response = self.send_command("showboard")
-            if not board_response:
+            board = self.current_board()
+            if board is None:
                 return None
             
-            # 分析棋盘内容
-            stone_count = 0
-            black_stones = 0
-            white_stones = 0
-            
-            lines = board_response.split('\n')
-            for line in lines:
-                if 'X' in line or 'O' in line or '.' in line:
-                    # 这是棋盘行
-                    black_stones += line.count('X')
-                    white_stones += line.count('O')
-            
-            stone_count = black_stones + white_stones
+            black_stones = board.stones[BLACK]
+            white_stones = board.stones[WHITE]
+            groups_in_atari = {BLACK: 0, WHITE: 0}
+            for color, _, liberties in board.groups():
+                if len(liberties) == 1:
+                    groups_in_atari[color] += 1
             
             return {
-                'stone_count': stone_count,
+                'stone_count': black_stones + white_stones,
                 'black_stones': black_stones,
                 'white_stones': white_stones,
-                'board_content': board_response
+                'black_captures': board.captures[BLACK],
+                'white_captures': board.captures[WHITE],
+                'black_in_atari': groups_in_atari[BLACK],
+                'white_in_atari': groups_in_atari[WHITE],
+                'ko': board.ko is not None,
+                'board': board.to_2d()
             }
             
         except Exception as e:
-            print(f"获取棋盘状态失败: {e}")
+            engine_log.warning("获取棋盘状态失败", error=e)
             return None
     
     def calculate_positional_advantage(self, player, board_state):
@@ -335,13 +678,13 @@ class KataGoEngine:
             return total_advantage
             
         except Exception as e:
-            print(f"位置优势计算失败: {e}")
+            engine_log.warning("位置优势计算失败", error=e)
             return 0.0
     
     def get_katago_position_insight(self, current_player):
         """获取KataGo对当前位置的洞察（简化版，避免多次genmove）"""
         try:
-            print("跳过KataGo洞察以避免超时，使用棋盘状态分析")
+            engine_log.debug("跳过KataGo洞察以避免超时，使用棋盘状态分析")
             # 简化：暂时跳过复杂的genmove调用以避免超时
             # 基于当前玩家返回基础判断
             if current_player == 'black':
@@ -350,31 +693,36 @@ class KataGoEngine:
                 return 0.48  # 白棋后手但有贴目
             
         except Exception as e:
-            print(f"KataGo洞察获取失败: {e}")
+            engine_log.warning("KataGo洞察获取失败", error=e)
             return 0.5
     
     def analyze_full_position_simple(self, current_player, board_size):
         """简化的整盘局势分析 - 重点解决假胜率问题"""
         try:
-            print("开始简化整盘局势分析...")
+            engine_log.debug("开始简化整盘局势分析")
             
             # 1. 获取棋盘状态
             board_state = self.get_current_board_state()
             if not board_state:
-                print("无法获取棋盘状态")
+                engine_log.debug("无法获取棋盘状态")
                 return 0.5, 0.0
             
             stone_count = board_state.get('stone_count', 0)
             black_stones = board_state.get('black_stones', 0) 
             white_stones = board_state.get('white_stones', 0)
             
-            print(f"棋盘状态: 总棋子={stone_count}, 黑={black_stones}, 白={white_stones}")
+            engine_log.debug("棋盘状态", stones=stone_count, black=black_stones, white=white_stones)
             
             # 2. 基于实际棋盘状态计算胜率（核心改进）
             if stone_count == 0:
                 # 空盘：黑棋先手但有贴目劣势
                 winrate = 0.48
                 score_lead = -6.5
+            elif estimate_ownership is not None:
+                # 有棋子：按势力图估计双方地盘（数子法，扣除贴目），再换算为胜率
+                ownership = estimate_ownership(board_state['board'])
+                score_lead = round(float(estimate_score(ownership, self.komi if self.komi is not None else 6.5)), 1)
+                winrate = 1 / (1 + math.exp(-score_lead / 10))
             else:
                 # 有棋子：基于实际局面分析
                 stone_diff = black_stones - white_stones
@@ -406,11 +754,11 @@ class KataGoEngine:
             # 限制胜率范围
             winrate = max(0.1, min(0.9, winrate))
             
-            print(f"简化分析结果: 胜率={winrate:.3f}, 分数差={score_lead:.1f}")
+            engine_log.debug("简化分析结果", winrate=round(winrate, 3), scoreLead=round(score_lead, 1))
             return winrate, score_lead
             
         except Exception as e:
-            print(f"简化分析失败: {e}")
+            engine_log.warning("简化分析失败", error=e)
             # 返回基于当前时间的变化值（避免固定55%）
             import time
             time_seed = int(time.time()) % 1000
@@ -421,7 +769,7 @@ class KataGoEngine:
         """尝试使用KataGo的kata-analyze命令进行深度分析"""
         try:
             # kata-analyze 分析当前局面
-            print("尝试使用 kata-analyze 命令...")
+            engine_log.debug("尝试使用 kata-analyze 命令")
             
             # 基本的kata-analyze命令，分析当前位置
             analyze_cmd = "kata-analyze 100 visits"  # 100次访问
@@ -430,17 +778,17 @@ class KataGoEngine:
             if response and "=" in response:
                 return self.parse_kata_analyze_result(response)
             else:
-                print("kata-analyze 命令未返回有效结果")
+                engine_log.debug("kata-analyze 命令未返回有效结果")
                 return None
                 
         except Exception as e:
-            print(f"kata-analyze 执行失败: {e}")
+            engine_log.warning("kata-analyze 执行失败", error=e)
             return None
     
     def use_lz_analyze_command(self):
         """尝试使用Leela Zero兼容的lz-analyze命令"""
         try:
-            print("尝试使用 lz-analyze 命令...")
+            engine_log.debug("尝试使用 lz-analyze 命令")
             
             # lz-analyze 分析当前局面
             analyze_cmd = "lz-analyze 100"  # 100次分析
@@ -449,24 +797,23 @@ class KataGoEngine:
             if response and "info" in response.lower():
                 return self.parse_lz_analyze_result(response)
             else:
-                print("lz-analyze 命令未返回有效结果")
+                engine_log.debug("lz-analyze 命令未返回有效结果")
                 return None
                 
         except Exception as e:
-            print(f"lz-analyze 执行失败: {e}")
+            engine_log.warning("lz-analyze 执行失败", error=e)
             return None
     
     def enhanced_genmove_analysis(self, current_player):
         """使用增强型genmove分析整个局面"""
         try:
-            print("开始增强型genmove分析...")
+            engine_log.debug("开始增强型genmove分析")
             
             # 1. 获取双方的最佳着法和评估
             black_evaluation = self.get_detailed_move_evaluation('black')
             white_evaluation = self.get_detailed_move_evaluation('white')
             
-            print(f"黑棋评估: {black_evaluation}")
-            print(f"白棋评估: {white_evaluation}")
+            engine_log.debug("双方评估", black=black_evaluation, white=white_evaluation)
             
             # 2. 分析多个候选着法的质量分布
             move_quality_analysis = self.analyze_move_quality_distribution(current_player)
@@ -483,11 +830,11 @@ class KataGoEngine:
             # 5. 计算分数差
             score_lead = self.estimate_score_difference(winrate, position_complexity)
             
-            print(f"增强分析结果: 胜率={winrate:.3f}, 分数差={score_lead:.1f}")
+            engine_log.debug("增强分析结果", winrate=round(winrate, 3), scoreLead=round(score_lead, 1))
             return winrate, score_lead
             
         except Exception as e:
-            print(f"增强型分析失败: {e}")
+            engine_log.warning("增强型分析失败", error=e)
             return 0.5, 0.0
     
     def get_detailed_move_evaluation(self, player):
@@ -526,13 +873,13 @@ class KataGoEngine:
             return {"quality": move_quality, "move": move_str}
             
         except Exception as e:
-            print(f"详细着法评估失败: {e}")
+            engine_log.warning("详细着法评估失败", error=e)
             return {"quality": 0.0, "move": "PASS"}
     
     def analyze_move_quality_distribution(self, current_player):
         """分析当前玩家多个候选着法的质量分布（简化版）"""
         try:
-            print("分析着法质量分布（简化版）...")
+            engine_log.debug("分析着法质量分布（简化版）")
             
             # 简化：只测试2-3个关键位置以节省时间
             test_positions = [(9, 9), (3, 3)]  # 天元和一个角
@@ -556,7 +903,7 @@ class KataGoEngine:
                         self.send_command("undo")
                         
                 except Exception as e:
-                    print(f"测试位置 ({x}, {y}) 失败: {e}")
+                    engine_log.debug("测试位置失败", x=x, y=y, error=e)
                     continue
             
             if candidate_moves:
@@ -574,7 +921,7 @@ class KataGoEngine:
             return {"average_quality": 0.0, "quality_variance": 0.0, "move_count": 0}
             
         except Exception as e:
-            print(f"着法质量分布分析失败: {e}")
+            engine_log.warning("着法质量分布分析失败", error=e)
             return {"average_quality": 0.0, "quality_variance": 0.0, "move_count": 0}
     
     def get_simple_position_quality(self, x, y):
@@ -596,15 +943,13 @@ class KataGoEngine:
     def evaluate_position_complexity(self):
         """评估当前局面的复杂度"""
         try:
-            # 通过showboard获取棋盘状态
-            board_response = self.send_command("showboard")
+            # 读取本地棋盘状态
+            board = self.current_board()
             
-            if board_response:
-                # 计算棋盘上的棋子数量
-                stone_count = board_response.count('X') + board_response.count('O')
-                
-                # 计算空点数量（大致）
-                empty_count = board_response.count('.')
+            if board is not None:
+                # 计算棋盘上的棋子数量和空点数量
+                stone_count = board.stones[BLACK] + board.stones[WHITE]
+                empty_count = board.size * board.size - stone_count
                 
                 # 局面复杂度：棋子数量适中时最复杂
                 if stone_count < 50:
@@ -624,7 +969,7 @@ class KataGoEngine:
             return {"complexity": 0.5, "stone_count": 0, "empty_count": 361, "game_phase": "opening"}
             
         except Exception as e:
-            print(f"局面复杂度评估失败: {e}")
+            engine_log.warning("局面复杂度评估失败", error=e)
             return {"complexity": 0.5, "stone_count": 0, "empty_count": 361, "game_phase": "unknown"}
     
     def determine_game_phase(self, stone_count):
@@ -676,7 +1021,7 @@ class KataGoEngine:
             return max(0.05, min(0.95, final_winrate))
             
         except Exception as e:
-            print(f"胜率计算失败: {e}")
+            engine_log.warning("胜率计算失败", error=e)
             return 0.5
     
     def estimate_score_difference(self, winrate, complexity):
@@ -700,13 +1045,13 @@ class KataGoEngine:
             return score_diff
             
         except Exception as e:
-            print(f"分数差估算失败: {e}")
+            engine_log.warning("分数差估算失败", error=e)
             return 0.0
     
     def parse_kata_analyze_result(self, response):
         """解析kata-analyze命令的结果"""
         try:
-            print(f"解析kata-analyze结果: {response}")
+            engine_log.debug("解析kata-analyze结果", response=response)
             
             # KataGo的kata-analyze输出格式通常包含winrate信息
             lines = response.split('\n')
@@ -726,13 +1071,13 @@ class KataGoEngine:
             return None
             
         except Exception as e:
-            print(f"kata-analyze结果解析失败: {e}")
+            engine_log.warning("kata-analyze结果解析失败", error=e)
             return None
     
     def parse_lz_analyze_result(self, response):
         """解析lz-analyze命令的结果"""
         try:
-            print(f"解析lz-analyze结果: {response}")
+            engine_log.debug("解析lz-analyze结果", response=response)
             
             # Leela Zero的分析输出格式
             if 'info' in response.lower():
@@ -749,7 +1094,7 @@ class KataGoEngine:
             return None
             
         except Exception as e:
-            print(f"lz-analyze结果解析失败: {e}")
+            engine_log.warning("lz-analyze结果解析失败", error=e)
             return None
     
     def evaluate_move_quality(self, move_response):
@@ -801,23 +1146,18 @@ class KataGoEngine:
                 return 0.4  # 一致性较低，局面复杂多变
                 
         except Exception as e:
-            print(f"一致性检查失败: {e}")
+            engine_log.warning("一致性检查失败", error=e)
             return 0.5
     
     def evaluate_position_balance(self):
         """评估位置平衡性"""
         try:
-            # 这是一个简化的位置评估
-            # 在真实实现中，可以分析棋盘上的棋子分布
+            # 这是一个简化的位置评估：读取本地棋盘，比较双方棋子数量
+            board = self.current_board()
             
-            # 使用showboard查看当前局面
-            board_response = self.send_command("showboard")
-            
-            if board_response:
-                # 简单计算：如果棋盘响应包含更多特定信息，可以进行更复杂的分析
-                # 这里使用一个简化的启发式方法
-                black_indicators = board_response.count('X') if 'X' in board_response else 0
-                white_indicators = board_response.count('O') if 'O' in board_response else 0
+            if board is not None:
+                black_indicators = board.stones[BLACK]
+                white_indicators = board.stones[WHITE]
                 
                 if black_indicators > white_indicators:
                     return 0.55
@@ -829,179 +1169,605 @@ class KataGoEngine:
             return 0.5
             
         except Exception as e:
-            print(f"位置评估失败: {e}")
+            engine_log.warning("位置评估失败", error=e)
             return 0.5
 
     def coord_to_gtp(self, x, y, board_size):
         """将数组坐标转换为GTP坐标"""
-        # GTP坐标：A1 = 左下角，A19 = 左上角
-        letters = "ABCDEFGHJKLMNOPQRSTUVWXYZ"  # 跳过I
-        col = letters[x]
-        row = board_size - y
-        return f"{col}{row}"
+        return coord_to_gtp(x, y, board_size)
     
     def gtp_to_coord(self, gtp_move, board_size):
         """将GTP坐标转换为数组坐标"""
-        if len(gtp_move) < 2:
-            return None, None
-        
-        letters = "ABCDEFGHJKLMNOPQRSTUVWXYZ"
-        col_char = gtp_move[0].upper()
-        row_str = gtp_move[1:]
-        
-        try:
-            x = letters.index(col_char)
-            y = board_size - int(row_str)
-            return x, y
-        except:
-            return None, None
-    
-    def generate_life_death_problem(self, difficulty, board_size):
-        """生成死活题"""
-        try:
-            print(f"开始生成 {difficulty} 难度的死活题，棋盘大小: {board_size}x{board_size}")
-            
-            # 清空棋盘
-            self.send_command("clear_board")
-            self.send_command(f"boardsize {board_size}")
-            self.send_command("komi 0")  # 死活题不考虑贴目
-            
-            # 根据难度生成不同类型的死活题
-            if difficulty == 'easy':
-                return self._generate_basic_capture_problem(board_size)
-            elif difficulty == 'medium':
-                return self._generate_eye_making_problem(board_size)
-            elif difficulty == 'hard':
-                return self._generate_complex_life_death_problem(board_size)
-            else:
-                return self._generate_basic_capture_problem(board_size)
-                
-        except Exception as e:
-            print(f"生成死活题失败: {e}")
+        return gtp_to_coord(gtp_move, board_size)
+    
+    def stop(self):
+        """停止KataGo进程"""
+        if self.process:
+            process, self.process = self.process, None
+            self.is_initialized = False
+            self.board_moves = None
+            process.close()
+
+# 全局KataGo引擎池，每个请求签出一个独占的引擎
+katago_pool = EnginePool(
+    KataGoEngine,
+    size=KATAGO_POOL_SIZE,
+    max_waiters=KATAGO_MAX_WAITERS,
+    checkout_timeout=KATAGO_CHECKOUT_TIMEOUT,
+    min_visits=KATAGO_MIN_VISITS
+)
+
+# JSON分析引擎（KATAGO_BACKEND=analysis 时用于所有局面分析）
+analysis_engine = None
+if KATAGO_BACKEND == 'analysis':
+    analysis_engine = KataGoAnalysisEngine(
+        [KATAGO_PATH, "analysis", "-model", MODEL_PATH, "-config", ANALYSIS_CONFIG_PATH],
+        max_inflight=KATAGO_ANALYSIS_MAX_INFLIGHT,
+        timeout=KATAGO_ANALYSIS_TIMEOUT
+    )
+
+# 局面分析结果缓存
+analysis_cache = AnalysisCache(
+    max_entries=KATAGO_CACHE_SIZE,
+    ttl=KATAGO_CACHE_TTL,
+    persist_path=KATAGO_CACHE_FILE
+)
+
+# 相同局面的并发分析请求只计算一次（键与缓存相同）
+analysis_flight = SingleFlight()
+
+# 多进程MCTS的工作进程（spawn）会重新导入本文件，只有主进程负责保存缓存
+if __name__ != '__mp_main__':
+    atexit.register(analysis_cache.save)
+
+# 内置MCTS后备引擎（KATAGO_FALLBACK=none 时不启用）
+fallback_engine = None
+if KATAGO_FALLBACK == 'mcts':
+    fallback_engine = MCTSEngine(workers=KATAGO_FALLBACK_WORKERS, time_limit=KATAGO_FALLBACK_TIME)
+
+# 死活题库（只读）
+problem_library = ProblemLibrary(TSUMEGO_LIBRARY)
+
+# 开局库（只读，内存映射）
+opening_book = OpeningBook(OPENING_BOOK)
+
+# 增量请求的会话着法
+move_sessions = MoveSessions(max_sessions=MOVE_SESSIONS, ttl=MOVE_SESSION_TTL)
+
+# 对方思考期间的后台预读结果（按会话）
+ponderer = Ponderer(ttl=KATAGO_PONDER_TTL, max_sessions=MOVE_SESSIONS)
+
+# 运行指标：引擎池、缓存等已有统计在抓取 /metrics 时读取
+def pool_metric(key):
+    return lambda: katago_pool.metrics()[key] if analysis_engine is None else None
+
+def cache_metric(key):
+    return lambda: analysis_cache.metrics()[key]
+
+metrics_registry.gauge("katago_engines_busy", "正在处理请求的引擎数", pool_metric('busy'))
+metrics_registry.gauge("katago_engines_alive", "正在运行的引擎数", pool_metric('alive'))
+metrics_registry.gauge("katago_queue_depth", "排队等待引擎的请求数（按优先级）",
+                       lambda: {(priority,): count for priority, count in katago_pool.metrics()['waitingByPriority'].items()}
+                       if analysis_engine is None else None, labels=("priority",))
+metrics_registry.counter_callback("katago_session_affinity_hits_total", "会话请求签出到保存着其局面的引擎的次数", pool_metric('affinityHits'))
+metrics_registry.counter_callback("katago_session_affinity_misses_total", "会话请求需要在其他引擎上重建局面的次数", pool_metric('affinityMisses'))
+metrics_registry.counter_callback("katago_visit_budget_cuts_total", "因排队而缩减访问数的分析次数", pool_metric('budgetCuts'))
+metrics_registry.gauge("katago_analysis_inflight", "analysis后端正在计算的查询数",
+                       lambda: analysis_engine.metrics()['inflight'] if analysis_engine is not None else None)
+metrics_registry.gauge("katago_engines_restarting", "正在后台重启或预热的引擎数", pool_metric('restarting'))
+metrics_registry.counter_callback("katago_engine_restarts_total", "发现进程退出或无响应而重启的次数", pool_metric('restarts'))
+metrics_registry.counter_callback("katago_engine_ping_failures_total", "没有响应ping的引擎数", pool_metric('pingFailures'))
+metrics_registry.counter_callback("katago_engine_failed_starts_total", "引擎启动失败次数", pool_metric('failedStarts'))
+metrics_registry.counter_callback("katago_pool_rejected_total", "因引擎池繁忙被拒绝的请求数",
+                                  lambda: katago_pool.metrics()['rejected'] + katago_pool.metrics()['timeouts'])
+metrics_registry.counter_callback("katago_cache_hits_total", "分析缓存命中数", cache_metric('hits'))
+metrics_registry.counter_callback("katago_cache_misses_total", "分析缓存未命中数", cache_metric('misses'))
+metrics_registry.gauge("katago_cache_entries", "分析缓存条目数", cache_metric('entries'))
+metrics_registry.counter_callback("katago_session_moves_reused_total", "增量请求中不必重新发送的着法数",
+                                  lambda: move_sessions.metrics()['movesReused'])
+metrics_registry.counter_callback("katago_opening_book_hits_total", "由开局库直接回答的分析请求数",
+                                  lambda: opening_book.metrics()['hits'])
+metrics_registry.counter_callback("katago_ponder_hits_total", "由后台预读结果直接回答的分析请求数",
+                                  lambda: ponderer.metrics()['hits'])
+metrics_registry.counter_callback("katago_ponder_cancelled_total", "因真正的请求到达而取消的预读数",
+                                  lambda: ponderer.metrics()['cancelled'])
+metrics_registry.counter_callback("katago_coalesced_requests_total", "与相同的进行中请求合并的请求数",
+                                  lambda: analysis_flight.metrics()['shared'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def add_session_header(response):
+    """增量请求：告诉客户端服务器端会话现在有几手，下次从这里继续"""
+    if 'session_moves' in g:
+        response.headers['X-Session-Moves'] = str(g.session_moves)
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    if request.path.startswith('/api/') and hasattr(g, 'request_started'):
+        endpoint = request.endpoint or 'unknown'
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint)
+        if response.status_code >= 400:
+            REQUEST_ERRORS.inc(endpoint, str(response.status_code))
+    return response
+
+def decode_analysis_request(data, until_pass=False):
+    """展开SGF棋谱（sgf）、紧凑编码（movesPacked、boardPacked）和增量着法（session），失败抛出WireError"""
+    try:
+        data = request_from_sgf(data, until_pass)
+    except SGFError as e:
+        raise WireError(f"SGF解析失败: {e}")
+    return decode_request(data, move_sessions)
+
+def read_request(until_pass=False):
+    """读取JSON请求体并解码（decode_analysis_request）"""
+    data = decode_analysis_request(request.json or {}, until_pass)
+    if data.get('session') is not None:
+        g.session_moves = len(data['moves'])
+    return data
+
+def wire_error_payload(e):
+    """紧凑编码或SGF棋谱解码失败为400；增量请求与会话不一致为409，客户端重新发送完整着法"""
+    if isinstance(e, SessionMismatch):
+        return 409, {'error': str(e), 'sessionMoves': e.stored_moves}
+    return 400, {'error': f'请求解码失败: {e}'}
+
+def wire_error_response(e):
+    """解码失败的JSON响应（wire_error_payload）"""
+    status, payload = wire_error_payload(e)
+    return jsonify(payload), status
+
+def packed_response(data):
+    """请求是否要求紧凑编码的响应（encoding=packed）"""
+    return data.get('encoding') == PACKED_ENCODING
+
+def use_fallback():
+    """没有安装KataGo且启用了后备引擎"""
+    return fallback_engine is not None and not os.path.exists(KATAGO_PATH)
+
+def request_client():
+    """排队时按客户端轮流：优先使用 X-Client-Id 头，没有时按来源地址"""
+    return request.headers.get('X-Client-Id') or request.remote_addr
+
+def query_priority(priority):
+    """analysis后端的查询优先级"""
+    return KATAGO_INTERACTIVE_PRIORITY if priority == 'interactive' else 0
+
+def book_analysis(data):
+    """开局库中的局面直接给出结果（次数作为访问数，胜率和目差为黑方视角），不在库中返回None"""
+    board_size = data.get('boardSize', 19)
+    try:
+        entries = opening_book.lookup(board_size, request_moves(data))
+    except ValueError as e:
+        route_log.warning("开局库无法读取", error=e)
+        return None
+    if not entries or sum(entry['count'] for entry in entries) < OPENING_BOOK_MIN_COUNT:
+        return None
+    return {
+        "moveInfos": [
+            {
+                "move": coord_to_gtp(entry['x'], entry['y'], board_size),
+                "x": entry['x'],
+                "y": entry['y'],
+                "visits": entry['count'],
+                "winrate": entry['winrate'],
+                "scoreLead": round(entry['scoreLead'], 1),
+                "scoreMean": round(entry['scoreLead'], 1)
+            }
+            for entry in entries
+        ],
+        "source": "book"
+    }
+
+def cache_position(data, result):
+    """按规范键把（请求方向的）分析结果写入缓存"""
+    if not search_complete(data, result):
+        return
+    cache_key, symmetry = position_key(data)
+    analysis_cache.put(cache_key, symmetry.apply(result))
+
+def run_analysis(data, priority='interactive', client=None):
+    """分析一个局面：先查开局库和缓存；相同局面正在分析时等待那次的结果
+    
+    KataGo不可用时由内置MCTS引擎分析（结果不写入缓存）。旋转、翻转或黑白互换的
+    局面共用同一个规范键，缓存和合并的请求之间传递规范方向的结果。
+    """
+    book = book_analysis(data)
+    if book is not None:
+        route_log.debug("开局库命中", moves=len(data.get('moves') or []))
+        return book
+    
+    cache_key, symmetry = position_key(data)
+    deadline = None
+    flight_key = cache_key if KATAGO_COALESCE else None
+    if data.get('maxTime') is not None:
+        deadline = time.monotonic() + float(data['maxTime'])
+        # 限时请求只和时限相同的请求合并，不会等到超过自己的截止时间
+        if flight_key is not None:
+            flight_key = f"{cache_key}:t{float(data['maxTime']):g}"
+    
+    cached = ponderer.get(data.get('session') or client, cache_key)
+    if cached is not None:
+        route_log.debug("预读命中", key=cache_key)
+        return symmetry.restore(cached)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        route_log.debug("分析缓存命中", key=cache_key)
+        return symmetry.restore(cached)
+    
+    result = analysis_flight.do(flight_key, lambda: compute_analysis(data, cache_key, symmetry, priority, client, deadline))
+    return symmetry.restore(result)
+
+def remaining_time(data, deadline):
+    """限时请求：把 maxTime 换成距截止时间的剩余秒数（排队、启动引擎用掉的时间不再计入搜索）"""
+    if deadline is None:
+        return data
+    return dict(data, maxTime=max(MIN_SEARCH_TIME, deadline - time.monotonic()))
+
+def result_visits(result):
+    """分析结果的根节点访问数（rootInfo）；没有rootInfo时退回候选着法之和，这只是下限"""
+    if 'visits' in result:
+        return result['visits']
+    return sum(info.get('visits', 0) for info in result.get('moveInfos', []))
+
+def search_complete(data, result):
+    """限时搜索在达到maxVisits之前被截止时间打断时结果不完整，不写入缓存"""
+    return data.get('maxTime') is None or result_visits(result or {}) >= data.get('maxVisits', 400)
+
+def compute_analysis(data, cache_key, symmetry, priority='interactive', client=None, deadline=None):
+    """实际执行分析：JSON分析引擎直接提交查询，GTP后端按优先级排队签出一个引擎
+    
+    引擎池有请求排队时按排队长度缩减访问数，结果按实际访问数写入缓存。
+    限时请求（maxTime）搜索到截止时间为止，返回当时的最佳结果和实际访问数（visits）。
+    返回规范方向的结果（symmetry.apply）。
+    """
+    ponderer.cancel(data.get('session') or client)
+    if use_fallback():
+        with STAGE_SECONDS.time('mcts'):
+            return symmetry.apply(fallback_engine.analyze_position(remaining_time(data, deadline)))
+    
+    try:
+        if analysis_engine is not None:
+            if not analysis_engine.is_alive() and not analysis_engine.start():
+                raise EngineUnavailable("KataGo分析引擎启动失败")
+            with STAGE_SECONDS.time('analysis_query'):
+                result = analysis_engine.analyze_position(remaining_time(data, deadline), priority=query_priority(priority))
+        else:
+            visits = katago_pool.visit_budget(data.get('maxVisits', 400), priority)
+            if visits != data.get('maxVisits', 400):
+                data = dict(data, maxVisits=visits)
+                cache_key, symmetry = position_key(data)
+            with katago_pool.engine(priority=priority, client=client, session=data.get('session')) as engine:
+                result = engine.analyze_position(remaining_time(data, deadline))
+    except EngineUnavailable:
+        if fallback_engine is None:
+            raise
+        engine_log.warning("KataGo引擎不可用，使用内置MCTS引擎")
+        return symmetry.apply(fallback_engine.analyze_position(remaining_time(data, deadline)))
+    
+    result = symmetry.apply(result)
+    if search_complete(data, result):
+        analysis_cache.put(cache_key, result)
+    return result
+
+def ponder_after(data, result, client=None):
+    """/api/katago/analyze 返回后开始后台预读：AI落子后的局面，以及其中最可能的几种应手之后的局面"""
+    if KATAGO_PONDER_REPLIES <= 0 or use_fallback() or not result or not result.get('moveInfos'):
+        return
+    best = result['moveInfos'][0]
+    if best.get('x') is None or best.get('y') is None:
+        return
+    session = data.get('session') or client
+    position = dict(data, moves=list(request_moves(data)) + [(best['x'], best['y'])])
+    ponderer.start(session, lambda cancelled, store: ponder(position, session, cancelled, store))
+
+def ponder(position, session, cancelled, store):
+    """预读任务：先分析AI落子后的局面，再按候选着法的顺序分析前 KATAGO_PONDER_REPLIES 种应手"""
+    result = ponder_position(position, session, cancelled, store)
+    if result is None:
+        return
+    for info in result['moveInfos'][:KATAGO_PONDER_REPLIES]:
+        if cancelled.is_set():
+            return
+        if info.get('x') is not None and info.get('y') is not None:
+            ponder_position(dict(position, moves=position['moves'] + [(info['x'], info['y'])]), session, cancelled, store)
+
+def ponder_position(data, session, cancelled, store):
+    """预读一个局面：只用空闲的引擎，每个中间结果之间检查是否被取消（GTP后端还检查
+    引擎池是否有请求排队）；达到maxVisits的完整搜索才保存（规范方向），
+    返回请求方向的结果，没有结果返回None"""
+    cache_key, symmetry = position_key(data)
+    if cache_key is None or cancelled.is_set():
+        return None
+    cached = analysis_cache.peek(cache_key)
+    if cached is not None:
+        return symmetry.restore(cached)
+    
+    engine = None
+    if analysis_engine is not None:
+        if not analysis_engine.is_alive():
+            return None
+        stream = analysis_engine.analyze_stream(data, interval=KATAGO_STREAM_INTERVAL, max_duration=KATAGO_STREAM_MAX_DURATION,
+                                                priority=query_priority('batch'))
+    else:
+        engine = katago_pool.try_checkout(session)
+        if engine is None:
             return None
+        stream = engine.analyze_stream(data, interval=KATAGO_STREAM_INTERVAL, max_duration=KATAGO_STREAM_MAX_DURATION)
     
-    def _generate_basic_capture_problem(self, board_size):
-        """生成基础提子死活题"""
-        # 在中央区域放置一个被包围但还有一口气的白棋组
-        center = board_size // 2
-        
-        # 初始化棋盘状态跟踪
-        board = [[0 for _ in range(board_size)] for _ in range(board_size)]
-        
-        # 创建一个简单的包围局面
-        moves = [
-            ('black', center-1, center-1),
-            ('black', center, center-1),
-            ('black', center+1, center-1),
-            ('black', center-1, center),
-            ('white', center, center),  # 被包围的白棋
-            ('black', center+1, center),
-            ('black', center-1, center+1),
-            ('black', center+1, center+1),
-        ]
-        
-        # 执行这些着法并更新棋盘状态
-        for color, x, y in moves:
-            move_coord = self.coord_to_gtp(x, y, board_size)
-            response = self.send_command(f"play {color} {move_coord}")
-            print(f"执行着法: {color} {move_coord}, 响应: {response}")
-            
-            # 更新内部棋盘状态
-            color_value = 1 if color == 'black' else -1
-            board[y][x] = color_value
-        
-        # 解法是在(center, center+1)提取白棋
-        solution_x, solution_y = center, center + 1
-        solution_coord = self.coord_to_gtp(solution_x, solution_y, board_size)
-        
-        return {
-            'id': f'katago_basic_{board_size}_{center}',
-            'title': 'KataGo生成 - 基础提子',
-            'difficulty': 1,
-            'description': '黑先，提取中央的白棋',
-            'boardSize': board_size,
-            'initialPosition': board,
-            'solutions': [
-                {
-                    'x': solution_x,
-                    'y': solution_y,
-                    'reason': f'在{solution_coord}处提取白棋'
-                }
-            ],
-            'hints': [
-                '数一下白棋有几口气',
-                '找到白棋最后的气',
-                f'点击{solution_coord}处'
-            ],
-            'generated': True,
-            'generator': 'KataGo'
+    last = None
+    try:
+        for last in stream:
+            if cancelled.is_set() or (engine is not None and katago_pool.has_waiters()):
+                return None
+    finally:
+        stream.close()
+        if engine is not None:
+            katago_pool.checkin(engine)
+    
+    # 超过 KATAGO_STREAM_MAX_DURATION 停止的搜索没有达到maxVisits，只返回不保存
+    if last is not None and not cancelled.is_set() and result_visits(last) >= data.get('maxVisits', 400):
+        store(cache_key, symmetry.apply(last))
+    return last
+
+def review_positions(base, moves, turns, client=None):
+    """分析同一盘棋的多个局面，返回 {手数: 分析结果}
+    
+    JSON分析引擎：每16手一条查询（analyzeTurns），KataGo并发计算，
+    每条查询单独计算超时，超时只丢掉这一段中还没有算完的局面；
+    GTP后端：按手数切成连续的几段分给引擎池中的引擎，每个引擎顺序向前分析，
+    增量同步只需要补下相邻局面之间的一两手。复盘以batch优先级排队，
+    每个局面之间有对弈请求排队时先让出引擎。
+    """
+    results = {}
+    pending = []
+    for turn in turns:
+        cache_key, symmetry = position_key(dict(base, moves=moves[:turn]))
+        cached = analysis_cache.get(cache_key)
+        # genmove的结果评估的是AI落子之后的局面，不能用来比较胜率
+        if cached is not None and cached.get('source') != 'genmove':
+            results[turn] = symmetry.restore(cached)
+        else:
+            pending.append(turn)
+    route_log.debug("整盘复盘", positions=len(turns), cached=len(turns) - len(pending))
+    if not pending:
+        return results
+    ponderer.cancel(base.get('session') or client)
+    
+    if use_fallback():
+        for turn in pending:
+            results[turn] = fallback_engine.analyze_position(dict(base, moves=moves[:turn]))
+        return results
+    
+    if analysis_engine is not None:
+        if not analysis_engine.is_alive() and not analysis_engine.start():
+            raise EngineUnavailable("KataGo分析引擎启动失败")
+        for turn, result in analysis_engine.analyze_positions(dict(base, moves=moves), pending).items():
+            cache_position(dict(base, moves=moves[:turn]), result)
+            results[turn] = result
+        return results
+    
+    def analyze_chunk(chunk):
+        chunk_results = {}
+        engine = katago_pool.checkout(priority='batch', client=client)
+        try:
+            for turn in chunk:
+                # yield_engine可能先归还再重新排队，排队失败时不能重复归还
+                previous, engine = engine, None
+                engine = katago_pool.yield_engine(previous, 'batch', client)
+                data = dict(base, moves=moves[:turn])
+                visits = katago_pool.visit_budget(data.get('maxVisits', 400), 'batch')
+                data['maxVisits'] = visits
+                # 只评估局面、不落子（genmove会把引擎的应手下在棋盘上）：kata-analyze
+                # 搜索到maxVisits为止，最多 KATAGO_STREAM_MAX_DURATION 秒，超时的结果不缓存
+                data.setdefault('maxTime', KATAGO_STREAM_MAX_DURATION)
+                result = engine.analyze_anytime(data)
+                cache_position(data, result)
+                chunk_results[turn] = result
+        finally:
+            if engine is not None:
+                katago_pool.checkin(engine)
+        return chunk_results
+    
+    workers = min(katago_pool.size, len(pending))
+    chunk_size = -(-len(pending) // workers)
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        for chunk_results in executor.map(analyze_chunk, chunks):
+            results.update(chunk_results)
+    return results
+
+def review_game(data, client=None):
+    """整盘复盘：逐个局面的胜率/目差曲线和恶手列表（胜率均为黑方视角）
+    
+    exportSgf 为真时同时返回带胜率注释、恶手标记的SGF棋谱。
+    """
+    base = {key: value for key, value in data.items() if key != 'moves'}
+    moves = request_moves(data)
+    
+    stride = max(1, int(data.get('stride', 1)))
+    start = max(0, int(data.get('startMove', 0)))
+    turns = list(range(start, len(moves) + 1, stride))
+    if turns and turns[-1] != len(moves):
+        turns.append(len(moves))
+    
+    results = review_positions(base, moves, turns, client)
+    board_size = base.get('boardSize', 19)
+    threshold = float(data.get('blunderThreshold', KATAGO_BLUNDER_THRESHOLD))
+    
+    positions = []
+    for turn in turns:
+        result = results.get(turn)
+        if not result or not result.get('moveInfos'):
+            positions.append({'moveNumber': turn, 'winrate': None, 'scoreLead': None, 'bestMove': None})
+            continue
+        best = result['moveInfos'][0]
+        positions.append({
+            'moveNumber': turn,
+            'winrate': best.get('winrate', 0.5),
+            'scoreLead': best.get('scoreLead', 0.0),
+            'visits': best.get('visits', 0),
+            'bestMove': best.get('move')
+        })
+    
+    # 相邻两个局面只差一手时，比较这一手前后下棋一方的胜率
+    blunders = []
+    for before, after in zip(positions, positions[1:]):
+        if after['moveNumber'] - before['moveNumber'] != 1 or before['winrate'] is None or after['winrate'] is None:
+            continue
+        turn = before['moveNumber']
+        sign = 1 if turn % 2 == 0 else -1  # 黑棋下的这一手为正
+        winrate_loss = sign * (before['winrate'] - after['winrate'])
+        if winrate_loss >= threshold:
+            x, y = moves[turn]
+            blunders.append({
+                'moveNumber': turn + 1,
+                'color': 'B' if sign == 1 else 'W',
+                'move': coord_to_gtp(x, y, board_size),
+                'x': x,
+                'y': y,
+                'winrateLoss': round(winrate_loss, 4),
+                'scoreLoss': round(sign * (before['scoreLead'] - after['scoreLead']), 1),
+                'bestMove': before['bestMove']
+            })
+    
+    review = {'moveCount': len(moves), 'positions': positions, 'blunders': blunders}
+    if data.get('stoppedAtPass') is not None:
+        review['stoppedAtPass'] = data['stoppedAtPass']
+    if data.get('exportSgf'):
+        review['sgf'] = review_sgf(base, moves, positions, blunders)
+    return review
+
+def review_sgf(base, moves, positions, blunders):
+    """复盘结果导出为SGF：分析过的局面注释黑方胜率、目差和下一手推荐，恶手加BM标记"""
+    annotations = {}
+    for position in positions:
+        if position['winrate'] is None:
+            continue
+        annotations[position['moveNumber']] = {
+            'C': f"黑方胜率 {position['winrate'] * 100:.1f}%，黑方目差 {position['scoreLead']:+.1f}，下一手推荐 {position['bestMove']}"
         }
+    for blunder in blunders:
+        annotation = annotations.setdefault(blunder['moveNumber'], {})
+        annotation['BM'] = '1'
+        comment = f"恶手：胜率损失 {blunder['winrateLoss'] * 100:.1f}%，本手推荐 {blunder['bestMove']}"
+        annotation['C'] = comment + ('\n' + annotation['C'] if 'C' in annotation else '')
+    root = game_tree(base.get('boardSize', 19), moves, komi=base.get('komi'),
+                     properties={'GC': 'KataGo复盘'}, annotations=annotations)
+    return dumps_tree(root)
+
+def position_detail(result):
+    """把分析结果整理为局势分析格式（rootInfo取自最佳着法）"""
+    move_info = result['moveInfos'][0]
+    return {
+        'rootInfo': {
+            'winrate': move_info.get('winrate', 0.5),
+            'scoreLead': move_info.get('scoreLead', 0),
+            'visits': move_info.get('visits', 0)
+        },
+        'moveInfos': result['moveInfos'],
+        'analysis_type': 'position_evaluation'
+    }
+
+def analysis_events(data, client=None):
+    """流式分析事件序列 (事件名, 数据)：若干 analysis 中间结果，最后一个 done 或 error
     
-    def _generate_eye_making_problem(self, board_size):
-        """生成做眼死活题"""
-        # 在角落创建一个需要做眼的局面
-        board = [[0 for _ in range(board_size)] for _ in range(board_size)]
-        
-        corner_moves = [
-            ('white', 0, 0),
-            ('white', 1, 0),
-            ('white', 0, 1),
-            ('black', 2, 0),
-            ('black', 0, 2),
-            ('black', 1, 1),
-        ]
-        
-        for color, x, y in corner_moves:
-            move_coord = self.coord_to_gtp(x, y, board_size)
-            response = self.send_command(f"play {color} {move_coord}")
-            print(f"执行着法: {color} {move_coord}, 响应: {response}")
-            
-            # 更新内部棋盘状态
-            color_value = 1 if color == 'black' else -1
-            board[y][x] = color_value
-        
-        # 解法是白棋在(2,1)或(1,2)做眼
-        solution_x, solution_y = 2, 1
+    Flask的SSE路由和ASGI模式共用这个生成器。
+    """
+    cached = book_analysis(data)
+    if cached is None:
+        cache_key, symmetry = position_key(data)
+        cached = symmetry.restore(ponderer.get(data.get('session') or client, cache_key) or analysis_cache.get(cache_key))
+    if cached is not None:
+        yield 'done', position_detail(cached)
+        return
+    ponderer.cancel(data.get('session') or client)
+    
+    interval = float(data.get('reportInterval', KATAGO_STREAM_INTERVAL))
+    max_duration = float(data.get('maxDuration', KATAGO_STREAM_MAX_DURATION))
+    last = None
+    try:
+        fallback = use_fallback()
+        if not fallback and analysis_engine is not None and not analysis_engine.is_alive() and not analysis_engine.start():
+            raise EngineUnavailable("KataGo分析引擎启动失败")
         
-        return {
-            'id': f'katago_eye_{board_size}',
-            'title': 'KataGo生成 - 角落做眼',
-            'difficulty': 2,
-            'description': '白先，在角落做活',
-            'boardSize': board_size,
-            'initialPosition': board,
-            'solutions': [
-                {
-                    'x': solution_x,
-                    'y': solution_y,
-                    'reason': '在此处做眼活棋'
-                }
-            ],
-            'hints': [
-                '角落的白棋需要做眼',
-                '找到能做出真眼的位置',
-                '防止被黑棋破坏眼形'
-            ],
-            'generated': True,
-            'generator': 'KataGo'
-        }
+        # 流式分析期间独占引擎，生成器关闭（客户端断开）时归还
+        if fallback:
+            engine_context = nullcontext(fallback_engine)
+        elif analysis_engine is not None:
+            engine_context = nullcontext(analysis_engine)
+        else:
+            engine_context = katago_pool.engine(priority='interactive', client=client, session=data.get('session'))
+        with engine_context as engine:
+            for result in engine.analyze_stream(data, interval=interval, max_duration=max_duration):
+                last = result
+                yield 'analysis', position_detail(result)
+    except EngineNotReady as e:
+        route_log.warning("引擎池繁忙", error=e)
+        yield 'error', {'error': 'KataGo引擎正在启动，请稍后重试', 'retryAfter': e.retry_after}
+        return
+    except EnginePoolExhausted as e:
+        route_log.warning("引擎池繁忙", error=e)
+        yield 'error', {'error': '所有KataGo引擎繁忙，请稍后重试'}
+        return
+    except EngineUnavailable:
+        yield 'error', {'error': 'KataGo引擎不可用，请检查安装和配置'}
+        return
     
-    def _generate_complex_life_death_problem(self, board_size):
-        """生成复杂死活题"""
-        # 生成一个更复杂的局面，使用KataGo分析
-        # 这里先简化为一个中级难度的问题
-        return self._generate_eye_making_problem(board_size)
+    if last is None:
+        yield 'error', {'error': 'KataGo局势分析失败，请检查棋局状态'}
+    else:
+        if not fallback:
+            cache_position(data, last)
+        yield 'done', position_detail(last)
+
+def estimate_positions(positions, packed=False):
+    """批量估计局面归属：同样大小的棋盘叠成一个批次一次计算
     
+    每个局面可以直接给出 board（board[y][x]），或者给出 moves 由服务器摆出（含提子）。
+    packed 为真时归属度以int8 base64返回（值/127）。
+    """
+    boards = []
+    for data in positions:
+        board_size = data.get('boardSize', 19)
+        if data.get('board') is not None:
+            boards.append(data['board'])
+        else:
+            boards.append(Board.from_moves(board_size, request_moves(data)).to_2d())
     
-    def stop(self):
-        """停止KataGo进程"""
-        if self.process:
-            self.process.terminate()
-            self.process = None
-            self.is_initialized = False
+    results = [None] * len(positions)
+    by_size = {}
+    for i, board in enumerate(boards):
+        by_size.setdefault(len(board), []).append(i)
+    
+    for indices in by_size.values():
+        ownership = estimate_ownership([boards[i] for i in indices])
+        scores = estimate_score(ownership, 0.0)
+        for i, board_ownership, area in zip(indices, ownership, scores):
+            black_territory, white_territory = territory_counts(board_ownership)
+            results[i] = {
+                'ownership': pack_ownership(board_ownership) if packed else board_ownership.astype(float).round(3).tolist(),
+                'scoreLead': round(float(area) - float(positions[i].get('komi', 6.5)), 1),
+                'blackTerritory': black_territory,
+                'whiteTerritory': white_territory
+            }
+    return results
 
-# 全局KataGo引擎实例
-katago_engine = KataGoEngine()
+def engine_busy_response(e):
+    """引擎池背压：所有引擎繁忙或正在重启时返回503，提示客户端稍后重试"""
+    route_log.warning("引擎池繁忙", error=e)
+    if isinstance(e, EngineNotReady):
+        response = jsonify({'error': 'KataGo引擎正在启动，请稍后重试'})
+        retry_after = e.retry_after
+    else:
+        response = jsonify({'error': '所有KataGo引擎繁忙，请稍后重试'})
+        retry_after = 1
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
 
 # ==================== 网页服务路由 ====================
 
@@ -1025,7 +1791,7 @@ def serve_static(filename):
             # 尝试从根目录提供
             return send_file(filename)
     except Exception as e:
-        print(f"无法提供文件 {filename}: {e}")
+        route_log.warning("无法提供文件", filename=filename, error=e)
         return f"文件未找到: {filename}", 404
 
 # ==================== KataGo API路由 ====================
@@ -1033,105 +1799,277 @@ def serve_static(filename):
 @app.route('/api/katago/status', methods=['GET'])
 def check_katago_status():
     """检查KataGo状态"""
-    print("检查KataGo状态...")
+    route_log.debug("检查KataGo状态")
+    if use_fallback():
+        return jsonify({
+            'status': 'ok',
+            'engine': 'MCTS',
+            'backend': 'fallback',
+            'fallback': fallback_engine.metrics()
+        })
+    if analysis_engine is not None:
+        return jsonify({
+            'status': 'ok' if analysis_engine.is_alive() else 'unavailable',
+            'engine': 'KataGo',
+            'backend': 'analysis',
+            'analysis': analysis_engine.metrics()
+        })
     return jsonify({
-        'status': 'ok' if katago_engine.is_initialized else 'unavailable',
-        'engine': 'KataGo'
+        'status': 'ok' if katago_pool.is_available else 'unavailable',
+        'engine': 'KataGo',
+        'backend': 'gtp',
+        'pool': katago_pool.metrics(),
+        'gtpCommands': sum(engine.command_count for engine in katago_pool.engines)
     })
 
+@app.route('/api/katago/pool', methods=['GET'])
+def katago_pool_metrics():
+    """引擎池运行指标"""
+    return jsonify(katago_pool.metrics())
+
+@app.route('/api/katago/cache', methods=['GET', 'DELETE'])
+def katago_cache():
+    """分析缓存、请求合并、开局库和后台预读指标；DELETE清空缓存"""
+    if request.method == 'DELETE':
+        analysis_cache.clear()
+        route_log.info("分析缓存已清空")
+    return jsonify(dict(analysis_cache.metrics(), coalescing=analysis_flight.metrics(),
+                        openingBook=opening_book.metrics(), ponder=ponderer.metrics()))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus文本格式的运行指标"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/log-level', methods=['GET', 'PUT'])
+def log_level():
+    """查看或调整日志级别：PUT {"module": "gtp", "level": "DEBUG"}，module为空表示默认级别"""
+    if request.method == 'PUT':
+        data = request.json or {}
+        try:
+            set_log_level(data.get('module', ''), data.get('level', 'INFO'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        route_log.info("日志级别已调整", module=data.get('module', ''), level=data.get('level', 'INFO'))
+    return jsonify(log_levels())
+
 @app.route('/api/katago/analyze', methods=['POST'])
 def analyze_katago_position():
     """分析棋局位置"""
     try:
-        data = request.json
-        print(f"收到KataGo分析请求，原始数据: {data}")
+        data = read_request()
+        route_log.debug("收到KataGo分析请求", moves=len(data.get('moves') or []), boardSize=data.get('boardSize'))
         
-        if not katago_engine.is_initialized:
-            print("KataGo未初始化，尝试启动...")
-            katago_engine.start()
-        
-        if not katago_engine.is_initialized:
-            print("KataGo引擎启动失败")
-            return jsonify({'error': 'KataGo引擎不可用，请检查安装和配置'}), 500
-        
-        print("开始调用KataGo分析...")
-        result = katago_engine.analyze_position(data)
+        client = request_client()
+        result = run_analysis(data, 'interactive', client)
         
         if result:
-            print("KataGo分析成功，结果:", result)
+            route_log.debug("KataGo分析成功", result=result)
+            ponder_after(data, result, client)
             return jsonify(result)
         else:
-            print("KataGo分析失败")
+            route_log.warning("KataGo分析失败")
             return jsonify({'error': 'KataGo分析失败，请检查引擎状态'}), 500
             
+    except WireError as e:
+        return wire_error_response(e)
+    except EnginePoolExhausted as e:
+        return engine_busy_response(e)
+    except EngineUnavailable:
+        route_log.error("KataGo引擎启动失败")
+        return jsonify({'error': 'KataGo引擎不可用，请检查安装和配置'}), 500
     except Exception as e:
-        print(f"分析请求出错: {e}")
-        import traceback
-        traceback.print_exc()
+        route_log.exception("分析请求出错")
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
 @app.route('/api/katago/analyze-position', methods=['POST'])
 def analyze_position_detailed():
     """详细局势分析，返回胜率和目数评估"""
     try:
-        data = request.json
-        print(f"收到KataGo局势分析请求: {data}")
-        
-        if not katago_engine.is_initialized:
-            print("KataGo未初始化，尝试启动...")
-            katago_engine.start()
-        
-        if not katago_engine.is_initialized:
-            print("KataGo引擎启动失败")
-            return jsonify({'error': 'KataGo引擎不可用，请检查安装和配置'}), 500
+        data = read_request()
+        route_log.debug("收到KataGo局势分析请求", moves=len(data.get('moves') or []), boardSize=data.get('boardSize'))
         
         # 使用现有的分析方法进行局势分析
-        print("开始KataGo局势分析...")
-        result = katago_engine.analyze_position(data)
-        print("原始KataGo分析结果:", result)
+        result = run_analysis(data, 'interactive', request_client())
         
         if result and 'moveInfos' in result and len(result['moveInfos']) > 0:
-            # 从第一个着法信息中提取胜率和分数
-            move_info = result['moveInfos'][0]
-            print("提取的move_info:", move_info)
-            
-            # 构造详细的分析结果
-            detailed_result = {
-                'rootInfo': {
-                    'winrate': move_info.get('winrate', 0.5),
-                    'scoreLead': move_info.get('scoreLead', 0),
-                    'visits': move_info.get('visits', 0)
-                },
-                'moveInfos': result['moveInfos'],
-                'analysis_type': 'position_evaluation'
-            }
+            # 从第一个着法信息中提取胜率和分数，构造详细的分析结果
+            detailed_result = position_detail(result)
             
-            print("KataGo局势分析成功，详细结果:", detailed_result)
+            route_log.debug("KataGo局势分析成功", result=detailed_result)
             return jsonify(detailed_result)
         else:
-            print("KataGo局势分析失败或无有效结果")
+            route_log.warning("KataGo局势分析失败或无有效结果", result=result)
             return jsonify({'error': 'KataGo局势分析失败，请检查棋局状态'}), 500
             
+    except WireError as e:
+        return wire_error_response(e)
+    except EnginePoolExhausted as e:
+        return engine_busy_response(e)
+    except EngineUnavailable:
+        route_log.error("KataGo引擎启动失败")
+        return jsonify({'error': 'KataGo引擎不可用，请检查安装和配置'}), 500
     except Exception as e:
-        print(f"局势分析请求出错: {e}")
-        import traceback
-        traceback.print_exc()
+        route_log.exception("局势分析请求出错")
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
+@app.route('/api/katago/analyze-game', methods=['POST'])
+def analyze_game():
+    """整盘复盘：一次请求分析整盘棋（sgf或moves，可用stride隔手分析），返回胜率曲线和恶手，可导出带注释的SGF"""
+    try:
+        data = read_request(until_pass=True)
+        route_log.info("收到整盘复盘请求", moves=len(data.get('moves') or []))
+        
+        start_time = time.time()
+        review = review_game(data, request_client())
+        review['elapsedMs'] = round((time.time() - start_time) * 1000)
+        route_log.info("整盘复盘完成", positions=len(review['positions']), blunders=len(review['blunders']), elapsedMs=review['elapsedMs'])
+        return jsonify(review)
+        
+    except WireError as e:
+        return wire_error_response(e)
+    except EnginePoolExhausted as e:
+        return engine_busy_response(e)
+    except EngineUnavailable:
+        route_log.error("KataGo引擎启动失败")
+        return jsonify({'error': 'KataGo引擎不可用，请检查安装和配置'}), 500
+    except Exception as e:
+        route_log.exception("整盘复盘出错")
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
+@app.route('/api/katago/analyze-stream', methods=['POST'])
+def analyze_katago_stream():
+    """流式局势分析（Server-Sent Events），搜索过程中持续推送胜率和候选着法"""
+    try:
+        data = read_request()
+    except WireError as e:
+        return wire_error_response(e)
+    route_log.debug("收到KataGo流式分析请求", moves=len(data.get('moves') or []), boardSize=data.get('boardSize'))
+    
+    events = (format_sse(event, payload) for event, payload in analysis_events(data, request_client()))
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def open_analysis_stream(data, client=None):
+    """ASGI模式的流式分析：与Flask路由一样解码请求，返回 (事件生成器, 附加响应头)"""
+    try:
+        data = decode_analysis_request(data)
+    except WireError as e:
+        raise StreamRequestError(*wire_error_payload(e))
+    headers = {} if data.get('session') is None else {'X-Session-Moves': len(data['moves'])}
+    return analysis_events(data, client), headers
+
+@app.route('/api/ownership', methods=['POST'])
+def estimate_ownership_api():
+    """势力/归属估计（不使用引擎）：返回每个点的归属度，1为黑方、-1为白方
+    
+    请求体为单个局面，或 {"positions": [...]} 批量计算。
+    """
+    if estimate_ownership is None:
+        return jsonify({'error': '势力估计需要安装numpy: pip install numpy'}), 501
+    try:
+        data = request.json or {}
+        packed = packed_response(data)
+        if 'positions' in data:
+            positions = [decode_request(position, move_sessions) for position in data['positions']]
+            return jsonify({'results': estimate_positions(positions, packed)})
+        return jsonify(estimate_positions([read_request()], packed)[0])
+    except IllegalMove as e:
+        return jsonify({'error': f'着法非法: {e}'}), 400
+    except WireError as e:
+        return wire_error_response(e)
+    except Exception as e:
+        route_log.exception("势力估计出错")
+        return jsonify({'error': f'服务器错误: {str(e)}'}), 500
+
+def problem_filters(args):
+    """题库查询参数：boardSize、difficulty（名称或数字）、tag"""
+    board_size = args.get('boardSize', type=int)
+    return {
+        'board_size': board_size,
+        'difficulty': difficulty_value(args.get('difficulty')),
+        'tag': args.get('tag') or None
+    }
+
+def problem_payload(problem, packed):
+    """encoding=packed 时初始局面以int8 base64返回"""
+    if packed and problem is not None:
+        problem = dict(problem, initialPosition=pack_board(problem['initialPosition']))
+    return problem
+
+def problem_library_missing():
+    return jsonify({'error': '死活题库不存在，请先运行 tools/build-tsumego-library.py'}), 404
+
+@app.route('/api/problems', methods=['GET'])
+def list_problems():
+    """分页读取死活题库：cursor 为上一页返回的 nextCursor"""
+    if not problem_library.exists():
+        return problem_library_missing()
+    try:
+        filters = problem_filters(request.args)
+        limit = max(1, min(100, request.args.get('limit', 20, type=int)))
+        cursor = request.args.get('cursor', 0, type=int)
+        problems, next_cursor = problem_library.page(cursor=cursor, limit=limit, **filters)
+        packed = packed_response(request.args)
+        return jsonify({
+            'problems': [problem_payload(problem, packed) for problem in problems],
+            'nextCursor': next_cursor,
+            'total': problem_library.count(**filters)
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/problems/random', methods=['GET'])
+def random_problem():
+    """从死活题库随机取一道题"""
+    if not problem_library.exists():
+        return problem_library_missing()
+    try:
+        problem = problem_library.random(**problem_filters(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if problem is None:
+        return jsonify({'error': '没有符合条件的死活题'}), 404
+    return jsonify(problem_payload(problem, packed_response(request.args)))
+
+@app.route('/api/problems/<problem_id>', methods=['GET'])
+def get_problem(problem_id):
+    """按题目id读取"""
+    if not problem_library.exists():
+        return problem_library_missing()
+    problem = problem_library.get(problem_id)
+    if problem is None:
+        return jsonify({'error': '题目不存在'}), 404
+    return jsonify(problem_payload(problem, packed_response(request.args)))
+
 @app.route('/api/katago/start', methods=['POST'])
 def start_katago_engine():
     """启动KataGo引擎"""
-    print("手动启动KataGo引擎...")
-    katago_engine.start()
+    route_log.info("手动启动KataGo引擎")
+    if analysis_engine is not None:
+        started = analysis_engine.start()
+        return jsonify({'status': 'started' if started else 'failed'})
+    katago_pool.start()
+    if katago_pool.is_available:
+        status = 'started'
+    else:
+        status = 'starting' if katago_pool.supervised else 'failed'
     return jsonify({
-        'status': 'started' if katago_engine.is_initialized else 'failed'
+        'status': status,
+        'pool': katago_pool.metrics()
     })
 
 @app.route('/api/katago/stop', methods=['POST'])
 def stop_katago_engine():
     """停止KataGo引擎"""
-    print("停止KataGo引擎...")
-    katago_engine.stop()
+    route_log.info("停止KataGo引擎")
+    ponderer.cancel()
+    if analysis_engine is not None:
+        analysis_engine.stop()
+    katago_pool.stop()
     return jsonify({'status': 'stopped'})
 
 @app.route('/api/katago/generate-tsumego', methods=['POST'])
@@ -1139,51 +2077,71 @@ def generate_tsumego():
     """生成死活题"""
     try:
         data = request.json
-        print(f"收到生成死活题请求: {data}")
+        route_log.debug("收到生成死活题请求", request=data)
         
         difficulty = data.get('difficulty', 'easy')  # easy, medium, hard
         board_size = data.get('boardSize', 9)  # 死活题通常用较小棋盘
         
-        if not katago_engine.is_initialized:
-            katago_engine.start()
-        
-        if not katago_engine.is_initialized:
-            return jsonify({'error': 'KataGo引擎不可用'}), 500
-        
-        # 生成死活题
-        problem = katago_engine.generate_life_death_problem(difficulty, board_size)
+        # 用证明数搜索生成并验证死活题，不占用KataGo引擎
+        start = time.time()
+        problem = find_problem(board_size, difficulty, node_budget=TSUMEGO_NODE_BUDGET, attempts=TSUMEGO_ATTEMPTS,
+                               time_limit=TSUMEGO_TIME_LIMIT)
         
         if problem:
-            print("死活题生成成功:", problem)
-            return jsonify(problem)
+            route_log.info("死活题生成成功", id=problem['id'], level=problem['rating']['level'],
+                           nodes=problem['rating']['nodes'], seconds=round(time.time() - start, 2))
+            if problem['rating']['level'] != problem['rating']['requested']:
+                route_log.warning("没有找到要求难度的死活题，返回最接近的", requested=difficulty, level=problem['rating']['level'])
+            return jsonify(problem_payload(problem, packed_response(data)))
         else:
             return jsonify({'error': '死活题生成失败'}), 500
             
     except Exception as e:
-        print(f"生成死活题出错: {e}")
-        import traceback
-        traceback.print_exc()
+        route_log.exception("生成死活题出错")
         return jsonify({'error': f'服务器错误: {str(e)}'}), 500
 
 # ==================== 服务器启动 ====================
 
 if __name__ == '__main__':
+    port = SERVER_PORT
+    if '--port' in sys.argv:
+        port = int(sys.argv[sys.argv.index('--port') + 1])
+    
     print("🚀 启动统一服务器...")
-    print("📁 网页服务: http://localhost:8000")
-    print("🤖 KataGo API: http://localhost:8000/api/katago/")
+    print(f"📁 网页服务: http://localhost:{port}")
+    print(f"🤖 KataGo API: http://localhost:{port}/api/katago/")
     print("🎯 无CORS问题 - 一切都在同一端口！")
     
     # 自动启动KataGo引擎
     if os.path.exists(KATAGO_PATH):
-        print("🔥 自动启动KataGo引擎...")
-        katago_engine.start()
+        if analysis_engine is not None:
+            print("🔥 自动启动KataGo分析引擎...")
+            analysis_engine.start()
+        else:
+            print(f"🔥 后台启动KataGo引擎池（{KATAGO_POOL_SIZE}个引擎），预热完成前分析请求返回503...")
+            katago_pool.supervise(KATAGO_PING_INTERVAL)
     else:
-        print("⚠️  KataGo路径不存在，KataGo功能将不可用")
-        print(f"请检查路径: {KATAGO_PATH}")
+        print(f"⚠️  KataGo路径不存在: {KATAGO_PATH}")
+        if fallback_engine is not None:
+            print(f"🌲 使用内置MCTS引擎（{fallback_engine.workers}个工作进程，每步最多{KATAGO_FALLBACK_TIME:g}秒）")
+            fallback_engine.start()
+        else:
+            print("KataGo功能将不可用")
     
-    # 启动Flask服务器
+    # 启动服务器：--asgi 使用uvicorn（需要 pip install uvicorn asgiref），否则使用Flask开发服务器
     try:
-        app.run(host='localhost', port=8000, debug=True, use_reloader=False)
+        if '--asgi' in sys.argv:
+            import uvicorn
+            print("⚡ ASGI模式: 流式分析由异步路由直接推送")
+            asgi_app = create_asgi_app(app, {'/api/katago/analyze-stream': open_analysis_stream})
+            uvicorn.run(asgi_app, host='localhost', port=port)
+        else:
+            app.run(host='localhost', port=port, debug=True, use_reloader=False, threaded=True)
     except KeyboardInterrupt:
         print("🛑 服务器停止")
-        katago_engine.stop()
\ No newline at end of file
+        ponderer.cancel()
+        if analysis_engine is not None:
+            analysis_engine.stop()
+        if fallback_engine is not None:
+            fallback_engine.stop()
+        katago_pool.stop()
\ No newline at end of file